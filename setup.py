@@ -40,6 +40,7 @@ setup(
         'djangorestframework==2.4.3',
         'django-filter>=0.8',
         'django-nose>=1.3',
+        'numpy>=1.8,<1.17',
     ],
     entry_points={
         'django.pluggable_app': [
@@ -20,7 +20,9 @@ import logging
 from collections import defaultdict
 
 import django_filters
+from django.conf import settings
 from django.conf.urls.defaults import url
+from django.db import connection, transaction
 from rest_framework import filters
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.serializers import ModelSerializer
@@ -30,13 +32,18 @@ from tastypie.resources import Resource
 from tastypie.exceptions import ImmediateHttpResponse
 
 from ralph_scrooge.models import (
+    DailyPricingObject,
     DailyUsage,
+    PRICING_OBJECT_TYPES,
     PricingObject,
     PricingService,
     ServiceEnvironment,
     SyncStatus,
     UsageType,
 )
+from ralph_scrooge.utils.common import chunks
+from ralph_scrooge.utils.costs_changes import register_costs_input_change
+from ralph_scrooge.utils.costs_memo import clear_costs_memo
 
 
 logger = logging.getLogger(__name__)
@@ -296,17 +303,11 @@ class PricingServiceUsageResource(Resource):
         return bundle
 
     @classmethod
-    def save_usages(cls, pricing_service_usages):
+    def check_pricing_service(cls, pricing_service_usages):
         """
-        Save usages of service resources per service
-
-        If any error occur during parsing service usages, no usage is saved
-        and Bad Request response is returned.
+        Check if pricing service of usages exists. Bad Request response is
+        raised otherwise.
         """
-        usage_types = {}
-        daily_usages = []
-
-        # check if service exists
         ps_params = {}
         if pricing_service_usages.pricing_service_id:
             ps_params['id'] = pricing_service_usages.pricing_service_id
@@ -322,6 +323,21 @@ class PricingServiceUsageResource(Resource):
                 )
             ))
 
+    @classmethod
+    @transaction.commit_on_success
+    def save_usages(cls, pricing_service_usages):
+        """
+        Save usages of service resources per service
+
+        If any error occur during parsing service usages, no usage is saved
+        and Bad Request response is returned.
+
+        Pricing objects, services environments, usage types and daily pricing
+        objects are resolved using few (batched) `__in` queries, so number of
+        queries doesn't depend on number of usages.
+        """
+        # check if service exists
+        cls.check_pricing_service(pricing_service_usages)
         # check if date is properly set
         assert isinstance(pricing_service_usages.date, datetime.date)
         # check if overwrite is properly set
@@ -330,102 +346,322 @@ class PricingServiceUsageResource(Resource):
             'delete_all_previous',
             'values_only',
         )
-        usages_daily_pricing_objects = defaultdict(list)
-        for usages in pricing_service_usages.usages:
-            try:
-                pricing_object = None
-                if usages.pricing_object:
-                    pricing_object = PricingObject.objects.get(
-                        name=usages.pricing_object,
-                    )
-                elif usages.service_id and usages.environment:
-                    service_environment = ServiceEnvironment.objects.get(
-                        service__id=usages.service_id,
-                        environment__name=usages.environment,
-                    )
-                    pricing_object = service_environment.dummy_pricing_object
-                elif usages.service and usages.environment:
-                    service_environment = ServiceEnvironment.objects.get(
-                        service__name=usages.service,
-                        environment__name=usages.environment,
-                    )
-                    pricing_object = service_environment.dummy_pricing_object
-                else:
-                    raise ImmediateHttpResponse(response=http.HttpBadRequest((
-                        "Pricing Object (Host, IP etc) or Service and "
-                        "Environment has to be provided"
-                    )))
-
-                for usage in usages.usages:
-                    try:
-                        usage_type = usage_types.get(
-                            usage.symbol,
-                            UsageType.objects.get(symbol=usage.symbol)
-                        )
-                        daily_pricing_object = (
-                            pricing_object.get_daily_pricing_object(
-                                pricing_service_usages.date
-                            )
-                        )
-                        daily_usage = DailyUsage(
-                            date=pricing_service_usages.date,
-                            type=usage_type,
-                            value=usage.value,
-                            daily_pricing_object=daily_pricing_object,
-                            service_environment=(
-                                daily_pricing_object.service_environment
-                            ),
-                        )
-                        daily_usages.append(daily_usage)
-                        usages_daily_pricing_objects[usage_type].append(
-                            daily_pricing_object
-                        )
-                    except UsageType.DoesNotExist:
-                        raise ImmediateHttpResponse(
-                            response=http.HttpBadRequest(
-                                "Invalid usage type symbol: {}".format(
-                                    usage.symbol,
-                                )
-                            )
-                        )
-            except PricingObject.DoesNotExist:
-                raise ImmediateHttpResponse(response=http.HttpBadRequest(
-                    "Invalid pricing object name or id ({})".format(
-                        usages.pricing_object
-                    )
-                ))
-            except ServiceEnvironment.DoesNotExist:
-                raise ImmediateHttpResponse(response=http.HttpBadRequest(
-                    "Invalid service or environment name ({} / {})".format(
-                        usages.service,
-                        usages.environment,
-                    )
-                ))
+        usage_types = cls._get_usage_types(pricing_service_usages.usages)
+        pricing_objects = cls._get_pricing_objects(
+            pricing_service_usages.usages,
+            usage_types,
+        )
         logger.info("Saving usages for service {0}".format(
             pricing_service_usages.pricing_service
         ))
+        types = cls._save_usages(
+            pricing_service_usages.date,
+            pricing_service_usages.usages,
+            usage_types,
+            pricing_objects,
+            pricing_service_usages.overwrite,
+        )
+        # signals are not sent on bulk operations
+        register_costs_input_change(
+            types,
+            pricing_service_usages.date,
+            pricing_service_usages.date,
+        )
+        clear_costs_memo()
+
+    @classmethod
+    def _save_usages(
+        cls,
+        date,
+        usages_list,
+        usage_types,
+        pricing_objects,
+        overwrite,
+        deleted_types=None,
+    ):
+        """
+        Save (already validated) usages and returns ids of their usage types.
+
+        :param pricing_objects: list of tuples (pricing object id, service
+            environment id) for every usages (see `_get_pricing_objects`)
+        :param deleted_types: set of ids of usage types, which previous usages
+            were already removed (with 'delete_all_previous' overwrite); used
+            when usages are saved in chunks - it's updated in place
+        """
+        daily_pricing_objects = cls._get_daily_pricing_objects(
+            date,
+            pricing_objects,
+        )
+        daily_usages = []
+        usages_daily_pricing_objects = defaultdict(list)
+        for usages, (pricing_object_id, _) in zip(
+            usages_list,
+            pricing_objects,
+        ):
+            daily_pricing_object_id, service_environment_id = (
+                daily_pricing_objects[pricing_object_id]
+            )
+            for usage in usages.usages:
+                usage_type_id = usage_types[usage.symbol]
+                daily_usages.append(DailyUsage(
+                    date=date,
+                    type_id=usage_type_id,
+                    value=usage.value,
+                    daily_pricing_object_id=daily_pricing_object_id,
+                    service_environment_id=service_environment_id,
+                ))
+                usages_daily_pricing_objects[usage_type_id].append(
+                    daily_pricing_object_id
+                )
 
         # remove previous daily usages
-        if pricing_service_usages.overwrite in (
-            'values_only',
-            'delete_all_previous'
+        if overwrite in ('values_only', 'delete_all_previous'):
+            logger.debug('Remove previous values ({})'.format(overwrite))
+            to_delete = usages_daily_pricing_objects
+            if (
+                overwrite == 'delete_all_previous' and
+                deleted_types is not None
+            ):
+                to_delete = dict(
+                    (k, v) for (k, v) in to_delete.iteritems()
+                    if k not in deleted_types
+                )
+                deleted_types.update(to_delete)
+            cls._delete_previous_usages(
+                date,
+                to_delete,
+                values_only=(overwrite == 'values_only'),
+            )
+
+        # bulk save all usages
+        for batch in chunks(
+            daily_usages,
+            settings.DAILY_USAGE_CREATE_BATCH_SIZE,
         ):
-            logger.debug('Remove previous values ({})'.format(
-                pricing_service_usages.overwrite,
-            ))
-            for usage_type, dpos in usages_daily_pricing_objects.iteritems():
-                previuos_usages = DailyUsage.objects.filter(
-                    date=pricing_service_usages.date,
-                    type=usage_type,
+            DailyUsage.objects.bulk_create(batch)
+        return usages_daily_pricing_objects.keys()
+
+    @classmethod
+    def _get_usage_types(cls, usages_list):
+        """
+        Returns usage type id for every (valid) symbol used in usages.
+        """
+        symbols = set(
+            usage.symbol for usages in usages_list for usage in usages.usages
+        )
+        result = {}
+        for symbols_chunk in chunks(symbols, settings.IN_QUERY_BATCH_SIZE):
+            result.update(UsageType.objects.filter(
+                symbol__in=symbols_chunk,
+            ).values_list('symbol', 'id'))
+        return result
+
+    @classmethod
+    def _get_pricing_objects(cls, usages_list, usage_types):
+        """
+        Returns list of tuples (pricing object id, service environment id) for
+        every usages (of single pricing object or service environment).
+
+        Raises Bad Request response on first invalid usages (invalid pricing
+        object, service environment or usage type symbol).
+        """
+        result = []
+        for pricing_object in cls._resolve_pricing_objects(
+            usages_list,
+            usage_types,
+        ):
+            if isinstance(pricing_object, basestring):
+                raise ImmediateHttpResponse(
+                    response=http.HttpBadRequest(pricing_object)
+                )
+            result.append(pricing_object)
+        return result
+
+    @classmethod
+    def _resolve_pricing_objects(cls, usages_list, usage_types):
+        """
+        Returns list of tuples (pricing object id, service environment id) for
+        every usages. Error message is returned instead of tuple for invalid
+        usages (invalid pricing object, service environment or usage type
+        symbol).
+        """
+        pricing_objects_names = set()
+        services_ids = set()
+        services_names = set()
+        environments_names = set()
+        for usages in usages_list:
+            if usages.pricing_object:
+                pricing_objects_names.add(usages.pricing_object)
+            elif usages.service_id and usages.environment:
+                services_ids.add(usages.service_id)
+                environments_names.add(usages.environment)
+            elif usages.service and usages.environment:
+                services_names.add(usages.service)
+                environments_names.add(usages.environment)
+
+        batch_size = settings.IN_QUERY_BATCH_SIZE
+        pricing_objects = {}
+        for names in chunks(pricing_objects_names, batch_size):
+            for name, po_id, se_id in PricingObject.objects.filter(
+                name__in=names,
+            ).values_list('name', 'id', 'service_environment_id'):
+                pricing_objects[name] = (po_id, se_id)
+
+        services_environments = {}
+        for field, services in (
+            ('service__id', services_ids),
+            ('service__name', services_names),
+        ):
+            for services_chunk in chunks(services, batch_size):
+                for service, environment, se_id in (
+                    ServiceEnvironment.objects.filter(**{
+                        field + '__in': services_chunk,
+                        'environment__name__in': environments_names,
+                    }).values_list(field, 'environment__name', 'id')
+                ):
+                    # service id is passed as string
+                    key = (field, '{}'.format(service), environment)
+                    services_environments[key] = se_id
+        dummy_pricing_objects = cls._get_dummy_pricing_objects(
+            set(services_environments.values())
+        )
+
+        result = []
+        for usages in usages_list:
+            if usages.pricing_object:
+                pricing_object = pricing_objects.get(
+                    usages.pricing_object,
+                    "Invalid pricing object name or id ({})".format(
+                        usages.pricing_object
+                    ),
                 )
-                if pricing_service_usages.overwrite == 'values_only':
-                    previuos_usages = previuos_usages.filter(
-                        daily_pricing_object__in=dpos
+            elif usages.environment and (usages.service_id or usages.service):
+                if usages.service_id:
+                    key = ('service__id', '{}'.format(usages.service_id))
+                else:
+                    key = ('service__name', usages.service)
+                se_id = services_environments.get(key + (usages.environment,))
+                if se_id is None:
+                    pricing_object = (
+                        "Invalid service or environment name ({} / {})".format(
+                            usages.service,
+                            usages.environment,
+                        )
                     )
-                previuos_usages.delete()
+                else:
+                    pricing_object = (dummy_pricing_objects[se_id], se_id)
+            else:
+                pricing_object = (
+                    "Pricing Object (Host, IP etc) or Service and "
+                    "Environment has to be provided"
+                )
+            if not isinstance(pricing_object, basestring):
+                for usage in usages.usages:
+                    if usage.symbol not in usage_types:
+                        pricing_object = (
+                            "Invalid usage type symbol: {}".format(
+                                usage.symbol
+                            )
+                        )
+                        break
+            result.append(pricing_object)
+        return result
 
-        # bulk save all usages
-        DailyUsage.objects.bulk_create(daily_usages)
+    @classmethod
+    def _get_dummy_pricing_objects(cls, services_environments_ids):
+        """
+        Returns dummy pricing object id for every service environment.
+        """
+        result = {}
+        batch_size = settings.IN_QUERY_BATCH_SIZE
+        for ids in chunks(services_environments_ids, batch_size):
+            for se_id, po_id in PricingObject.objects.filter(
+                service_environment__in=ids,
+                type=PRICING_OBJECT_TYPES.DUMMY,
+            ).order_by('-id').values_list('service_environment_id', 'id'):
+                result[se_id] = po_id
+        # dummy pricing object is created with service environment, but
+        # create it for sure
+        for se_id in set(services_environments_ids) - set(result):
+            result[se_id] = ServiceEnvironment.objects.get(
+                id=se_id,
+            ).dummy_pricing_object.id
+        return result
+
+    @classmethod
+    def _get_daily_pricing_objects(cls, date, pricing_objects):
+        """
+        Returns tuple (daily pricing object id, service environment id) for
+        every pricing object. Missing daily pricing objects are created in
+        bulk.
+
+        :param pricing_objects: list of tuples (pricing object id, service
+            environment id)
+        """
+        pricing_objects = dict(pricing_objects)
+
+        def fetch(pricing_objects_ids):
+            batch_size = settings.IN_QUERY_BATCH_SIZE
+            for ids in chunks(pricing_objects_ids, batch_size):
+                for dpo_id, po_id, se_id in DailyPricingObject.objects.filter(
+                    date=date,
+                    pricing_object__in=ids,
+                ).values_list(
+                    'id',
+                    'pricing_object_id',
+                    'service_environment_id',
+                ):
+                    result[po_id] = (dpo_id, se_id)
+
+        result = {}
+        fetch(pricing_objects.keys())
+        missing = set(pricing_objects) - set(result)
+        if missing:
+            logger.debug('Creating {} daily pricing objects'.format(
+                len(missing)
+            ))
+            for ids in chunks(missing, settings.DAILY_USAGE_CREATE_BATCH_SIZE):
+                DailyPricingObject.objects.bulk_create([
+                    DailyPricingObject(
+                        date=date,
+                        pricing_object_id=po_id,
+                        service_environment_id=pricing_objects[po_id],
+                    ) for po_id in ids
+                ])
+            # bulk_create doesn't set ids of created objects
+            fetch(missing)
+        return result
+
+    @classmethod
+    def _delete_previous_usages(
+        cls,
+        date,
+        usages_daily_pricing_objects,
+        values_only,
+    ):
+        """
+        Delete previous usages of usage types (only of passed daily pricing
+        objects if values_only is True).
+
+        Raw SQL is used, because Django (1.4) fetches every deleted object to
+        send signals.
+        """
+        cursor = connection.cursor()
+        query = 'DELETE FROM {} WHERE date=%s AND type_id=%s'.format(
+            DailyUsage._meta.db_table,
+        )
+        batch_size = settings.IN_QUERY_BATCH_SIZE
+        for usage_type_id, dpos in usages_daily_pricing_objects.iteritems():
+            if values_only:
+                for dpos_chunk in chunks(set(dpos), batch_size):
+                    cursor.execute(
+                        query + ' AND daily_pricing_object_id IN ({})'.format(
+                            ', '.join(['%s'] * len(dpos_chunk))
+                        ),
+                        [date, usage_type_id] + dpos_chunk,
+                    )
+            else:
+                cursor.execute(query, [date, usage_type_id])
 
     # =================
     # GET
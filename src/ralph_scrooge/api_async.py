@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+Asynchronous pricing service usages push API (for very large pushes).
+
+Usages are sent as NDJSON (newline delimited JSON) - first line is a header
+with pricing service, date and overwrite mode and every next line is single
+usages object (of pricing object or service environment) in the same format
+as elements of `usages` list of `PricingServiceUsageResource`, ex.:
+
+    {"pricing_service": "ps1", "date": "2013-10-10", "overwrite": "no"}
+    {"service": "s1", "environment": "e1", "usages": [{"symbol": "requests", "value": 123}]}
+    {"pricing_object": "po1", "usages": [{"symbol": "requests", "value": 543}]}
+
+Request body is streamed (it could be sent using chunked transfer encoding)
+to file in SCROOGE_USAGES_UPLOAD_DIR (which has to be accessible by RQ
+workers - push is rejected if it's not set) and processed on worker by
+`UsagesIngestionJob`, which saves usages in batches. Invalid rows are skipped
+and reported in job status.
+"""  # noqa
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+import json
+import logging
+import os
+import uuid
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from tastypie.authentication import ApiKeyAuthentication
+from tastypie.exceptions import ImmediateHttpResponse
+
+from ralph_scrooge.api import (
+    PricingServiceUsageObject,
+    PricingServiceUsageResource,
+    UsageObject,
+    UsagesObject,
+)
+from ralph_scrooge.utils.common import get_cache_name, get_queue_name
+from ralph_scrooge.utils.costs_changes import register_costs_input_change
+from ralph_scrooge.utils.costs_memo import clear_costs_memo
+from ralph_scrooge.utils.worker_job import WorkerJob, _get_cache_key
+
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# max number of error messages stored in job status
+MAX_ERROR_MESSAGES = 100
+
+
+def get_upload_path(upload_id):
+    return os.path.join(
+        settings.SCROOGE_USAGES_UPLOAD_DIR,
+        'scrooge_usages_{}.ndjson'.format(upload_id),
+    )
+
+
+def parse_header(line):
+    """
+    Parse header (first line) of usages push. Raises ValueError if header is
+    invalid.
+    """
+    data = json.loads(line)
+    if not isinstance(data, dict):
+        raise ValueError('Header has to be an object')
+    if not (data.get('pricing_service') or data.get('pricing_service_id')):
+        raise ValueError('Pricing service name or id has to be provided')
+    try:
+        date = datetime.datetime.strptime(data['date'], '%Y-%m-%d').date()
+    except (KeyError, TypeError):
+        raise ValueError('Invalid date (YYYY-MM-DD expected)')
+    pricing_service_usages = PricingServiceUsageObject(
+        pricing_service=data.get('pricing_service'),
+        pricing_service_id=data.get('pricing_service_id'),
+        date=date,
+    )
+    pricing_service_usages.overwrite = data.get('overwrite', 'no')
+    if pricing_service_usages.overwrite not in (
+        'no',
+        'delete_all_previous',
+        'values_only',
+    ):
+        raise ValueError('Invalid overwrite ({})'.format(
+            pricing_service_usages.overwrite
+        ))
+    return pricing_service_usages
+
+
+def parse_usages(line):
+    """
+    Parse single row (usages of pricing object or service environment) of
+    usages push. Raises ValueError if row is invalid.
+    """
+    data = json.loads(line)
+    if not isinstance(data, dict):
+        raise ValueError('Row has to be an object')
+    if data.get('service_id'):
+        # service id is compared with ids of services in database
+        int(data['service_id'])
+    usages = []
+    for usage in data.get('usages') or []:
+        if not isinstance(usage, dict) or not usage.get('symbol'):
+            raise ValueError('Usage symbol has to be provided')
+        usages.append(UsageObject(
+            symbol=usage['symbol'],
+            value=float(usage.get('value')),
+        ))
+    return UsagesObject(
+        service=data.get('service'),
+        service_id=data.get('service_id'),
+        environment=data.get('environment'),
+        pricing_object=data.get('pricing_object'),
+        usages=usages,
+    )
+
+
+class UsagesIngestionJob(WorkerJob):
+    """
+    Save usages pushed to async API (stored in file) in batches of
+    SCROOGE_USAGES_INGESTION_BATCH_SIZE rows.
+    """
+    queue_name = get_queue_name('scrooge_usages')
+    cache_name = get_cache_name('scrooge_usages')
+    cache_section = 'scrooge_usages'
+    cache_timeout = 60 * 60 * 24  # 24 hours
+    cache_final_result_timeout = 60 * 60 * 24  # 24 hours
+    progress_update = 1
+    # report failure in status of job (instead of unknown job)
+    keep_failed_result = True
+
+    @classmethod
+    def _add_error(cls, status, line_no, message):
+        status['errors'] += 1
+        if len(status['error_messages']) < MAX_ERROR_MESSAGES:
+            status['error_messages'].append([line_no, message])
+
+    @classmethod
+    def _save_batch(cls, pricing_service_usages, batch, status, **kwargs):
+        """
+        Save valid usages from batch (list of tuples (line number, usages)).
+        Returns ids of usage types of saved usages.
+        """
+        usages_list = [usages for line_no, usages in batch]
+        usage_types = PricingServiceUsageResource._get_usage_types(
+            usages_list
+        )
+        valid_usages = []
+        pricing_objects = []
+        for (line_no, usages), pricing_object in zip(
+            batch,
+            PricingServiceUsageResource._resolve_pricing_objects(
+                usages_list,
+                usage_types,
+            )
+        ):
+            if isinstance(pricing_object, basestring):
+                cls._add_error(status, line_no, pricing_object)
+            else:
+                valid_usages.append(usages)
+                pricing_objects.append(pricing_object)
+        types = PricingServiceUsageResource._save_usages(
+            pricing_service_usages.date,
+            valid_usages,
+            usage_types,
+            pricing_objects,
+            pricing_service_usages.overwrite,
+            **kwargs
+        )
+        status['saved'] += len(valid_usages)
+        return types
+
+    @classmethod
+    def run(cls, upload_id):
+        path = get_upload_path(upload_id)
+        status = {
+            'rows': 0,
+            'saved': 0,
+            'errors': 0,
+            'error_messages': [],
+        }
+        try:
+            size = os.path.getsize(path) or 1
+            with open(path, 'rb') as f, transaction.commit_on_success():
+                header = f.readline()
+                pricing_service_usages = parse_header(header)
+                logger.info('Saving usages for service {} ({})'.format(
+                    pricing_service_usages.pricing_service,
+                    upload_id,
+                ))
+                read = len(header)
+                batch_size = settings.SCROOGE_USAGES_INGESTION_BATCH_SIZE
+                types = set()
+                deleted_types = set()
+                batch = []
+                for line_no, line in enumerate(f, start=2):
+                    read += len(line)
+                    if not line.strip():
+                        continue
+                    status['rows'] += 1
+                    try:
+                        batch.append((line_no, parse_usages(line)))
+                    except (ValueError, TypeError) as e:
+                        cls._add_error(
+                            status,
+                            line_no,
+                            'Invalid row: {}'.format(e),
+                        )
+                    if len(batch) >= batch_size:
+                        types.update(cls._save_batch(
+                            pricing_service_usages,
+                            batch,
+                            status,
+                            deleted_types=deleted_types,
+                        ))
+                        batch = []
+                        yield min(99, read * 100 / size), status
+                if batch:
+                    types.update(cls._save_batch(
+                        pricing_service_usages,
+                        batch,
+                        status,
+                        deleted_types=deleted_types,
+                    ))
+                # signals are not sent on bulk operations
+                register_costs_input_change(
+                    types,
+                    pricing_service_usages.date,
+                    pricing_service_usages.date,
+                )
+            clear_costs_memo()
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        yield 100, status
+
+
+def _json_response(data, status=200):
+    return HttpResponse(
+        json.dumps(data),
+        content_type='application/json',
+        status=status,
+    )
+
+
+def _get_job_status(job_id, progress, status):
+    result = {
+        'job_id': job_id,
+        'progress': progress,
+        'finished': progress == 100,
+        # failed job has no result
+        'failed': progress == 100 and status is None,
+    }
+    result.update(status or {})
+    return result
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+def push_usages(request):
+    """
+    Accept NDJSON usages push and queue it to save on RQ worker. Returns id
+    of the job, which status is available at `push_usages_status` url.
+
+    Possible return HTTP codes:
+    202 - usages accepted (with job id and status).
+    400 - invalid header or pricing service.
+    401 - authentication/authorization error.
+    503 - SCROOGE_USAGES_UPLOAD_DIR is not set.
+    """
+    authenticated = ApiKeyAuthentication().is_authenticated(request)
+    if authenticated is not True:
+        return authenticated
+    if not settings.SCROOGE_USAGES_UPLOAD_DIR:
+        # usages are saved by RQ workers (possibly on other hosts), so they
+        # can't be stored in local temporary directory
+        logger.error('SCROOGE_USAGES_UPLOAD_DIR is not set')
+        return _json_response(
+            {'error': 'Asynchronous usages push is not configured'},
+            503,
+        )
+    upload_id = uuid.uuid4().hex
+    path = get_upload_path(upload_id)
+    with open(path, 'wb') as f:
+        while True:
+            chunk = request.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            f.write(chunk)
+    try:
+        with open(path, 'rb') as f:
+            pricing_service_usages = parse_header(f.readline())
+        PricingServiceUsageResource.check_pricing_service(
+            pricing_service_usages
+        )
+    except (ValueError, ImmediateHttpResponse) as e:
+        os.remove(path)
+        if isinstance(e, ImmediateHttpResponse):
+            return e.response
+        return _json_response({'error': 'Invalid header: {}'.format(e)}, 400)
+    progress, status = UsagesIngestionJob().run_on_worker(upload_id=upload_id)
+    return _json_response(_get_job_status(upload_id, progress, status), 202)
+
+
+@require_http_methods(['GET'])
+def push_usages_status(request, job_id):
+    """
+    Returns status of usages push job: progress, number of rows, saved rows
+    and errors (with first error messages as list of [line number, message]).
+    """
+    authenticated = ApiKeyAuthentication().is_authenticated(request)
+    if authenticated is not True:
+        return authenticated
+    cache = get_cache(UsagesIngestionJob.cache_name)
+    key = _get_cache_key(UsagesIngestionJob.cache_section, upload_id=job_id)
+    # don't queue new job for unknown (or expired) job id
+    if cache.get(key) is None:
+        return _json_response({'error': 'Unknown job'}, 404)
+    progress, status = UsagesIngestionJob().run_on_worker(upload_id=job_id)
+    return _json_response(_get_job_status(job_id, progress, status))
@@ -235,6 +235,10 @@ class MonthlyCostsForm(DateRangeForm):
         required=False,
         label=_("Forecast"),
     )
+    incremental = forms.BooleanField(
+        required=False,
+        label=_("Only changed costs"),
+    )
 
 
 # =============================================================================
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import textwrap
+import time
+from optparse import make_option
+
+import ipaddr
+from django.core.management.base import BaseCommand
+
+from ralph_scrooge.plugins.collect.netflow import (
+    extract_ip_and_bytes,
+    NetworkIndex,
+)
+
+
+def _linear_scan(ip_address, class_addresses):
+    """
+    Previous classification of IP addresses (new ipaddr objects for every
+    row and network), used as a baseline.
+    """
+    for class_address in class_addresses:
+        if ipaddr.IPv4Address(ip_address) in ipaddr.IPv4Network(class_address):
+            return True
+    return False
+
+
+class Command(BaseCommand):
+    """
+    Micro-benchmark of classification of IP addresses from nfdump output by
+    netflow plugin. Synthetic nfdump rows are classified using previous
+    (linear scan of ipaddr networks) and current (NetworkIndex) method.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '-r', '--rows',
+            dest='rows',
+            type='int',
+            default=1000000,
+            help='Number of synthetic nfdump rows',
+        ),
+        make_option(
+            '-n', '--networks',
+            dest='networks',
+            type='int',
+            default=20,
+            help='Number of (/24) class addresses',
+        ),
+        make_option(
+            '--skip-baseline',
+            dest='skip_baseline',
+            action='store_true',
+            default=False,
+            help='Do not run (slow) baseline classification',
+        ),
+    )
+
+    @property
+    def help(self):
+        return textwrap.dedent(self.__doc__).strip()
+
+    def _get_rows(self, rows_count):
+        random.seed(0)
+        for i in xrange(rows_count):
+            yield '10.{}.{}.{} | 10.{}.{}.{} | 80 | 443 | TCP | {}'.format(
+                random.randint(0, 63),
+                random.randint(0, 255),
+                random.randint(1, 254),
+                random.randint(0, 63),
+                random.randint(0, 255),
+                random.randint(1, 254),
+                random.randint(1, 10000),
+            )
+
+    def _measure(self, name, func, rows):
+        start = time.time()
+        matched = sum(1 for row in rows if func(row))
+        elapsed = time.time() - start
+        self.stdout.write(
+            '{}: {:.2f}s ({} rows matched, {:.0f} rows/s)\n'.format(
+                name,
+                elapsed,
+                matched,
+                len(rows) / elapsed if elapsed else 0,
+            )
+        )
+        return elapsed
+
+    def handle(self, *args, **options):
+        class_addresses = [
+            '10.{}.{}.0/24'.format(i % 64, i // 64 * 3)
+            for i in range(options['networks'])
+        ]
+        rows = list(self._get_rows(options['rows']))
+        self.stdout.write('{} rows, {} class addresses\n'.format(
+            len(rows),
+            len(class_addresses),
+        ))
+        network_index = NetworkIndex(class_addresses)
+        elapsed = self._measure(
+            'NetworkIndex',
+            lambda row: extract_ip_and_bytes(row, 'src', network_index),
+            rows,
+        )
+        if not options['skip_baseline']:
+            baseline = self._measure(
+                'ipaddr linear scan',
+                lambda row: _linear_scan(
+                    row.split('|')[0].strip(),
+                    class_addresses,
+                ),
+                rows,
+            )
+            if elapsed:
+                self.stdout.write(
+                    'Speedup: {:.1f}x\n'.format(baseline / elapsed)
+                )
@@ -7,15 +7,21 @@ from __future__ import unicode_literals
 
 import datetime
 import logging
+from collections import defaultdict
+import multiprocessing
 import pkg_resources
+import Queue
 import textwrap
+import time
 from optparse import make_option
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from django.db import connection
 from ralph.util import plugin
 
 from ralph_scrooge.models import SyncStatus
+from ralph_scrooge.utils.service_changes import update_service_changes
 
 
 logger = logging.getLogger(__name__)
@@ -66,10 +72,16 @@ def _run_plugin(name, today):
         logger.info('Done: {0}'.format(message))
 
 
-def run_plugins(today, plugins, run_only=False):
+def run_plugins(today, plugins, run_only=False, done=None):
+    """
+    Run plugins (in order of their requirements) for single day.
+
+    :param done: names of plugins which are treated as already (successfully)
+        executed
+    """
     _load_plugins()
     logger.info('Synchronizing for {0}.'.format(today.isoformat()))
-    done = set()
+    done = set(done or [])
     tried = set()
     if run_only:
         name = plugins[0]
@@ -93,15 +105,251 @@ def run_plugins(today, plugins, run_only=False):
                 except PluginError:
                     yield name, False
 
-        # save not executed plugins
-        for p in set(plugins) - tried:
-            status = SyncStatus.objects.get_or_create(
-                date=today,
-                plugin=p,
-            )[0]
-            status.success = False
-            status.remarks = 'Not executed'
-            status.save()
+        _save_not_executed(today, set(plugins) - tried)
+
+
+def _update_service_changes(today):
+    """
+    Rebuild log of pricing objects services changes once all plugins of the
+    day are finished (plugins creating daily pricing objects could run
+    concurrently, so log is not rebuilt by every one of them).
+    """
+    try:
+        update_service_changes(today)
+    except Exception:
+        logger.exception(
+            'Updating services changes for {0} failed'.format(today)
+        )
+
+
+def _save_not_executed(today, plugins, remarks='Not executed'):
+    for p in plugins:
+        status = SyncStatus.objects.get_or_create(
+            date=today,
+            plugin=p,
+        )[0]
+        status.success = False
+        status.remarks = remarks
+        status.save()
+
+
+def _init_worker():
+    """
+    Initialize plugins pool worker - every worker should use it's own
+    database connection (instead of inherited from parent process).
+    """
+    connection.close()
+
+
+def _run_plugin_on_worker(name, today):
+    """
+    Entry point of plugins pool worker. Returns tuple (plugin name, success,
+    time of plugin run in seconds).
+    """
+    start = time.time()
+    try:
+        _run_plugin(name, today)
+        success = True
+    except Exception:
+        # exception is already logged by _run_plugin
+        success = False
+    return name, success, time.time() - start
+
+
+def _get_pool(processes):
+    return multiprocessing.Pool(processes, initializer=_init_worker)
+
+
+def run_plugins_parallel(today, plugins, processes, timings=None):
+    """
+    Run plugins in pool of processes. Plugins are scheduled as a DAG using
+    their requirements - plugin is started as soon as all plugins which it
+    requires are successfully finished (the same as in `run_plugins`, but
+    without waiting for other plugins).
+
+    Plugin which does not report back in COLLECT_PLUGIN_TIMEOUT seconds (ex.
+    when its worker was killed) is marked as failed.
+
+    :param timings: if passed, tuple (time of run, success) is saved in it
+        for every plugin
+    """
+    _load_plugins()
+    logger.info('Synchronizing for {0} using {1} processes.'.format(
+        today.isoformat(),
+        processes,
+    ))
+    timings = timings if timings is not None else {}
+    done = set()
+    tried = set()
+    # start time of every running plugin
+    running = {}
+    timeout = settings.COLLECT_PLUGIN_TIMEOUT
+    finished = Queue.Queue()
+    # close current connection to not share it with workers
+    connection.close()
+    pool = _get_pool(processes)
+    try:
+        while True:
+            to_run = plugin.next('scrooge', done) - tried
+            while to_run:
+                name = plugin.highest_priority('scrooge', to_run)
+                to_run.remove(name)
+                tried.add(name)
+                if name in plugins:
+                    pool.apply_async(
+                        _run_plugin_on_worker,
+                        [name, today],
+                        callback=finished.put,
+                    )
+                    running[name] = time.time()
+            if not running:
+                break
+            wait = None
+            if timeout is not None:
+                wait = max(min(running.values()) + timeout - time.time(), 0)
+            try:
+                name, success, elapsed = finished.get(timeout=wait)
+            except Queue.Empty:
+                now = time.time()
+                for name, started in running.items():
+                    if now - started < timeout:
+                        continue
+                    logger.error('{0} did not finish in {1}s'.format(
+                        name,
+                        timeout,
+                    ))
+                    del running[name]
+                    _save_not_executed(today, [name], remarks='Timeout')
+                    timings[name] = (now - started, False)
+                    yield name, False
+                continue
+            if name not in running:
+                # result of plugin which was already marked as failed
+                continue
+            del running[name]
+            timings[name] = (elapsed, success)
+            if success:
+                done.add(name)
+            yield name, success
+    finally:
+        pool.terminate()
+        pool.join()
+    _save_not_executed(today, set(plugins) - tried)
+
+
+def _get_synced_plugins(start, end):
+    """
+    Returns dict with set of plugins successfully executed (according to
+    SyncStatus) for every day between start and end.
+    """
+    result = defaultdict(set)
+    for date, name in SyncStatus.objects.filter(
+        date__gte=start,
+        date__lte=end,
+        success=True,
+    ).values_list('date', 'plugin'):
+        result[date].add(name)
+    return result
+
+
+def _run_day_on_worker(day, plugins, done):
+    """
+    Entry point of backfill pool worker. Returns tuple (day, list of plugins
+    results).
+    """
+    try:
+        return day, list(run_plugins(day, plugins, done=done))
+    except Exception:
+        logger.exception('Backfill for {0} failed'.format(day))
+        return day, [(name, False) for name in plugins]
+
+
+def run_plugins_backfill(start, end, plugins, processes=1):
+    """
+    Run plugins for every day between start and end (inclusive).
+
+    Master data plugins (COLLECT_MASTER_DATA_PLUGINS) are run only once (for
+    the last day of backfill). Then plugins creating pricing objects
+    (COLLECT_PRICING_OBJECTS_PLUGINS) are run day by day in current process
+    (they are not safe to run concurrently), and at the end remaining (daily)
+    plugins are run for every day - days (except the first one, which creates
+    usage types) are processed in parallel if processes > 1. Plugins which
+    were already successfully executed for a particular day (according to
+    SyncStatus) are skipped, so interrupted backfill could be resumed.
+
+    Yields tuples (day, plugin name, success).
+    """
+    _load_plugins()
+    synced = _get_synced_plugins(start, end)
+    master_plugins = [
+        name for name in plugins
+        if name in settings.COLLECT_MASTER_DATA_PLUGINS
+    ]
+    pricing_objects_plugins = [
+        name for name in plugins
+        if name in settings.COLLECT_PRICING_OBJECTS_PLUGINS and
+        name not in settings.COLLECT_MASTER_DATA_PLUGINS
+    ]
+    daily_plugins = [
+        name for name in plugins
+        if name not in settings.COLLECT_MASTER_DATA_PLUGINS and
+        name not in settings.COLLECT_PRICING_OBJECTS_PLUGINS
+    ]
+    master_done = set(master_plugins) & synced[end]
+    for name, success in run_plugins(
+        end,
+        [name for name in master_plugins if name not in master_done],
+        done=master_done,
+    ):
+        if success:
+            master_done.add(name)
+        yield end, name, success
+
+    days = []
+    day = start
+    while day <= end:
+        done = master_done | synced[day]
+        to_run = [name for name in pricing_objects_plugins if name not in done]
+        if to_run:
+            for name, success in run_plugins(day, to_run, done=done):
+                if success:
+                    done.add(name)
+                yield day, name, success
+            # days are processed in order, so log of the day (and the next
+            # one) is never rebuilt concurrently
+            _update_service_changes(day)
+        to_run = [name for name in daily_plugins if name not in synced[day]]
+        if to_run:
+            days.append((day, to_run, done))
+        else:
+            logger.info('{0} already synchronized - skipping'.format(day))
+        day += datetime.timedelta(days=1)
+
+    if processes > 1 and len(days) > 1:
+        # daily plugins get-or-create their usage types - the first day is
+        # processed in current process, so workers only fetch usage types
+        # which already exist
+        day, to_run, done = days.pop(0)
+        for name, success in run_plugins(day, to_run, done=done):
+            yield day, name, success
+        connection.close()
+        pool = _get_pool(min(processes, len(days)))
+        try:
+            results = [
+                pool.apply_async(_run_day_on_worker, args)
+                for args in days
+            ]
+            for result in results:
+                day, day_results = result.get()
+                for name, success in day_results:
+                    yield day, name, success
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for day, to_run, done in days:
+            for name, success in run_plugins(day, to_run, done=done):
+                yield day, name, success
 
 
 class Command(BaseCommand):
@@ -129,8 +377,71 @@ class Command(BaseCommand):
             default=None,
             help="Run only the selected plugin, ignore dependencies.",
         ),
+        make_option(
+            '--start',
+            dest='start',
+            default=None,
+            help="First day of multi-day backfill (use with --end).",
+        ),
+        make_option(
+            '--end',
+            dest='end',
+            default=None,
+            help="Last day of multi-day backfill (use with --start).",
+        ),
+        make_option(
+            '--parallel',
+            dest='parallel',
+            type='int',
+            default=None,
+            help="Run independent plugins in parallel using N processes.",
+        ),
     )
 
+    def _backfill(self, options):
+        if not (options.get('start') and options.get('end')):
+            raise CommandError('Both --start and --end have to be provided')
+        start, end = [
+            datetime.datetime.strptime(options[d], '%Y-%m-%d').date()
+            for d in ('start', 'end')
+        ]
+        if start > end:
+            raise CommandError('--start has to be before --end')
+        failed = 0
+        for day, name, success in run_plugins_backfill(
+            start,
+            end,
+            settings.COLLECT_PLUGINS,
+            options.get('parallel') or 1,
+        ):
+            if not success:
+                failed += 1
+                self.stdout.write('{0} {1}: FAILED\n'.format(day, name))
+        self.stdout.write(
+            'Backfill {0} - {1} done ({2} failures)\n'.format(
+                start,
+                end,
+                failed,
+            )
+        )
+
+    def _print_timings(self, timings, elapsed):
+        self.stdout.write('{:<30} {:>10} {}\n'.format(
+            'Plugin',
+            'Time [s]',
+            'Status',
+        ))
+        for name, (plugin_elapsed, success) in sorted(
+            timings.items(),
+            key=lambda t: -t[1][0],
+        ):
+            self.stdout.write('{:<30} {:>10.1f} {}\n'.format(
+                name,
+                plugin_elapsed,
+                'OK' if success else 'FAILED',
+            ))
+        self.stdout.write('{:<30} {:>10.1f}\n'.format('Total', elapsed))
+
     def handle(self, today, run_only, *args, **options):
         if today:
             today = datetime.datetime.strptime(today, '%Y-%m-%d').date()
@@ -139,9 +450,25 @@ class Command(BaseCommand):
 
         if options.get('yesterday'):
             today -= datetime.timedelta(days=1)
-        if not run_only:
+        if options.get('start') or options.get('end'):
+            self._backfill(options)
+        elif options.get('parallel') and not run_only:
+            start = time.time()
+            timings = {}
+            for r in run_plugins_parallel(
+                today,
+                settings.COLLECT_PLUGINS,
+                options['parallel'],
+                timings,
+            ):
+                pass
+            self._print_timings(timings, time.time() - start)
+            _update_service_changes(today)
+        elif not run_only:
             for r in run_plugins(today, settings.COLLECT_PLUGINS):
                 pass
+            _update_service_changes(today)
         else:
             for r in run_plugins(today, [run_only], run_only=True):
                 pass
+            _update_service_changes(today)
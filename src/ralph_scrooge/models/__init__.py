@@ -1,6 +1,11 @@
 from ralph_scrooge.models.base import BaseUsage, BaseUsageType
 
-from ralph_scrooge.models.cost import CostDateStatus, DailyCost
+from ralph_scrooge.models.cost import (
+    CostDateStatus,
+    CostInputChange,
+    DailyCost,
+    MonthlyCost,
+)
 
 from ralph_scrooge.models.extra_cost import (
     DynamicExtraCost,
@@ -31,6 +36,7 @@ from ralph_scrooge.models.pricing_object import (
     PricingObjectType,
     PRICING_OBJECT_TYPES,
     PricingObject,
+    PricingObjectServiceChange,
     TenantInfo,
     VIPInfo,
     VirtualInfo,
@@ -41,6 +47,7 @@ from ralph_scrooge.models.service import (
     Environment,
     HistoricalService,  # dynamic model
     PricingService,
+    PricingServiceDependencyGraph,
     PricingServicePlugin,
     ProfitCenter,
     Service,
@@ -79,6 +86,7 @@ __all__ = [
     'BaseUsageType',
     'BusinessLine',
     'CostDateStatus',
+    'CostInputChange',
     'DailyAssetInfo',
     'DailyDatabaseInfo',
     'DailyCost',
@@ -95,14 +103,17 @@ __all__ = [
     'ExtraCost',
     'ExtraCostType',
     'HistoricalService',  # dynamic model
+    'MonthlyCost',
     'OwnershipType',
     'Owner',
     'ProfitCenter',
     'PricingObject',
     'PricingObjectModel',
+    'PricingObjectServiceChange',
     'PricingObjectType',
     'PRICING_OBJECT_TYPES',
     'PricingService',
+    'PricingServiceDependencyGraph',
     'PricingServicePlugin',
     'Service',
     'ServiceEnvironment',
@@ -5,6 +5,8 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import datetime
+
 from django.db import models as db
 from django.utils.translation import ugettext_lazy as _
 
@@ -92,6 +94,60 @@ class DailyCost(MultiPathNode):
         return True
 
 
+class MonthlyCost(db.Model):
+    """
+    Monthly rollup of accepted daily costs (of first depth) - sum of costs
+    and values of every accepted day of month per service environment, type
+    and pricing object. Rollup is refreshed when costs are accepted (see
+    `ralph_scrooge.utils.monthly_costs`).
+    """
+    month = db.DateField(
+        verbose_name=_('month'),
+        help_text=_('first day of month'),
+        db_index=True,
+    )
+    service_environment = db.ForeignKey(
+        'ServiceEnvironment',
+        related_name='monthly_costs',
+        verbose_name=_('service environment'),
+    )
+    type = db.ForeignKey(
+        'BaseUsage',
+        related_name='monthly_costs',
+        verbose_name=_('type'),
+    )
+    pricing_object = db.ForeignKey(
+        'PricingObject',
+        null=True,
+        blank=True,
+        related_name='monthly_costs',
+        verbose_name=_('pricing object'),
+    )
+    forecast = db.BooleanField(
+        verbose_name=_('forecast'),
+        default=False,
+    )
+    value = db.FloatField(verbose_name=_("value"), default=0)
+    cost = db.DecimalField(
+        max_digits=PRICE_DIGITS,
+        decimal_places=PRICE_PLACES,
+        default=0,
+        verbose_name=_("cost"),
+    )
+
+    class Meta:
+        verbose_name = _("monthly cost")
+        verbose_name_plural = _("monthly costs")
+        app_label = 'ralph_scrooge'
+
+    def __unicode__(self):
+        return '{} - {} ({})'.format(
+            self.service_environment_id,
+            self.type_id,
+            self.month,
+        )
+
+
 class CostDateStatus(WithConcurrentGetOrCreate, db.Model):
     date = db.DateField(
         verbose_name=_('date'),
@@ -122,3 +178,37 @@ class CostDateStatus(WithConcurrentGetOrCreate, db.Model):
         verbose_name = _("cost date status")
         verbose_name_plural = _("costs date status")
         app_label = 'ralph_scrooge'
+
+
+class CostInputChange(WithConcurrentGetOrCreate, db.Model):
+    """
+    Change of costs input (daily usages, usage prices, teams costs, extra
+    costs etc.) on single day, which makes calculated costs of type (and of
+    types depending on it) outdated. Used by incremental costs
+    recalculation (see `Collector.process_incremental`).
+    """
+    date = db.DateField(
+        verbose_name=_('date'),
+    )
+    type = db.ForeignKey(
+        'BaseUsage',
+        related_name='costs_inputs_changes',
+        verbose_name=_('type'),
+    )
+    forecast = db.BooleanField(
+        verbose_name=_('forecast'),
+        default=False,
+    )
+    modified = db.DateTimeField(
+        verbose_name=_('modified'),
+        default=datetime.datetime.now,
+    )
+
+    class Meta:
+        verbose_name = _("cost input change")
+        verbose_name_plural = _("costs inputs changes")
+        unique_together = ('date', 'forecast', 'type')
+        app_label = 'ralph_scrooge'
+
+    def __unicode__(self):
+        return '{} - {} ({})'.format(self.type_id, self.date, self.forecast)
@@ -203,6 +203,40 @@ class DailyPricingObject(db.Model):
         return '{} ({})'.format(self.pricing_object, self.date)
 
 
+class PricingObjectServiceChange(db.Model):
+    """
+    Log of changes of service environment of pricing objects - change at
+    date means that daily pricing object of previous day has different
+    service environment (see `ralph_scrooge.utils.service_changes`).
+    """
+    date = db.DateField(
+        verbose_name=_("date"),
+        db_index=True,
+    )
+    pricing_object = db.ForeignKey(
+        PricingObject,
+        verbose_name=_("pricing object"),
+        related_name='service_changes',
+    )
+    previous_service_environment = db.ForeignKey(
+        'ServiceEnvironment',
+        verbose_name=_("service environment before change"),
+        related_name='previous_pricing_objects_changes',
+    )
+    service_environment = db.ForeignKey(
+        'ServiceEnvironment',
+        verbose_name=_("service environment after change"),
+        related_name='pricing_objects_changes',
+    )
+
+    class Meta:
+        app_label = 'ralph_scrooge'
+        unique_together = ('pricing_object', 'date')
+
+    def __unicode__(self):
+        return '{} ({})'.format(self.pricing_object, self.date)
+
+
 class AssetInfo(PricingObject):
     sn = db.CharField(
         verbose_name=_("serial number"),
@@ -5,6 +5,8 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import logging
+from collections import defaultdict
 from datetime import date
 
 from django.core.validators import MaxValueValidator, MinValueValidator
@@ -24,6 +26,9 @@ from ralph_scrooge.models._history import (
 from ralph_scrooge.models.base import BaseUsage, BaseUsageType
 from ralph_scrooge.models.usage import DailyUsage
 from ralph_scrooge.models.pricing_object import PRICING_OBJECT_TYPES
+from ralph_scrooge.utils.common import memoize
+
+logger = logging.getLogger(__name__)
 
 
 class BusinessLine(Named.NonUnique):
@@ -251,21 +256,145 @@ class PricingService(BaseUsage):
         Returns pricing services, which resources (usage types) are used by
         this service (for given date).
         """
-        ps = PricingService.objects.filter(
-            serviceusagetypes__usage_type__id__in=DailyUsage.objects.filter(
-                type__usage_type='SU',
-                service_environment__in=ServiceEnvironment.objects.filter(
-                    service__in=self.services.all(),
-                ),
-                date=date,
-            ).values_list('type', flat=True).distinct()
-        )
-        ps = ps.exclude(excluded_services__in=self.services.all())
+        dependent_services = PricingServiceDependencyGraph.for_date(
+            date
+        ).get_dependent_services_ids(self.id)
         if exclude:
-            ps = ps.exclude(id__in=[p.id for p in exclude])
-        # exclude self to prevent cycle
-        ps = ps.exclude(id=self.id)
-        return ps.distinct()
+            dependent_services = dependent_services - set(
+                [p.id for p in exclude]
+            )
+        return PricingService.objects.filter(id__in=dependent_services)
+
+
+class PricingServiceDependencyGraph(object):
+    """
+    Graph of dependencies between pricing services for single date.
+
+    Pricing service A depends on pricing service B, if any of A's service
+    environments used (in given date) any of B's service usage types and none
+    of A's services is excluded from B. Pricing service never depends on
+    itself.
+
+    Graph is built using one (aggregated) query on daily usages, so it should
+    be used (through `for_date`) instead of querying for dependent services of
+    every pricing service separately.
+    """
+    def __init__(self, date):
+        self.date = date
+        self.dependencies = self._get_dependencies()
+        self.closure = self._get_closure()
+        self.cycles = set([
+            ps_id for ps_id, closure in self.closure.iteritems()
+            if ps_id in closure
+        ])
+        if self.cycles:
+            logger.warning(
+                'Cycle in pricing services dependencies ({}): {}'.format(
+                    date,
+                    sorted(self.cycles),
+                )
+            )
+
+    @classmethod
+    @memoize(skip_first=True)
+    def for_date(cls, date):
+        """
+        Returns (cached) dependency graph for date.
+        """
+        return cls(date)
+
+    def _get_dependencies(self):
+        """
+        Returns dict with pricing service id as a key and set of ids of
+        pricing services on which it depends as a value.
+        """
+        # pricing services (ids) per usage type
+        providers = defaultdict(set)
+        for usage_type_id, ps_id in ServiceUsageTypes.objects.values_list(
+            'usage_type',
+            'pricing_service',
+        ):
+            providers[usage_type_id].add(ps_id)
+
+        # pricing services (ids) excluded from charging (by pricing service)
+        excluded = defaultdict(set)
+        for ps_id, excluded_ps_id in (
+            PricingService.excluded_services.through.objects.filter(
+                service__pricing_service__isnull=False,
+            ).values_list('pricingservice', 'service__pricing_service')
+        ):
+            excluded[ps_id].add(excluded_ps_id)
+
+        dependencies = defaultdict(set)
+        for ps_id in PricingService.objects.values_list('id', flat=True):
+            dependencies[ps_id] = set()
+        for ps_id, usage_type_id in DailyUsage.objects.filter(
+            date=self.date,
+            type__usage_type='SU',
+            service_environment__service__pricing_service__isnull=False,
+        ).values_list(
+            'service_environment__service__pricing_service',
+            'type',
+        ).distinct():
+            dependencies[ps_id].update(
+                provider_id for provider_id in providers[usage_type_id]
+                if provider_id != ps_id and ps_id not in excluded[provider_id]
+            )
+        return dict(dependencies)
+
+    def _get_closure(self):
+        """
+        Returns transitive closure of dependencies (all pricing services on
+        which pricing service depends directly or indirectly).
+        """
+        closure = {}
+        for ps_id in self.dependencies:
+            visited = set()
+            to_visit = list(self.dependencies[ps_id])
+            while to_visit:
+                current = to_visit.pop()
+                if current not in visited:
+                    visited.add(current)
+                    to_visit.extend(self.dependencies.get(current, ()))
+            closure[ps_id] = visited
+        return closure
+
+    def get_dependent_services_ids(self, ps_id):
+        """
+        Returns ids of pricing services on which pricing service (directly)
+        depends.
+        """
+        return set(self.dependencies.get(ps_id, ()))
+
+    def get_all_dependent_services_ids(self, ps_id):
+        """
+        Returns ids of pricing services on which pricing service depends
+        directly or indirectly.
+        """
+        return set(self.closure.get(ps_id, ()))
+
+    def topological_order(self):
+        """
+        Returns ids of pricing services ordered in such way, that every
+        pricing service is after all pricing services on which it depends.
+        Pricing services in cycle (and depending on cycle) are at the end,
+        ordered by id.
+        """
+        result = []
+        done = set()
+        pending = set(self.dependencies.keys())
+        while pending:
+            ready = sorted(
+                ps_id for ps_id in pending
+                if self.dependencies[ps_id] <= done
+            )
+            if not ready:
+                result.extend(sorted(pending))
+                break
+            result.extend(ready)
+            done.update(ready)
+            pending.difference_update(ready)
+        return result
 
 
 class ServiceUsageTypes(db.Model):
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Common parts of OpenStack ceilometer collect plugins (MySQL and MongoDB).
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+import threading
+from functools import partial
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.db import connection
+
+from ralph_scrooge.models import (
+    DailyTenantInfo,
+    DailyUsage,
+    TenantInfo,
+    Warehouse,
+)
+from ralph_scrooge.utils.costs_changes import register_costs_input_change
+from ralph_scrooge.utils.costs_memo import clear_costs_memo
+
+
+logger = logging.getLogger(__name__)
+
+# max number of tenants ids listed in missing tenants summary
+MAX_MISSING_TENANTS_LOGGED = 100
+# sites could be processed in separate threads - usage types (created on
+# first use of flavor) are resolved by one thread at a time
+USAGE_TYPES_LOCK = threading.Lock()
+
+
+class TenantNotFoundError(Exception):
+    """
+    Raised when tenant info does not exist
+    """
+    pass
+
+
+class DailyTenantNotFoundError(Exception):
+    """
+    Raised when daily tenant info does not exist
+    """
+    pass
+
+
+class TenantIndex(object):
+    """
+    Index of tenants (and their daily tenants) for single day by OpenStack
+    tenant id. All tenants are fetched at once (instead of two queries per
+    every tenant).
+    """
+    def __init__(self, date):
+        self.date = date
+        self.tenants = set(
+            TenantInfo.objects.values_list('tenant_id', flat=True)
+        )
+        self.daily_tenants = dict(
+            (tenant_id, (daily_tenant_id, service_environment_id))
+            for tenant_id, daily_tenant_id, service_environment_id in (
+                DailyTenantInfo.objects.filter(date=date).values_list(
+                    'tenant_info__tenant_id',
+                    'dailypricingobject_ptr',
+                    'service_environment',
+                )
+            )
+        )
+
+    def get(self, tenant_id):
+        """
+        Returns tuple (daily pricing object id, service environment id) of
+        daily tenant.
+        """
+        # tenant id is stored as string
+        tenant_id = '{}'.format(tenant_id)
+        try:
+            return self.daily_tenants[tenant_id]
+        except KeyError:
+            if tenant_id in self.tenants:
+                raise DailyTenantNotFoundError(tenant_id)
+            raise TenantNotFoundError(tenant_id)
+
+
+class DailyUsagesWriter(object):
+    """
+    Collects daily usages and saves them in batches of
+    DAILY_USAGE_CREATE_BATCH_SIZE (using bulk create).
+    """
+    def __init__(self, date, warehouse):
+        self.date = date
+        self.warehouse = warehouse
+        self.batch = []
+        self.types = set()
+        self.saved = 0
+
+    def add(self, daily_pricing_object_id, service_environment_id,
+            usage_type, value):
+        self.batch.append(DailyUsage(
+            date=self.date,
+            service_environment_id=service_environment_id,
+            daily_pricing_object_id=daily_pricing_object_id,
+            value=value,
+            type=usage_type,
+            warehouse=self.warehouse,
+        ))
+        self.types.add(usage_type.id)
+        if len(self.batch) >= settings.DAILY_USAGE_CREATE_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            DailyUsage.objects.bulk_create(self.batch)
+            self.saved += len(self.batch)
+            self.batch = []
+
+
+def _log_missing(message, tenants_ids):
+    if tenants_ids:
+        logger.error('{}: {} ({})'.format(
+            message,
+            len(tenants_ids),
+            ', '.join(sorted(tenants_ids)[:MAX_MISSING_TENANTS_LOGGED]),
+        ))
+
+
+def save_usages(usages, date, warehouse, get_usage_type):
+    """
+    Save ceilometer usages (iterable of tuples (tenant id, flavor name,
+    value)) in batches. Usages of unknown tenants are skipped (and reported
+    in summary).
+
+    :returns tuple: number of saved usages and total number of usages
+    """
+    tenants = TenantIndex(date)
+    writer = DailyUsagesWriter(date, warehouse)
+    usage_types = {}
+    missing_tenants = set()
+    missing_daily_tenants = set()
+    total = 0
+    for tenant_id, flavor_name, value in usages:
+        total += 1
+        try:
+            daily_tenant_id, service_environment_id = tenants.get(tenant_id)
+        except TenantNotFoundError:
+            missing_tenants.add('{}'.format(tenant_id))
+            continue
+        except DailyTenantNotFoundError:
+            missing_daily_tenants.add('{}'.format(tenant_id))
+            continue
+        usage_type = usage_types.get(flavor_name)
+        if usage_type is None:
+            with USAGE_TYPES_LOCK:
+                usage_type = get_usage_type(flavor_name)
+            usage_types[flavor_name] = usage_type
+        writer.add(
+            daily_tenant_id,
+            service_environment_id,
+            usage_type,
+            value,
+        )
+    writer.flush()
+    _log_missing('Tenants not found', missing_tenants)
+    _log_missing(
+        'DailyTenants for date {} not found'.format(date),
+        missing_daily_tenants,
+    )
+    # signals are not sent on bulk operations
+    register_costs_input_change(writer.types, date, date)
+    clear_costs_memo()
+    return writer.saved, total
+
+
+def _process_site(collect_site, today, site):
+    logger.info(
+        "Processing OpenStack ceilometer {}".format(site['WAREHOUSE'])
+    )
+    try:
+        warehouse = Warehouse.objects.get(name=site['WAREHOUSE'])
+    except Warehouse.DoesNotExist:
+        logger.error('Invalid warehouse: {}'.format(
+            site['WAREHOUSE']
+        ))
+        return 0, 0
+    site_new, site_total = collect_site(site, today, warehouse)
+    logger.info(
+        '{} new, {} total ceilometer usages saved for {}'.format(
+            site_new,
+            site_total,
+            site['WAREHOUSE'],
+        )
+    )
+    return site_new, site_total
+
+
+def _process_site_in_thread(collect_site, today, site):
+    try:
+        return _process_site(collect_site, today, site)
+    finally:
+        # every thread has its own database connection
+        connection.close()
+
+
+def process_sites(today, collect_site):
+    """
+    Collect usages (using `collect_site(site, today, warehouse)`) of every
+    site from OPENSTACK_CEILOMETER. Sites are processed in separate threads
+    if OPENSTACK_CEILOMETER_THREADS is greater than 1.
+
+    :returns tuple: number of saved usages and total number of usages
+    """
+    sites = settings.OPENSTACK_CEILOMETER
+    threads = min(settings.OPENSTACK_CEILOMETER_THREADS, len(sites))
+    if threads > 1:
+        pool = ThreadPool(threads)
+        try:
+            results = pool.map(
+                partial(_process_site_in_thread, collect_site, today),
+                sites,
+            )
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [
+            _process_site(collect_site, today, site) for site in sites
+        ]
+    return (
+        sum(site_new for site_new, site_total in results),
+        sum(site_total for site_new, site_total in results),
+    )
@@ -8,7 +8,8 @@ from __future__ import unicode_literals
 import logging
 from decimal import Decimal as D
 
-from django.db import IntegrityError
+from django.conf import settings
+from django.db import connection, IntegrityError
 from django.db.transaction import commit_on_success
 
 from ralph.util import plugin
@@ -16,6 +17,7 @@ from ralph_assets.api_scrooge import get_assets
 from ralph_scrooge.models import (
     AssetInfo,
     DailyAssetInfo,
+    DailyPricingObject,
     DailyUsage,
     PricingObjectModel,
     PRICING_OBJECT_TYPES,
@@ -24,6 +26,9 @@ from ralph_scrooge.models import (
     UsageType,
     Warehouse,
 )
+from ralph_scrooge.utils.common import chunks
+from ralph_scrooge.utils.costs_changes import register_costs_input_change
+from ralph_scrooge.utils.costs_memo import clear_costs_memo
 
 
 logger = logging.getLogger(__name__)
@@ -232,6 +237,331 @@ def update_assets(data, date, usages):
     return new_created
 
 
+def _get_asset_values(data, service_environment_id, warehouse_id, model_id):
+    return {
+        'model_id': model_id,
+        'service_environment_id': service_environment_id,
+        'name': data['asset_name'],
+        'warehouse_id': warehouse_id,
+        'sn': data['sn'],
+        'barcode': data['barcode'],
+        'device_id': data['device_id'],
+    }
+
+
+def _bulk_create_daily_asset_infos(date, daily_asset_infos):
+    """
+    Create DailyAssetInfo objects in bulk.
+
+    Django (1.4) doesn't support bulk_create of inherited models, so parent
+    (DailyPricingObject) rows are created in bulk first (unless they already
+    exist) and then DailyAssetInfo rows are inserted using raw SQL.
+    """
+    def get_parents(pricing_objects_ids):
+        result = {}
+        for ids in chunks(pricing_objects_ids, settings.IN_QUERY_BATCH_SIZE):
+            result.update(DailyPricingObject.objects.filter(
+                date=date,
+                pricing_object__in=ids,
+            ).values_list('pricing_object_id', 'id'))
+        return result
+
+    parents = get_parents([dai.pricing_object_id for dai in daily_asset_infos])
+    missing = [
+        dai for dai in daily_asset_infos
+        if dai.pricing_object_id not in parents
+    ]
+    DailyPricingObject.objects.bulk_create([
+        DailyPricingObject(
+            date=date,
+            pricing_object_id=dai.pricing_object_id,
+            service_environment_id=dai.service_environment_id,
+        ) for dai in missing
+    ])
+    parents.update(get_parents([dai.pricing_object_id for dai in missing]))
+
+    fields = DailyAssetInfo._meta.local_fields
+    query = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(DailyAssetInfo._meta.db_table),
+        ', '.join(connection.ops.quote_name(f.column) for f in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    rows = []
+    for dai in daily_asset_infos:
+        dai.pk = dai.id = parents[dai.pricing_object_id]
+        dai.calc_costs()
+        rows.append([
+            f.get_db_prep_save(getattr(dai, f.attname), connection=connection)
+            for f in fields
+        ])
+    connection.cursor().executemany(query, rows)
+
+
+class AssetsBatchUpdater(object):
+    """
+    Update assets (and their daily usages) in batches.
+
+    Services environments, warehouses, models and unique values (SN, barcode,
+    device id) of assets are loaded once. Existing asset infos, daily asset
+    infos and daily usages are loaded for every batch of assets - only new or
+    changed objects are saved (daily asset infos and daily usages are created
+    in bulk).
+    """
+    unique_fields = ['sn', 'barcode', 'device_id']
+
+    def __init__(self, date, usages):
+        self.date = date
+        self.usages = usages
+        self.service_environments = dict(
+            ((service_ci_id, environment_ci_id), se_id)
+            for service_ci_id, environment_ci_id, se_id in (
+                ServiceEnvironment.objects.values_list(
+                    'service__ci_id',
+                    'environment__ci_id',
+                    'id',
+                )
+            )
+        )
+        self.warehouses = dict(
+            Warehouse.objects.values_list('id_from_assets', 'id')
+        )
+        self.models = dict(PricingObjectModel.objects.filter(
+            type=PRICING_OBJECT_TYPES.ASSET,
+        ).values_list('model_id', 'id'))
+        # asset id of asset having every (not null) unique value
+        self.unique_values = dict((f, {}) for f in self.unique_fields)
+        for values in AssetInfo.objects.values_list(
+            'asset_id',
+            *self.unique_fields
+        ):
+            for field, value in zip(self.unique_fields, values[1:]):
+                if value is not None:
+                    self.unique_values[field][value] = values[0]
+
+    def _clear_duplicates(self, asset_info, values):
+        """
+        Null unique values of other assets, which are duplicated by new
+        values of asset_info (the same as in `get_asset_info`, but without
+        IntegrityError).
+        """
+        for field in self.unique_fields:
+            previous = getattr(asset_info, field)
+            if (
+                previous is not None and
+                self.unique_values[field].get(previous) == asset_info.asset_id
+            ):
+                del self.unique_values[field][previous]
+            value = values[field]
+            if value is None:
+                continue
+            owner = self.unique_values[field].get(value)
+            if owner is not None and owner != asset_info.asset_id:
+                logger.error('Duplicated {} ({}) on assets {} and {}'.format(
+                    field,
+                    value,
+                    asset_info.asset_id,
+                    owner,
+                ))
+                AssetInfo.objects.filter(
+                    asset_id=owner,
+                    **{field: value}
+                ).update(**{field: None})
+            self.unique_values[field][value] = asset_info.asset_id
+
+    def _update_asset_infos(self, assets):
+        """
+        Create or update asset infos. Returns list of tuples (asset info,
+        data, created) of valid assets.
+        """
+        existing = {}
+        for ids in chunks(
+            [data['asset_id'] for data in assets],
+            settings.IN_QUERY_BATCH_SIZE,
+        ):
+            for asset_info in AssetInfo.objects.filter(asset_id__in=ids):
+                existing[asset_info.asset_id] = asset_info
+        result = []
+        for data in assets:
+            try:
+                service_environment_id = self.service_environments[
+                    (data['service_id'], data['environment_id'])
+                ]
+            except KeyError:
+                logger.error(
+                    'Asset {}: Service environment {} - {} does not '
+                    'exist'.format(
+                        data['asset_id'],
+                        data['service_id'],
+                        data['environment_id'],
+                    )
+                )
+                continue
+            try:
+                warehouse_id = self.warehouses[data['warehouse_id']]
+            except KeyError:
+                logger.error('Warehouse {0} does not exist'.format(
+                    data['warehouse_id']
+                ))
+                continue
+            try:
+                model_id = self.models[data['model_id']]
+            except KeyError:
+                raise PricingObjectModel.DoesNotExist(
+                    'PricingObjectModel matching query does not exist.'
+                )
+            values = _get_asset_values(
+                data,
+                service_environment_id,
+                warehouse_id,
+                model_id,
+            )
+            asset_info = existing.get(data['asset_id'])
+            created = asset_info is None
+            if created:
+                asset_info = AssetInfo(
+                    asset_id=data['asset_id'],
+                    type_id=PRICING_OBJECT_TYPES.ASSET,
+                )
+            if created or any(
+                getattr(asset_info, k) != v for k, v in values.iteritems()
+            ):
+                self._clear_duplicates(asset_info, values)
+                for field, value in values.iteritems():
+                    setattr(asset_info, field, value)
+                asset_info.save()
+                existing[asset_info.asset_id] = asset_info
+            result.append((asset_info, data, created))
+        return result
+
+    def _update_daily_asset_infos(self, assets):
+        """
+        Create or update daily asset infos. Returns dict with daily asset
+        info for every asset info id.
+        """
+        existing = {}
+        for ids in chunks(
+            [asset_info.id for asset_info, data, created in assets],
+            settings.IN_QUERY_BATCH_SIZE,
+        ):
+            for daily_asset_info in DailyAssetInfo.objects.filter(
+                date=self.date,
+                asset_info__in=ids,
+            ):
+                existing[daily_asset_info.asset_info_id] = daily_asset_info
+        new_daily_asset_infos = []
+        for asset_info, data, created in assets:
+            values = {
+                'service_environment_id': asset_info.service_environment_id,
+                'depreciation_rate': D(str(data['depreciation_rate'])),
+                'is_depreciated': data['is_depreciated'],
+                'price': D(str(data['price'] or 0)),
+            }
+            daily_asset_info = existing.get(asset_info.id)
+            if daily_asset_info is None:
+                daily_asset_info = DailyAssetInfo(
+                    date=self.date,
+                    pricing_object_id=asset_info.id,
+                    asset_info_id=asset_info.id,
+                    **values
+                )
+                new_daily_asset_infos.append(daily_asset_info)
+                existing[asset_info.id] = daily_asset_info
+            elif any(
+                getattr(daily_asset_info, k) != v
+                for k, v in values.iteritems()
+            ):
+                for field, value in values.iteritems():
+                    setattr(daily_asset_info, field, value)
+                daily_asset_info.save()
+        if new_daily_asset_infos:
+            _bulk_create_daily_asset_infos(self.date, new_daily_asset_infos)
+        return existing
+
+    def _update_usages(self, assets, daily_asset_infos):
+        """
+        Create or update daily usages of assets. Changed usages are removed
+        and created again (with other new usages) in bulk.
+        """
+        types_ids = [usage_type.id for usage_type in self.usages.values()]
+        existing = {}
+        for ids in chunks(
+            [dai.id for dai in daily_asset_infos.values()],
+            settings.IN_QUERY_BATCH_SIZE,
+        ):
+            for usage_id, type_id, dpo_id, value, se_id, warehouse_id in (
+                DailyUsage.objects.filter(
+                    date=self.date,
+                    type__in=types_ids,
+                    daily_pricing_object__in=ids,
+                ).values_list(
+                    'id',
+                    'type_id',
+                    'daily_pricing_object_id',
+                    'value',
+                    'service_environment_id',
+                    'warehouse_id',
+                )
+            ):
+                existing[(type_id, dpo_id)] = (
+                    usage_id,
+                    (value, se_id, warehouse_id),
+                )
+        to_delete = []
+        to_create = []
+        for asset_info, data, created in assets:
+            daily_asset_info = daily_asset_infos[asset_info.id]
+            daily_asset_info.calc_costs()
+            for usage, value in (
+                ('depreciation', daily_asset_info.daily_cost),
+                ('assets_count', 1),
+                ('cores_count', data['cores_count']),
+                ('power_consumption', data['power_consumption']),
+                ('collocation', data['collocation']),
+            ):
+                type_id = self.usages[usage].id
+                value = float(value or 0)
+                usage_id, previous = existing.get(
+                    (type_id, daily_asset_info.id),
+                    (None, None),
+                )
+                current = (
+                    value,
+                    daily_asset_info.service_environment_id,
+                    asset_info.warehouse_id,
+                )
+                if previous == current:
+                    continue
+                if usage_id is not None:
+                    to_delete.append(usage_id)
+                to_create.append(DailyUsage(
+                    date=self.date,
+                    type_id=type_id,
+                    daily_pricing_object_id=daily_asset_info.id,
+                    service_environment_id=current[1],
+                    warehouse_id=current[2],
+                    value=value,
+                ))
+        cursor = connection.cursor()
+        for ids in chunks(to_delete, settings.IN_QUERY_BATCH_SIZE):
+            cursor.execute('DELETE FROM {} WHERE id IN ({})'.format(
+                DailyUsage._meta.db_table,
+                ', '.join(['%s'] * len(ids)),
+            ), ids)
+        DailyUsage.objects.bulk_create(to_create)
+
+    @commit_on_success
+    def update(self, assets):
+        """
+        Update batch of assets. Returns tuple with number of new and updated
+        assets.
+        """
+        assets = self._update_asset_infos(assets)
+        daily_asset_infos = self._update_daily_asset_infos(assets)
+        self._update_usages(assets, daily_asset_infos)
+        new = sum(1 for asset_info, data, created in assets if created)
+        return new, len(assets) - new
+
+
 def get_usage(symbol, name, by_warehouse, by_cost, average, type):
     """
     Creates power consumption usage type if not created.
@@ -327,6 +657,29 @@ def asset(**kwargs):
     }
 
     new = update = total = 0
+    if settings.ASSET_COLLECT_BATCH_SIZE:
+        updater = AssetsBatchUpdater(date, usages)
+        for assets in chunks(
+            get_assets(date),
+            settings.ASSET_COLLECT_BATCH_SIZE,
+        ):
+            total += len(assets)
+            batch_new, batch_updated = updater.update(assets)
+            new += batch_new
+            update += batch_updated
+        # signals are not sent on bulk operations
+        register_costs_input_change(
+            [usage_type.id for usage_type in usages.values()],
+            date,
+            date,
+        )
+        clear_costs_memo()
+        return True, '{0} new, {1} updated, {2} total'.format(
+            new,
+            update,
+            total,
+        )
+
     for data in get_assets(date):
         total += 1
         try:
@@ -348,5 +701,9 @@ def asset(**kwargs):
                 data['warehouse_id']
             ))
             continue
-
+    register_costs_input_change(
+        [usage_type.id for usage_type in usages.values()],
+        date,
+        date,
+    )
     return True, '{0} new, {1} updated, {2} total'.format(new, update, total)
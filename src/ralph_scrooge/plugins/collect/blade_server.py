@@ -15,6 +15,7 @@ from ralph_scrooge.models import (
     DailyUsage,
     UsageType,
 )
+from ralph_scrooge.utils.costs_changes import register_costs_input_change
 
 logger = logging.getLogger(__name__)
 
@@ -99,6 +100,7 @@ def blade_server(today, **kwargs):
                 )
             )
         total += 1
+    register_costs_input_change([usage_type.id], today, today)
     return (
         True,
         '{} new Blade Servers usages, {} updated, {} total'.format(
@@ -5,12 +5,15 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import bisect
 import logging
 import ipaddr
-from collections import defaultdict
+from collections import defaultdict, deque
+from multiprocessing.pool import ThreadPool
 
 import paramiko
 from django.conf import settings
+from django.db import connection
 
 from ralph.util import plugin
 from ralph_scrooge.models import (
@@ -21,6 +24,9 @@ from ralph_scrooge.models import (
     ServiceEnvironment,
     UsageType,
 )
+from ralph_scrooge.utils.common import chunks
+from ralph_scrooge.utils.costs_changes import register_costs_input_change
+from ralph_scrooge.utils.costs_memo import clear_costs_memo
 
 
 logger = logging.getLogger(__name__)
@@ -48,6 +54,57 @@ class ServiceDoesNotExistError(Exception):
     pass
 
 
+class NetworkIndex(object):
+    """
+    Index of IPv4 networks (ex. NFSEN_CLASS_ADDRESS) for classification of IP
+    addresses.
+
+    Networks are merged into sorted, disjoint ranges of integers, so checking
+    if address belongs to any of networks is a single binary search, without
+    creating ipaddr objects for every address and network.
+    """
+    def __init__(self, class_addresses):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(
+            (int(network.network), int(network.broadcast))
+            for network in map(ipaddr.IPv4Network, class_addresses)
+        ):
+            if self.ends and start <= self.ends[-1] + 1:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    @classmethod
+    def ip_to_int(cls, ip_address):
+        """
+        Convert IPv4 address (dotted string) to integer.
+
+        >>> NetworkIndex.ip_to_int('10.0.1.2')
+        167772418
+        """
+        octets = ip_address.split('.')
+        if len(octets) != 4:
+            raise ValueError('Invalid IPv4 address: {}'.format(ip_address))
+        result = 0
+        for octet in octets:
+            octet = int(octet)
+            if not 0 <= octet <= 255:
+                raise ValueError(
+                    'Invalid IPv4 address: {}'.format(ip_address)
+                )
+            result = (result << 8) | octet
+        return result
+
+    def __contains__(self, ip_address):
+        if not self.starts:
+            return False
+        ip = self.ip_to_int(ip_address)
+        i = bisect.bisect_right(self.starts, ip) - 1
+        return i >= 0 and ip <= self.ends[i]
+
+
 def get_ssh_client(address, login, password):
     """
     Create ssh client and connect them to give address by using given
@@ -115,8 +172,9 @@ def execute_nfdump(
     :param list file_names: List with file names from remote server. This
     files contains trafic statistics.
     :param string input_output: Define direct of trafic (srcip or dstip)
-    :returns list: list of rows from stdout from remote server
-    :rtype list:
+    :returns generator: rows from stdout from remote server (without header
+    and summary), read line by line
+    :rtype generator:
     """
     def get_networks(input_output):
         direct = input_output.replace('ip', '')
@@ -143,7 +201,15 @@ def execute_nfdump(
     )
     logger.debug(nfdump_str)
     stdin, stdout, stderr = ssh_client.exec_command(nfdump_str)
-    return stdout.readlines()[1:-4]
+    # skip header (first line) and summary (last 4 lines) of nfdump output
+    # without reading whole output into memory
+    lines = iter(stdout)
+    next(lines, None)
+    tail = deque()
+    for line in lines:
+        tail.append(line)
+        if len(tail) > 4:
+            yield tail.popleft()
 
 
 def extract_ip_and_bytes(row, input_output, class_addresses):
@@ -156,6 +222,8 @@ def extract_ip_and_bytes(row, input_output, class_addresses):
     :param string row: Single row gain from remote server by execute nfdump
     commands
     :param string input_output: Define which address will be take
+    :param class_addresses: list of networks or NetworkIndex (should be
+    built once for many rows)
     :returns tuple: Pair ip_address with usage in bytes or None
     :rtype tuple:
     """
@@ -184,9 +252,10 @@ def extract_ip_and_bytes(row, input_output, class_addresses):
         ip_address = split_row[1]
         port = split_row[3]
 
-    for class_address in class_addresses:
-        if ipaddr.IPv4Address(ip_address) in ipaddr.IPv4Network(class_address):
-            return (ip_address, port, unification(split_row[-1]))
+    if not isinstance(class_addresses, NetworkIndex):
+        class_addresses = NetworkIndex(class_addresses)
+    if ip_address in class_addresses:
+        return (ip_address, port, unification(split_row[-1]))
 
 
 def get_network_usage(
@@ -216,6 +285,7 @@ def get_network_usage(
     :rtype dict:
     """
     ip_and_bytes = defaultdict(int)
+    network_index = NetworkIndex(class_addresses)
     for row in execute_nfdump(
         ssh_client,
         channel,
@@ -224,7 +294,7 @@ def get_network_usage(
         input_output,
         class_addresses
     ):
-        ip_and_byte = extract_ip_and_bytes(row, input_output, class_addresses)
+        ip_and_byte = extract_ip_and_bytes(row, input_output, network_index)
         if ip_and_byte:
             ip_and_bytes[(ip_and_byte[0], ip_and_byte[1])] += ip_and_byte[2]
     return ip_and_bytes
@@ -240,30 +310,75 @@ def get_network_usages(date, class_addresses):
         ...
     }
 
+    Servers, channels and directions (src/dst) are processed concurrently
+    using at most NFSEN_MAX_SESSIONS SSH sessions (commands executed at the
+    same time); single SSH connection is opened for every server.
+
     :param datetime date: Date for which usages will collects
     :returns dict: list of ips with usages from given date
     :rtype dict:
     """
     logger.debug('Getting network usages per IP')
     network_usages = defaultdict(int)
-    for address, credentials in settings.SSH_NFSEN_CREDENTIALS.iteritems():
-        ssh_client = get_ssh_client(address, **credentials)
-        for channel in settings.NFSEN_CHANNELS:
+    pool = ThreadPool(max(settings.NFSEN_MAX_SESSIONS, 1))
+    ssh_clients = {}
+
+    def connect(server):
+        address, credentials = server
+        ssh_clients[address] = get_ssh_client(address, **credentials)
+
+    def get_files(channel):
+        address, channel_name = channel
+        return get_names_of_data_files(
+            ssh_clients[address],
+            channel_name,
+            date,
+        )
+
+    def get_usage(task):
+        address, channel_name, file_names, input_output = task
+        logger.debug("Server:{0} Channel:{1} I/O:{2}".format(
+            address, channel_name, input_output[0]))
+        return get_network_usage(
+            ssh_clients[address],
+            channel_name,
+            date,
+            file_names,
+            input_output,
+            class_addresses,
+        )
+
+    try:
+        pool.map(connect, settings.SSH_NFSEN_CREDENTIALS.items())
+        channels = [
+            (address, channel_name)
+            for address in settings.SSH_NFSEN_CREDENTIALS
+            for channel_name in settings.NFSEN_CHANNELS
+        ]
+        tasks = []
+        for (address, channel_name), file_names in zip(
+            channels,
+            pool.map(get_files, channels),
+        ):
+            if not file_names:
+                logger.warning('No data files for {} on {}'.format(
+                    channel_name,
+                    address,
+                ))
+                continue
             for input_output in [
                 ('src', 'srcip,srcport'),
                 ('dst', 'dstip,dstport')
             ]:
-                logger.debug("Server:{0} Channel:{1} I/O:{2}".format(
-                    address, channel, input_output[0]))
-                for ip, value in get_network_usage(
-                    ssh_client,
-                    channel,
-                    date,
-                    get_names_of_data_files(ssh_client, channel, date),
-                    input_output,
-                    class_addresses,
-                ).iteritems():
-                    network_usages[ip] += value
+                tasks.append((address, channel_name, file_names, input_output))
+        # usages are aggregated as soon as single nfdump is finished
+        for usages in pool.imap_unordered(get_usage, tasks):
+            for ip, value in usages.iteritems():
+                network_usages[ip] += value
+    finally:
+        pool.terminate()
+        for ssh_client in ssh_clients.values():
+            ssh_client.close()
     return network_usages
 
 
@@ -288,6 +403,34 @@ def _group_by_ip(usages):
     return grouped_usages
 
 
+def _get_pricing_objects():
+    """
+    Returns tuple (pricing object id, service environment id) of every IP
+    address pricing object (by name).
+    """
+    result = {}
+    for name, po_id, se_id in PricingObject.objects.filter(
+        type_id=PRICING_OBJECT_TYPES.IP_ADDRESS,
+    ).order_by('-id').values_list('name', 'id', 'service_environment_id'):
+        # use first pricing object if there are more with the same name
+        result[name] = (po_id, se_id)
+    return result
+
+
+def _get_daily_pricing_objects(date):
+    """
+    Returns tuple (daily pricing object id, service environment id) of every
+    IP address daily pricing object for date (by pricing object id).
+    """
+    return dict(
+        (po_id, (dpo_id, se_id))
+        for dpo_id, po_id, se_id in DailyPricingObject.objects.filter(
+            date=date,
+            pricing_object__type_id=PRICING_OBJECT_TYPES.IP_ADDRESS,
+        ).values_list('id', 'pricing_object_id', 'service_environment_id')
+    )
+
+
 def update(
     network_usages,
     usage_type,
@@ -297,6 +440,10 @@ def update(
     """
     Create or update daily usage
 
+    Pricing objects, daily pricing objects and daily usages are loaded in
+    single queries and missing ones are created in bulk (instead of few
+    queries per IP address).
+
     :param dict network_usages: Usages per IP
     :param object usage_type: UsageType object
     :param datetime date: Date for which dailyusage will be update
@@ -304,49 +451,91 @@ def update(
     :rtype list:
     """
     logger.debug('Saving usages as a daily usages per service')
-    new = updated = total = 0
-
-    for ip, value in _group_by_ip(network_usages).iteritems():
-        total += 1
-        pricing_object, created = PricingObject.objects.get_or_create(
-            name=ip,
-            type_id=PRICING_OBJECT_TYPES.IP_ADDRESS,
-            defaults=dict(
-                service_environment=default_service_environment,
-            )
+    usages = _group_by_ip(network_usages)
+    total = len(usages)
+
+    pricing_objects = _get_pricing_objects()
+    new_ips = [ip for ip in usages if ip not in pricing_objects]
+    for ip in new_ips:
+        logger.warning(
+            'Unknown ip address {} (usage: {})'.format(ip, usages[ip])
         )
-        daily_pricing_object = DailyPricingObject.objects.get_or_create(
-            date=date,
-            pricing_object=pricing_object,
-            defaults=dict(
-                service_environment=pricing_object.service_environment,
-            )
-        )[0]
-        daily_usage, usage_created = DailyUsage.objects.get_or_create(
+    for ips in chunks(new_ips, settings.DAILY_USAGE_CREATE_BATCH_SIZE):
+        PricingObject.objects.bulk_create([
+            PricingObject(
+                name=ip,
+                type_id=PRICING_OBJECT_TYPES.IP_ADDRESS.id,
+                service_environment=default_service_environment,
+            ) for ip in ips
+        ])
+    if new_ips:
+        # bulk_create doesn't set ids of created objects
+        pricing_objects = _get_pricing_objects()
+
+    daily_pricing_objects = _get_daily_pricing_objects(date)
+    missing = set(
+        pricing_objects[ip][0] for ip in usages
+    ) - set(daily_pricing_objects)
+    if missing:
+        services_environments = dict(pricing_objects.values())
+        for pricing_objects_ids in chunks(
+            missing,
+            settings.DAILY_USAGE_CREATE_BATCH_SIZE,
+        ):
+            DailyPricingObject.objects.bulk_create([
+                DailyPricingObject(
+                    date=date,
+                    pricing_object_id=po_id,
+                    service_environment_id=services_environments[po_id],
+                ) for po_id in pricing_objects_ids
+            ])
+        daily_pricing_objects = _get_daily_pricing_objects(date)
+
+    # previous usages are replaced by new ones with summed values
+    previous_usages = DailyUsage.objects.filter(
+        date=date,
+        type=usage_type,
+        daily_pricing_object__pricing_object__type_id=(
+            PRICING_OBJECT_TYPES.IP_ADDRESS
+        ),
+    ).values_list('id', 'daily_pricing_object_id', 'value')
+    previous_values = defaultdict(int)
+    previous_ids = []
+    for du_id, dpo_id, value in previous_usages:
+        previous_ids.append(du_id)
+        previous_values[dpo_id] += value
+    cursor = connection.cursor()
+    for ids in chunks(previous_ids, settings.IN_QUERY_BATCH_SIZE):
+        cursor.execute('DELETE FROM {} WHERE id IN ({})'.format(
+            DailyUsage._meta.db_table,
+            ', '.join(['%s'] * len(ids)),
+        ), ids)
+
+    daily_usages = []
+    for ip, value in usages.iteritems():
+        dpo_id, se_id = daily_pricing_objects[pricing_objects[ip][0]]
+        daily_usages.append(DailyUsage(
             date=date,
             type=usage_type,
-            daily_pricing_object=daily_pricing_object,
-            defaults=dict(
-                service_environment=daily_pricing_object.service_environment,
-            ),
-        )
-        daily_usage.service_environment = (
-            daily_pricing_object.service_environment
-        )
-        daily_usage.value += value
-        daily_usage.save()
-        if created:
-            logger.warning(
-                'Unknown ip address {} (usage: {})'.format(ip, value)
-            )
-        new += created
-        updated += not created
-    return (new, updated, total)
+            daily_pricing_object_id=dpo_id,
+            service_environment_id=se_id,
+            value=previous_values[dpo_id] + value,
+        ))
+    for batch in chunks(daily_usages, settings.DAILY_USAGE_CREATE_BATCH_SIZE):
+        DailyUsage.objects.bulk_create(batch)
+    return (len(new_ips), total - len(new_ips), total)
 
 
 def delete_previous_usages(date):
+    # raw SQL is used, because Django (1.4) fetches every deleted object to
+    # send signals
     usage_type = get_usage_type()
-    DailyUsage.objects.filter(type=usage_type, date=date).delete()
+    connection.cursor().execute(
+        'DELETE FROM {} WHERE date=%s AND type_id=%s'.format(
+            DailyUsage._meta.db_table,
+        ),
+        [date, usage_type.id],
+    )
 
 
 @plugin.register(chain='scrooge', requires=['service'])
@@ -372,13 +561,17 @@ def netflow(**kwargs):
         return False, 'Unknown service environment for netflow not configured'
 
     date = kwargs['today']
+    usage_type = get_usage_type()
     delete_previous_usages(date)
     new, updated, total = update(
         get_network_usages(date, settings.NFSEN_CLASS_ADDRESS),
-        get_usage_type(),
+        usage_type,
         default_service,
         date,
     )
+    # signals are not sent on bulk operations
+    register_costs_input_change([usage_type.id], date, date)
+    clear_costs_memo()
 
     return True, '{0} new, {1} updated, {2} total'.format(
         new,
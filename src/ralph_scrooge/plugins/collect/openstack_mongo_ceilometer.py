@@ -13,13 +13,12 @@ from ralph_scrooge.utils.common import memoize
 from pymongo import MongoClient
 
 from ralph.util import plugin
-from ralph_scrooge.models import (
-    DailyTenantInfo,
-    DailyUsage,
-    TenantInfo,
-    UsageType,
-    Warehouse
+from ralph_scrooge.models import DailyUsage, UsageType
+from ralph_scrooge.plugins.collect._ceilometer import (
+    process_sites,
+    save_usages,
 )
+from ralph_scrooge.utils.costs_changes import register_costs_input_change
 
 
 logger = logging.getLogger(__name__)
@@ -27,20 +26,6 @@ logger = logging.getLogger(__name__)
 METRIC_TMPL = 'openstack.{}'
 
 
-class TenantNotFoundError(Exception):
-    """
-    Raised when tenant info does not exist
-    """
-    pass
-
-
-class DailyTenantNotFoundError(Exception):
-    """
-    Raised when daily tenant info does not exist
-    """
-    pass
-
-
 @memoize
 def get_usage_type(flavor_name):
     usage_name = METRIC_TMPL.format(flavor_name)
@@ -56,25 +41,36 @@ def get_usage_type(flavor_name):
 
 
 @memoize
-def get_daily_tenant(tenant_id, date):
-    try:
-        tenant = TenantInfo.objects.get(tenant_id=tenant_id)
-        return tenant.daily_tenants.get(date=date)
-    except TenantInfo.DoesNotExist as e:
-        raise TenantNotFoundError(e)
-    except DailyTenantInfo.DoesNotExist as e:
-        raise DailyTenantNotFoundError(e)
+def get_client(connection_string):
+    """
+    Returns MongoDB client (with connections pool) for ceilometer database
+    - client is shared by every call for the same connection string.
+    """
+    return MongoClient(connection_string)
+
+
+def _aggregate(db, pipeline):
+    """
+    Returns cursor over aggregation results (instead of list of all results
+    at once). Aggregation could use temporary files on MongoDB server.
+    """
+    return db.meter.aggregate(
+        pipeline,
+        allowDiskUse=True,
+        cursor={'batchSize': settings.OPENSTACK_CEILOMETER_BATCH_SIZE},
+    )
 
 
 def get_ceilometer_usages(date, connection_string):
     """
-    Function which talks with openstack
+    Function which talks with openstack. Returns cursors of cumulative, gauge
+    and delta usages (results are streamed in batches of
+    OPENSTACK_CEILOMETER_BATCH_SIZE).
     """
     today = datetime.datetime.combine(date, datetime.datetime.min.time())
     yesterday = today - datetime.timedelta(days=1)
-    client = MongoClient(connection_string)
-    db = client.ceilometer
-    cumulative_data = db.meter.aggregate([
+    db = get_client(connection_string).ceilometer
+    cumulative_data = _aggregate(db, [
         {
             "$match": {
                 "timestamp": {"$gt": yesterday, "$lt": today},
@@ -103,7 +99,7 @@ def get_ceilometer_usages(date, connection_string):
             }
         },
     ])
-    gauge_data = db.meter.aggregate([
+    gauge_data = _aggregate(db, [
         {
             "$match": {
                 "timestamp": {"$gt": yesterday, "$lt": today},
@@ -126,7 +122,7 @@ def get_ceilometer_usages(date, connection_string):
             }
         },
     ])
-    delta_data = db.meter.aggregate([
+    delta_data = _aggregate(db, [
         {
             "$match": {
                 "timestamp": {"$gt": yesterday, "$lt": today},
@@ -154,42 +150,46 @@ def save_ceilometer_usages(
     date,
     warehouse
 ):
-    new = total = 0
-    for item in chain(cumulative_data, gauge_data, delta_data):
-        tenant_id = item['_id']['project_id']
-        flavor_name = item['_id']['counter_name']
-        value = item['value']
-        total += 1
-        usage_type = get_usage_type(flavor_name)
-        try:
-            daily_tenant = get_daily_tenant(tenant_id, date)
-        except TenantNotFoundError:
-            logger.error('Tenant {} not found'.format(tenant_id))
-            continue
-        except DailyTenantNotFoundError:
-            logger.error('DailyTenant {} for date {} not found'.format(
-                tenant_id,
-                date,
-            ))
-            continue
-        DailyUsage(
-            date=date,
-            service_environment=daily_tenant.service_environment,
-            daily_pricing_object=daily_tenant,
-            value=value,  # ceilometer usages are saved each 10 minutes
-            type=usage_type,
-            warehouse=warehouse,
-        ).save()
-        new += 1
-    return new, total
+    return save_usages(
+        (
+            (
+                item['_id']['project_id'],
+                item['_id']['counter_name'],
+                item['value'],
+            )
+            for item in chain(cumulative_data, gauge_data, delta_data)
+        ),
+        date,
+        warehouse,
+        get_usage_type,
+    )
 
 
 def clear_ceilometer_stats(date):
     logger.debug('Clearing ceilometer records for {}'.format(date))
-    DailyUsage.objects.filter(
+    usages = DailyUsage.objects.filter(
         type__symbol__startswith=METRIC_TMPL.format(''),
         date=date,
-    ).delete()
+    )
+    register_costs_input_change(
+        set(usages.values_list('type_id', flat=True)),
+        date,
+        date,
+    )
+    usages.delete()
+
+
+def _collect_site(site, today, warehouse):
+    cumulative_data, gauge_data, delta_data = get_ceilometer_usages(
+        today, site['CEILOMETER_CONNECTION']
+    )
+    return save_ceilometer_usages(
+        cumulative_data,
+        gauge_data,
+        delta_data,
+        today,
+        warehouse,
+    )
 
 
 @plugin.register(chain='scrooge', requires=['service', 'tenant'])
@@ -198,37 +198,5 @@ def openstack_mongo_ceilometer(today, **kwargs):
     Pricing plugin for openstack ceilometer.
     """
     clear_ceilometer_stats(today)
-    new = total = 0
-    for site in settings.OPENSTACK_CEILOMETER:
-        logger.info(
-            "Processing OpenStack ceilometer {}".format(site['WAREHOUSE'])
-        )
-        try:
-            warehouse = Warehouse.objects.get(name=site['WAREHOUSE'])
-        except Warehouse.DoesNotExist:
-            logger.error('Invalid warehouse: {}'.format(
-                site['WAREHOUSE']
-            ))
-            continue
-        cumulative_data, gauge_data, delta_data = get_ceilometer_usages(
-            today, site['CEILOMETER_CONNECTION']
-        )
-        site_new, site_total = save_ceilometer_usages(
-            cumulative_data['result'],
-            gauge_data['result'],
-            delta_data['result'],
-            today,
-            warehouse)
-
-        logger.info(
-            '{} new, {} total ceilometer usages saved for {}'.format(
-                site_new,
-                site_total,
-                site['WAREHOUSE'],
-            )
-        )
-
-        new += site_new
-        total += site_total
-
+    new, total = process_sites(today, _collect_site)
     return True, 'Ceilometer usages: {} new, {} total'.format(new, total)
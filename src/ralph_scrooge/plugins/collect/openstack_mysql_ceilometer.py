@@ -8,18 +8,16 @@ import datetime
 import logging
 import time
 
-from django.conf import settings
 from ralph_scrooge.utils.common import memoize
 from sqlalchemy import create_engine
 
 from ralph.util import plugin
-from ralph_scrooge.models import (
-    DailyTenantInfo,
-    DailyUsage,
-    TenantInfo,
-    UsageType,
-    Warehouse
+from ralph_scrooge.models import DailyUsage, UsageType
+from ralph_scrooge.plugins.collect._ceilometer import (
+    process_sites,
+    save_usages,
 )
+from ralph_scrooge.utils.costs_changes import register_costs_input_change
 
 
 logger = logging.getLogger(__name__)
@@ -37,20 +35,6 @@ group by sample.meter_id, sample.project_id
 """
 
 
-class TenantNotFoundError(Exception):
-    """
-    Raised when tenant info does not exist
-    """
-    pass
-
-
-class DailyTenantNotFoundError(Exception):
-    """
-    Raised when daily tenant info does not exist
-    """
-    pass
-
-
 @memoize
 def get_usage_type(flavor_name):
     usage_name = METRIC_TMPL.format(flavor_name)
@@ -66,66 +50,67 @@ def get_usage_type(flavor_name):
 
 
 @memoize
-def get_daily_tenant(tenant_id, date):
-    try:
-        tenant = TenantInfo.objects.get(tenant_id=tenant_id)
-        return tenant.daily_tenants.get(date=date)
-    except TenantInfo.DoesNotExist as e:
-        raise TenantNotFoundError(e)
-    except DailyTenantInfo.DoesNotExist as e:
-        raise DailyTenantNotFoundError(e)
+def get_engine(connection_string):
+    """
+    Returns SQLAlchemy engine (with connections pool) for ceilometer database
+    - engine is shared by every call for the same connection string.
+    """
+    return create_engine(connection_string)
 
 
 def get_ceilometer_usages(date, connection_string):
     """
-    Function which talks with openstack
+    Function which talks with openstack. Usages are streamed (using server
+    side cursor) instead of being fetched at once.
     """
     today = datetime.datetime.combine(date, datetime.datetime.min.time())
     yesterday = today - datetime.timedelta(days=1)
 
-    engine = create_engine(connection_string)
-    connection = engine.connect()
+    connection = get_engine(connection_string).connect()
     query = CEILOMETER_QUERY.format(
         from_ts=time.mktime(yesterday.timetuple()),
         to_ts=time.mktime(today.timetuple())
     )
-    return connection.execute(query)
+    try:
+        result = connection.execution_options(
+            stream_results=True,
+        ).execute(query)
+        for row in result:
+            yield row
+    finally:
+        connection.close()
 
 
 def save_ceilometer_usages(usages, date, warehouse):
-    new = total = 0
-    for tenant_id, value, flavor_name in usages:
-        total += 1
-        usage_type = get_usage_type(flavor_name)
-        try:
-            daily_tenant = get_daily_tenant(tenant_id, date)
-        except TenantNotFoundError:
-            logger.error('Tenant {} not found'.format(tenant_id))
-            continue
-        except DailyTenantNotFoundError:
-            logger.error('DailyTenant {} for date {} not found'.format(
-                tenant_id,
-                date,
-            ))
-            continue
-        DailyUsage(
-            date=date,
-            service_environment=daily_tenant.service_environment,
-            daily_pricing_object=daily_tenant,
-            value=value / 6.0,  # ceilometer usages are saved each 10 minutes
-            type=usage_type,
-            warehouse=warehouse,
-        ).save()
-        new += 1
-    return new, total
+    return save_usages(
+        (
+            # ceilometer usages are saved each 10 minutes
+            (tenant_id, flavor_name, value / 6.0)
+            for tenant_id, value, flavor_name in usages
+        ),
+        date,
+        warehouse,
+        get_usage_type,
+    )
 
 
 def clear_ceilometer_stats(date):
     logger.debug('Clearing ceilometer records for {}'.format(date))
-    DailyUsage.objects.filter(
+    usages = DailyUsage.objects.filter(
         type__symbol__startswith=METRIC_TMPL.format(''),
         date=date,
-    ).delete()
+    )
+    register_costs_input_change(
+        set(usages.values_list('type_id', flat=True)),
+        date,
+        date,
+    )
+    usages.delete()
+
+
+def _collect_site(site, today, warehouse):
+    usages = get_ceilometer_usages(today, site['CEILOMETER_CONNECTION'])
+    return save_ceilometer_usages(usages, today, warehouse)
 
 
 @plugin.register(chain='scrooge', requires=['service', 'tenant'])
@@ -134,30 +119,5 @@ def openstack_mysql_ceilometer(today, **kwargs):
     Pricing plugin for openstack ceilometer.
     """
     clear_ceilometer_stats(today)
-    new = total = 0
-    for site in settings.OPENSTACK_CEILOMETER:
-        logger.info(
-            "Processing OpenStack ceilometer {}".format(site['WAREHOUSE'])
-        )
-        try:
-            warehouse = Warehouse.objects.get(name=site['WAREHOUSE'])
-        except Warehouse.DoesNotExist:
-            logger.error('Invalid warehouse: {}'.format(
-                site['WAREHOUSE']
-            ))
-            continue
-        usages = get_ceilometer_usages(today, site['CEILOMETER_CONNECTION'])
-        site_new, site_total = save_ceilometer_usages(usages, today, warehouse)
-
-        logger.info(
-            '{} new, {} total ceilometer usages saved for {}'.format(
-                site_new,
-                site_total,
-                site['WAREHOUSE'],
-            )
-        )
-
-        new += site_new
-        total += site_total
-
+    new, total = process_sites(today, _collect_site)
     return True, 'Ceilometer usages: {} new, {} total'.format(new, total)
@@ -12,6 +12,7 @@ from novaclient.v1_1 import client as nova_client
 
 from ralph.util import plugin
 from ralph_scrooge.models import DailyUsage, TenantInfo, UsageType, Warehouse
+from ralph_scrooge.utils.costs_changes import register_costs_input_change
 
 logger = logging.getLogger(__name__)
 
@@ -49,10 +50,16 @@ def save_usage(usage, date, usage_types, warehouse):
 
 def clear_openstack_simple_usages(date):
     logger.debug('Clearing OpenStack simple usages for {}'.format(date))
-    DailyUsage.objects.filter(
+    usages = DailyUsage.objects.filter(
         type__symbol__startswith=USAGE_SYMBOL_TMPL.format(''),
         date=date,
-    ).delete()
+    )
+    register_costs_input_change(
+        set(usages.values_list('type_id', flat=True)),
+        date,
+        date,
+    )
+    usages.delete()
 
 
 def get_usage_types():
@@ -123,6 +130,11 @@ def openstack_simple_usage(today, **kwargs):
             ))
             total += len(usages)
             success += region_success
+    register_costs_input_change(
+        [usage_type.id for usage_type in usage_types.values()],
+        today,
+        today,
+    )
     return True, 'OpenStack simple usages: {} success, {} total'.format(
         success,
         total
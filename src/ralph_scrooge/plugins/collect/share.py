@@ -16,6 +16,7 @@ from ralph_scrooge.models import (
     AssetInfo,
     UsageType,
 )
+from ralph_scrooge.utils.costs_changes import register_costs_input_change
 
 
 logger = logging.getLogger(__name__)
@@ -120,6 +121,7 @@ def share(**kwargs):
                             data['mount_device_id'],
                         ),
                     )
+        register_costs_input_change([usage_type.id], date, date)
     return True, '{0} new, {1} updated, {2} total'.format(
         None,
         updated,
@@ -20,6 +20,7 @@ from ralph_scrooge.models import (
     UsageType,
     VirtualInfo,
 )
+from ralph_scrooge.utils.costs_changes import register_costs_input_change
 
 
 logger = logging.getLogger(__name__)
@@ -224,6 +225,7 @@ def virtual(**kwargs):
     # key in dict is group name (which is propagated to usages names)
     # value is list of services uids (in group)
     updated = total = 0
+    usage_types_ids = set()
     for group_name, services in settings.VIRTUAL_SERVICES.items():
         usage_names = {
             'virtual_cores': '{0} Virtual CPU cores'.format(group_name),
@@ -231,6 +233,7 @@ def virtual(**kwargs):
             'virtual_disk': '{0} Virtual disk MB'.format(group_name),
         }
         usages = get_or_create_usages(usage_names)
+        usage_types_ids.update(usage.id for usage in usages.values())
         for service_uid in services:
             for data in api_scrooge.get_virtual_usages(service_uid):
                 total += 1
@@ -258,6 +261,7 @@ def virtual(**kwargs):
                 except DeviceIdCannotBeNoneError:
                     logger.warning('Device id cannot be None')
             logger.info('`Service {0} done '.format(service_uid))
+    register_costs_input_change(usage_types_ids, date, date)
 
     return True, 'Virtual: {0} new, {1} updated, {2} total'.format(
         None,
@@ -11,6 +11,7 @@ from decimal import Decimal as D
 
 from django.db.models import Sum
 from ralph_scrooge.utils.common import memoize
+from ralph_scrooge.utils.costs_memo import costs_memo
 
 from ralph_scrooge.models import DailyUsage
 from ralph_scrooge.plugins.base import BasePlugin
@@ -78,6 +79,7 @@ class BaseCostPlugin(BasePlugin):
         }
         """
 
+    @costs_memo
     def total_cost(self, *args, **kwargs):
         """
         By default total cost is just sum of all costs from `costs` method.
@@ -5,7 +5,9 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import itertools
 import logging
+import multiprocessing
 from collections import defaultdict
 from dateutil import rrule
 
@@ -19,7 +21,9 @@ from ralph_scrooge.models import (
     DynamicExtraCostType,
     ExtraCostType,
     PricingService,
+    PricingServiceDependencyGraph,
     ServiceEnvironment,
+    ServiceUsageTypes,
     Team,
     UsageType,
 )
@@ -27,7 +31,13 @@ from ralph_scrooge.plugins.cost.base import (
     NoPriceCostError,
     MultiplePriceCostError,
 )
+from ralph_scrooge.plugins.cost.tree import DailyCostsTree
+from ralph_scrooge.plugins.cost.writer import get_daily_cost_writer
 from ralph_scrooge.utils.common import memoize, AttributeDict
+from ralph_scrooge.utils.costs_changes import (
+    clear_costs_inputs_changes,
+    get_changed_types,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +46,22 @@ class VerifiedDailyCostsExistsError(Exception):
     pass
 
 
+def _run_plugin_on_worker(args):
+    """
+    Entry point of collector pool worker - run single cost plugin (module
+    level function to be picklable).
+    """
+    return Collector._run_plugin(*args)
+
+
+def _init_worker():
+    """
+    Initialize collector pool worker - every worker should use it's own
+    database connection (instead of inherited from parent process).
+    """
+    connection.close()
+
+
 class Collector(object):
     """
     Costs collector
@@ -134,6 +160,7 @@ class Collector(object):
         forecast=False,
         delete_verified=False,
         plugins=None,
+        processes=None,
     ):
         """
         Process costs for single date.
@@ -144,6 +171,10 @@ class Collector(object):
         3) delete previously saved costs (if they were not verified, except
             sitution, where delete_verified=True was passed explicitly)
         4) save costs in database in tree format
+
+        If processes is greater than 1 (by default it's taken from
+        SCROOGE_COSTS_COLLECT_PROCESSES setting), independent plugins are
+        running in parallel (see `_collect_costs_parallel`).
         """
         logger.info('Calculating costs (forecast: {}) for date {}'.format(
             forecast,
@@ -154,21 +185,106 @@ class Collector(object):
             date=date,
             forecast=forecast,
             plugins=plugins,
+            processes=processes,
         )
         logger.info('Costs calculated for date {}'.format(date))
         return costs
 
+    def process_incremental(
+        self,
+        date,
+        forecast=False,
+        delete_verified=False,
+        processes=None,
+    ):
+        """
+        Process costs for single date, but only of plugins affected by changes
+        of costs inputs (see `ralph_scrooge.utils.costs_changes`) since last
+        calculation - plugins which type (or type of usage used by pricing
+        service) was changed and all plugins depending on them. If costs were
+        not calculated for date yet, all plugins are processed.
+
+        :returns: tuple (costs, types), where types is a list of ids of types
+            of recalculated plugins (costs of other types are not changed) or
+            None, if all plugins were processed
+        """
+        if not CostDateStatus.objects.filter(
+            date=date,
+            **{'forecast_calculated' if forecast else 'calculated': True}
+        ).exists():
+            costs = self.process(
+                date,
+                forecast=forecast,
+                delete_verified=delete_verified,
+                processes=processes,
+            )
+            return costs, None
+        logger.info(
+            'Calculating changed costs (forecast: {}) for date {}'.format(
+                forecast,
+                date,
+            )
+        )
+        self._verify_accepted_costs(date, forecast, delete_verified)
+        plugins = self._get_changed_plugins(
+            date,
+            get_changed_types(date, forecast),
+        )
+        costs = {}
+        if plugins:
+            costs = self._collect_costs(
+                date=date,
+                forecast=forecast,
+                plugins=plugins,
+                processes=processes,
+            )
+        logger.info('Costs of {} plugins calculated for date {}'.format(
+            len(plugins),
+            date,
+        ))
+        return costs, [plugin.type_id for plugin in plugins]
+
     def save_period_costs(self, start, end, forecast, costs):
         """
         Save costs for period of time.
 
-        :param costs: list of DailyCost instances
+        :param costs: iterable of DailyCost instances
         """
         self._delete_daily_period_costs(start, end, forecast)
         self._save_costs(costs)
         self._update_status_period(start, end, forecast)
         logger.info('Costs saved for dates {}-{}'.format(start, end))
 
+    def save_daily_costs(
+        self,
+        date,
+        forecast,
+        costs,
+        types=None,
+        changed_before=None,
+    ):
+        """
+        Save costs (as returned by `process`) for single day. Costs are
+        flattened into columns (see `DailyCostsTree`) and written in batches,
+        without creating DailyCost instances.
+
+        :param costs: dict with costs per service environment
+        :param types: if passed, only costs of these types (subtrees with
+            these types in root) are replaced (see `process_incremental`)
+        :param changed_before: only costs inputs changes made before this
+            time are marked as calculated
+        """
+        tree = DailyCostsTree.from_costs(date, costs, forecast)
+        if types is None:
+            self._delete_daily_period_costs(date, date, forecast)
+        else:
+            self._delete_daily_costs_types(date, forecast, types)
+        count = get_daily_cost_writer().write_tree(tree)
+        logger.info('Saved {} costs'.format(count))
+        self._update_status(date, forecast)
+        clear_costs_inputs_changes(date, forecast, changed_before)
+        logger.info('Costs saved for date {}'.format(date))
+
     def _delete_daily_period_costs(self, start, end, forecast):
         """
         Delete previously saved costs between start and end (including forecast
@@ -187,6 +303,32 @@ class Collector(object):
             [start, end, forecast]
         )
 
+    def _delete_daily_costs_types(self, date, forecast, types):
+        """
+        Delete previously saved costs of types (whole subtrees with these
+        types in root) on date (including forecast flag).
+        """
+        if not types:
+            return
+        logger.info('Deleting previously saved costs of {} types on {}'.format(
+            len(types),
+            date,
+        ))
+        params = [date, forecast]
+        for type_id in types:
+            params.extend(['{}'.format(type_id), '{}/%'.format(type_id)])
+        cursor = connection.cursor()
+        cursor.execute(
+            """
+            DELETE FROM {}
+            WHERE date=%s and forecast=%s and ({})
+            """.format(
+                DailyCost._meta.db_table,
+                ' or '.join(['path=%s or path LIKE %s'] * len(types)),
+            ),
+            params
+        )
+
     def _verify_accepted_costs(self, date, forecast, delete_verified):
         """
         Verify if costs were already accepted for passed day. If yes and
@@ -205,29 +347,32 @@ class Collector(object):
         save it in database.
         """
         logger.info('Creating daily costs instances for {}'.format(date))
-        daily_costs = []
-        for service_environment, se_costs in costs.iteritems():
-            # use _build_tree directly, to collect DailyCosts for all services
-            # and save all at the end
-            daily_costs.extend(DailyCost._build_tree(
+        return list(self._iter_daily_costs(date, costs, forecast))
+
+    def _iter_daily_costs(self, date, costs, forecast):
+        """
+        Same as `_create_daily_costs`, but DailyCost instances are created
+        lazily (for one service environment at once).
+        """
+        return itertools.chain.from_iterable(
+            # use _build_tree directly, to not save DailyCosts of every service
+            # environment separately
+            DailyCost._build_tree(
                 tree=se_costs,
                 date=date,
                 service_environment_id=service_environment,
                 forecast=forecast,
-            ))
-        return daily_costs
+            ) for service_environment, se_costs in costs.iteritems()
+        )
 
     def _save_costs(self, daily_costs):
         """
         Save daily_costs in database.
 
-        :param daily_costs: list instances of DailyCost
+        :param daily_costs: iterable of DailyCost instances
         """
-        logger.info('Saving {} costs'.format(len(daily_costs)))
-        DailyCost.objects.bulk_create(
-            daily_costs,
-            batch_size=settings.DAILY_COST_CREATE_BATCH_SIZE,
-        )
+        count = get_daily_cost_writer().write(daily_costs)
+        logger.info('Saved {} costs'.format(count))
 
     def _update_status(self, date, forecast):
         """
@@ -254,53 +399,221 @@ class Collector(object):
         self,
         date,
         forecast=False,
-        plugins=None
+        plugins=None,
+        processes=None,
     ):
         """
         Collects costs from all plugins and stores them per service environment
         """
         logger.debug("Getting report date")
         old_queries_count = len(connection.queries)
+        plugins = plugins or self.get_plugins()
+        if processes is None:
+            processes = settings.SCROOGE_COSTS_COLLECT_PROCESSES
+        if processes > 1:
+            plugins_reports = self._collect_costs_parallel(
+                date,
+                forecast,
+                plugins,
+                processes,
+            )
+        else:
+            plugins_reports = (
+                self._run_plugin(date, forecast, *self._plugin_args(plugin))
+                for plugin in plugins
+            )
+        # results are always merged in plugins order, to keep costs of every
+        # service environment in the same order, no matter if plugins were
+        # running serially or in parallel
         data = defaultdict(list)
-        for i, plugin in enumerate(plugins or self.get_plugins()):
-            try:
-                plugin_old_queries_count = len(connection.queries)
-                plugin_report = plugin_runner.run(
-                    'scrooge_costs',
-                    plugin.plugin_name,
-                    date=date,
-                    forecast=forecast,
-                    type='costs',
-                    **{str(k): v for (k, v) in plugin['plugin_kwargs'].items()}
-                )
-                for service_id, service_usage in plugin_report.iteritems():
-                    data[service_id].extend(service_usage)
-                plugin_queries_count = (
-                    len(connection.queries) - plugin_old_queries_count
-                )
-                if settings.DEBUG:
-                    logger.debug('Plugin SQL queries: {0}\n'.format(
-                        plugin_queries_count
-                    ))
-            except KeyError:
-                logger.warning(
-                    "Usage '{0}' has no usage plugin\n".format(plugin.name)
-                )
-            except NoPriceCostError:
-                logger.warning('No costs defined\n')
-            except MultiplePriceCostError:
-                logger.warning('Multiple costs defined\n')
-            except Exception as e:
-                logger.exception(
-                    "Error while generating the report: {0}\n".format(e)
-                )
-                raise
+        for plugin_report in plugins_reports:
+            for service_id, service_usage in plugin_report.iteritems():
+                data[service_id].extend(service_usage)
 
         queries_count = len(connection.queries) - old_queries_count
         if settings.DEBUG:
             logger.debug('Total SQL queries: {0}'.format(queries_count))
         return data
 
+    @classmethod
+    def _plugin_args(cls, plugin):
+        """
+        Returns picklable plugin definition (name, plugin name and arguments)
+        """
+        return plugin.name, plugin.plugin_name, dict(plugin.plugin_kwargs)
+
+    @classmethod
+    def _run_plugin(cls, date, forecast, name, plugin_name, plugin_kwargs):
+        """
+        Run single cost plugin and return it's costs per service environment.
+        """
+        try:
+            plugin_old_queries_count = len(connection.queries)
+            plugin_report = plugin_runner.run(
+                'scrooge_costs',
+                plugin_name,
+                date=date,
+                forecast=forecast,
+                type='costs',
+                **{str(k): v for (k, v) in plugin_kwargs.items()}
+            )
+            plugin_queries_count = (
+                len(connection.queries) - plugin_old_queries_count
+            )
+            if settings.DEBUG:
+                logger.debug('Plugin SQL queries: {0}\n'.format(
+                    plugin_queries_count
+                ))
+            return plugin_report
+        except KeyError:
+            logger.warning(
+                "Usage '{0}' has no usage plugin\n".format(name)
+            )
+        except NoPriceCostError:
+            logger.warning('No costs defined\n')
+        except MultiplePriceCostError:
+            logger.warning('Multiple costs defined\n')
+        except Exception as e:
+            logger.exception(
+                "Error while generating the report: {0}\n".format(e)
+            )
+            raise
+        return {}
+
+    def _collect_costs_parallel(self, date, forecast, plugins, processes):
+        """
+        Run plugins in pool of processes (every process is using it's own
+        database connection). Plugins are scheduled in waves according to
+        dependencies between them (see `_get_plugins_waves`) - plugin is
+        started only when all plugins on which it depends are finished.
+
+        :returns: list of plugins results (in the same order as plugins)
+        """
+        waves = self._get_plugins_waves(
+            self._get_plugins_dependencies(date, plugins)
+        )
+        logger.info('Running {} plugins in {} waves using {} processes'.format(
+            len(plugins),
+            len(waves),
+            processes,
+        ))
+        results = [None] * len(plugins)
+        # close current connection to not share it with workers
+        connection.close()
+        pool = self._get_pool(processes)
+        try:
+            for wave in waves:
+                async_results = [
+                    (i, pool.apply_async(
+                        _run_plugin_on_worker,
+                        [(date, forecast) + self._plugin_args(plugins[i])],
+                    )) for i in wave
+                ]
+                for i, async_result in async_results:
+                    results[i] = async_result.get()
+        finally:
+            pool.terminate()
+            pool.join()
+        return results
+
+    def _get_changed_plugins(self, date, changed_types, plugins=None):
+        """
+        Returns plugins affected by changes of costs of passed types - plugins
+        of these types, pricing services using changed usage types and all
+        plugins depending on them (see `_get_plugins_dependencies`).
+        """
+        if not changed_types:
+            return []
+        plugins = plugins or self.get_plugins()
+        types_plugins = {
+            plugin.get('type_id'): i for i, plugin in enumerate(plugins)
+        }
+        changed_types = set(changed_types)
+        changed_types.update(ServiceUsageTypes.objects.filter(
+            usage_type__in=changed_types,
+            start__lte=date,
+            end__gte=date,
+        ).values_list('pricing_service_id', flat=True))
+        changed = set(
+            types_plugins[type_id] for type_id in changed_types
+            if type_id in types_plugins
+        )
+        dependencies = self._get_plugins_dependencies(date, plugins)
+        while True:
+            dependent = set(
+                i for i, plugin_dependencies in dependencies.items()
+                if i not in changed and plugin_dependencies & changed
+            )
+            if not dependent:
+                break
+            changed.update(dependent)
+        return [plugins[i] for i in sorted(changed)]
+
+    def _get_pool(self, processes):
+        return multiprocessing.Pool(processes, initializer=_init_worker)
+
+    def _get_plugins_dependencies(self, date, plugins):
+        """
+        Returns dependencies between plugins (as dict with plugin index as a
+        key and set of indexes of plugins on which it depends as a value).
+
+        Pricing service depends on all usage types, teams, (dynamic) extra
+        costs and supports plugins, on pricing services which resources it
+        uses and on pricing services charged by diffs to it. Other plugins
+        are independent.
+        """
+        pricing_services_plugins = {}
+        other_plugins = set()
+        for i, plugin in enumerate(plugins):
+            pricing_service = plugin.plugin_kwargs.get('pricing_service')
+            if pricing_service is not None:
+                pricing_services_plugins[pricing_service.id] = i
+            else:
+                other_plugins.add(i)
+
+        graph = PricingServiceDependencyGraph.for_date(date)
+        dependencies = {i: set() for i in other_plugins}
+        for i in sorted(pricing_services_plugins.values()):
+            pricing_service = plugins[i].plugin_kwargs['pricing_service']
+            dependent_services = graph.get_dependent_services_ids(
+                pricing_service.id
+            )
+            dependent_services.update(
+                pricing_service.charged_by_diffs.values_list('id', flat=True)
+            )
+            dependencies[i] = other_plugins.union(
+                pricing_services_plugins[ps_id]
+                for ps_id in dependent_services
+                if ps_id in pricing_services_plugins
+            )
+        return dependencies
+
+    @classmethod
+    def _get_plugins_waves(cls, dependencies):
+        """
+        Split plugins into waves - every plugin in wave depends only on
+        plugins from previous waves. If there is a cycle between plugins,
+        all remaining plugins are put into the last wave.
+
+        :param dependencies: dict with plugin index as a key and set of
+            plugins indexes on which it depends as a value
+        :returns: list of lists of plugins indexes
+        """
+        waves = []
+        done = set()
+        pending = set(dependencies.keys())
+        while pending:
+            wave = sorted(i for i in pending if dependencies[i] <= done)
+            if not wave:
+                logger.warning('Cycle in plugins dependencies: {}'.format(
+                    sorted(pending)
+                ))
+                wave = sorted(pending)
+            waves.append(wave)
+            done.update(wave)
+            pending.difference_update(wave)
+        return waves
+
     @classmethod
     def _get_services_environments(cls):
         """
@@ -360,6 +673,7 @@ class Collector(object):
         for but in base_usage_types:
             but_info = AttributeDict(
                 name=but.name,
+                type_id=but.id,
                 plugin_name=but.get_plugin_name(),
                 plugin_kwargs={
                     'usage_type': but,
@@ -392,6 +706,7 @@ class Collector(object):
         for rut in regular_usage_types:
             rut_info = AttributeDict(
                 name=rut.name,
+                type_id=rut.id,
                 plugin_name=rut.get_plugin_name(),
                 plugin_kwargs={
                     'usage_type': rut,
@@ -417,6 +732,7 @@ class Collector(object):
         for pricing_service in pricing_services:
             pricing_service_info = AttributeDict(
                 name=pricing_service.name,
+                type_id=pricing_service.id,
                 plugin_name=pricing_service.get_plugin_name(),
                 plugin_kwargs={
                     'pricing_service': pricing_service
@@ -442,6 +758,7 @@ class Collector(object):
         for team in teams:
             team_info = AttributeDict(
                 name=team.name,
+                type_id=team.id,
                 plugin_name='team_plugin',
                 plugin_kwargs={
                     'team': team
@@ -468,6 +785,7 @@ class Collector(object):
         for extra_cost in extra_costs:
             extra_cost_info = AttributeDict(
                 name=extra_cost.name,
+                type_id=extra_cost.id,
                 plugin_name='extra_cost_plugin',
                 plugin_kwargs={
                     'extra_cost_type': extra_cost,
@@ -481,6 +799,7 @@ class Collector(object):
         return [
             AttributeDict(
                 name='support',
+                type_id=2,  # from fixture
                 plugin_name='support_plugin',
                 plugin_kwargs={},
             )
@@ -503,6 +822,7 @@ class Collector(object):
         for dynamic_extra_cost in dynamic_extra_costs:
             dynamic_extra_cost_info = AttributeDict(
                 name=dynamic_extra_cost.name,
+                type_id=dynamic_extra_cost.id,
                 plugin_name='dynamic_extra_cost_plugin',
                 plugin_kwargs={
                     'dynamic_extra_cost_type': dynamic_extra_cost,
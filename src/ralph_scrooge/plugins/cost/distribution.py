@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized (NumPy) distribution of pricing service costs between pricing
+objects.
+
+Usages of pricing service resources are represented as arrays: every row is
+single (pricing object, service environment) pair, every column is single
+service usage type. Share of pricing object in pricing service costs is
+calculated once (as a product of usages matrix and vector of service usage
+types weights), then costs of every hierarchy level are distributed using
+single (outer) product of shares and costs of this level.
+
+Rounding policy: calculations are done on floats (float64); costs are
+converted back to Decimal only when building result, rounded (half to even)
+to COSTS_PLACES decimal places. Since DailyCost stores costs with 6 decimal
+places, stored costs are equal to costs calculated using Decimals (see
+`PricingServiceBasePlugin._add_hierarchy_costs`) up to rounding of last
+(6th) decimal place.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import defaultdict
+from decimal import Decimal as D
+
+import numpy as np
+
+COSTS_PLACES = 10
+COSTS_FORMAT = '{{:.{}f}}'.format(COSTS_PLACES)
+
+
+def to_decimal(values):
+    """
+    Convert array of floats to list of Decimals (rounded to COSTS_PLACES).
+    """
+    return [D(COSTS_FORMAT.format(v)) for v in values.tolist()]
+
+
+class UsagesDistribution(object):
+    """
+    Usages of pricing service resources per pricing object and service
+    environment.
+
+    :param usages_per_type: list (one element per service usage type) of
+        lists of (pricing object id, service environment id, usage) tuples
+    :param total_usages: total usage of every service usage type
+    :param percentage: percent of every service usage type in pricing
+        service costs
+    """
+    def __init__(self, usages_per_type, total_usages, percentage):
+        types_count = len(usages_per_type)
+        records = [
+            (po, se, type_index, usage)
+            for type_index, type_usages in enumerate(usages_per_type)
+            for po, se, usage in type_usages
+        ]
+        if records:
+            pos, ses, types, values = (np.array(c) for c in zip(*records))
+        else:
+            pos = ses = types = np.zeros(0, dtype=np.int64)
+            values = np.zeros(0)
+        pos = pos.astype(np.int64)
+        ses = ses.astype(np.int64)
+        # every (pricing object, service environment) pair is single row
+        pairs = np.empty(len(pos), dtype=[('po', np.int64), ('se', np.int64)])
+        pairs['po'] = pos
+        pairs['se'] = ses
+        unique_pairs, rows = np.unique(pairs, return_inverse=True)
+        self.pricing_objects = unique_pairs['po']
+        self.service_environments = unique_pairs['se']
+
+        shape = (len(unique_pairs), types_count)
+        self.usages = np.zeros(shape)
+        np.add.at(self.usages, (rows, types.astype(np.int64)), values)
+        self.present = np.zeros(shape, dtype=bool)
+        self.present[rows, types.astype(np.int64)] = True
+
+        self.total_usages = np.array(total_usages, dtype=float)
+        self.percentage = np.array(percentage, dtype=float)
+
+    def get_shares(self):
+        """
+        Returns share of every pricing object (row) in pricing service costs.
+        """
+        nonzero = self.total_usages != 0
+        weights = np.zeros(len(self.total_usages))
+        weights[nonzero] = (
+            self.percentage[nonzero] / 100 / self.total_usages[nonzero]
+        )
+        contributions = self.usages * weights
+        # keep compatibility with Decimal path - cost of pricing object is
+        # reset to zero at (present) usage type with total usage equal to
+        # zero, so only usage types after the last such type are summed
+        reset = np.logical_or.accumulate(
+            (self.present & ~nonzero)[:, ::-1],
+            axis=1,
+        )[:, ::-1]
+        contributions[reset] = 0
+        return contributions.sum(axis=1)
+
+    def get_values(self):
+        """
+        Returns value (usage) of pricing objects having usage of only one
+        type (None for others).
+        """
+        single = self.present.sum(axis=1) == 1
+        return [
+            v if s else None
+            for v, s in zip(self.usages.sum(axis=1).tolist(), single.tolist())
+        ]
+
+    def distribute(self, costs_hierarchy, with_children=True):
+        """
+        Distribute costs hierarchy between pricing objects proportionally to
+        their shares.
+
+        :param costs_hierarchy: dict with type id as a key and tuple (cost,
+            children hierarchy) as a value
+        :returns: costs per service environment in format returned by
+            `PricingServiceBasePlugin._distribute_costs`
+        """
+        shares = self.get_shares()
+        pricing_objects = self.pricing_objects.tolist()
+        result = defaultdict(list)
+
+        def distribute_level(hierarchy, depth):
+            # returns list (per row) of lists of costs at this level
+            types = list(hierarchy.keys())
+            costs = np.array(
+                [float(hierarchy[t][0]) for t in types],
+                dtype=float,
+            )
+            level_costs = np.outer(shares, costs)
+            rows = [[] for i in range(len(shares))]
+            for column, type_id in enumerate(types):
+                children = hierarchy[type_id][1]
+                children_costs = None
+                if children and with_children:
+                    children_costs = distribute_level(children, depth + 1)
+                column_costs = to_decimal(level_costs[:, column])
+                for row, cost in enumerate(column_costs):
+                    record = {
+                        'type_id': type_id,
+                        'pricing_object_id': pricing_objects[row],
+                        'cost': cost,
+                    }
+                    if depth == 0 and values[row] is not None:
+                        record['value'] = values[row]
+                    if children_costs is not None:
+                        record['_children'] = children_costs[row]
+                    rows[row].append(record)
+            return rows
+
+        values = self.get_values()
+        rows = distribute_level(costs_hierarchy, 0)
+        for se, row in zip(self.service_environments.tolist(), rows):
+            result[se].extend(row)
+        return result
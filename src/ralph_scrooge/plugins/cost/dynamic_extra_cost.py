@@ -12,12 +12,14 @@ from ralph_scrooge.plugins.base import register
 from ralph_scrooge.plugins.cost.base import NoPriceCostError
 from ralph_scrooge.plugins.cost.pricing_service import PricingServiceBasePlugin
 from ralph_scrooge.utils.common import memoize
+from ralph_scrooge.utils.costs_memo import costs_memo
 
 logger = logging.getLogger(__name__)
 
 
 @register(chain='scrooge_costs')
 class DynamicExtraCostPlugin(PricingServiceBasePlugin):
+    @costs_memo
     def total_cost(self, for_all_service_environments=False, *args, **kwargs):
         service_costs = self.costs(*args, **kwargs)
         return self._get_total_costs_from_costs(service_costs)
@@ -22,7 +22,9 @@ from ralph_scrooge.models import (
 )
 from ralph_scrooge.plugins.base import register
 from ralph_scrooge.plugins.cost.base import BaseCostPlugin
+from ralph_scrooge.plugins.cost.distribution import UsagesDistribution
 from ralph_scrooge.utils.common import memoize
+from ralph_scrooge.utils.costs_memo import costs_memo
 
 
 logger = logging.getLogger(__name__)
@@ -34,6 +36,7 @@ class PricingServiceBasePlugin(BaseCostPlugin):
     * costs - tree of costs for pricing service
     * total_cost - returns total cost of service
     """
+    @costs_memo
     def total_cost(self, for_all_service_environments=False, *args, **kwargs):
         """
         Returns total cost of pricing service
@@ -237,10 +240,9 @@ class PricingServiceBasePlugin(BaseCostPlugin):
                 ...
             }
         """
-        usages = defaultdict(list)
+        usages_per_type = []
         total_usages = []
         percentage = []
-        result = defaultdict(list)
         self.pricing_service = pricing_service
 
         for service_usage_type in service_usage_types:
@@ -255,8 +257,7 @@ class PricingServiceBasePlugin(BaseCostPlugin):
                 'daily_pricing_object__pricing_object',
                 'service_environment',
             ).annotate(usage=Sum('value'))
-            for pricing_object, se, usage in usages_per_po:
-                usages[(pricing_object, se)].append(usage)
+            usages_per_type.append(list(usages_per_po))
 
             total_usages.append(self._get_total_usage(
                 usage_type=service_usage_type.usage_type,
@@ -264,9 +265,48 @@ class PricingServiceBasePlugin(BaseCostPlugin):
                 excluded_services=service_excluded,
             ))
             percentage.append(service_usage_type.percent)
+        if settings.SCROOGE_COSTS_VECTORIZED_DISTRIBUTION:
+            return UsagesDistribution(
+                usages_per_type,
+                total_usages,
+                percentage,
+            ).distribute(
+                costs_hierarchy,
+                with_children=not settings.SAVE_ONLY_FIRST_DEPTH_COSTS,
+            )
+        return self._distribute_usages(
+            usages_per_type,
+            total_usages,
+            percentage,
+            costs_hierarchy,
+        )
+
+    def _distribute_usages(
+        self,
+        usages_per_type,
+        total_usages,
+        percentage,
+        costs_hierarchy,
+    ):
+        """
+        Distribute costs hierarchy between pricing objects according to their
+        usages (list of (pricing object, service environment, usage) per
+        service usage type) using Decimals.
+        """
+        usages = defaultdict(list)
+        result = defaultdict(list)
+        # pricing object could have usages only of some of service usage
+        # types, so every usage is kept together with total usage and percent
+        # of its own type
+        for type_usages, total, percent in zip(
+            usages_per_type,
+            total_usages,
+            percentage,
+        ):
+            for pricing_object, se, usage in type_usages:
+                usages[(pricing_object, se)].append((usage, total, percent))
         # create hierarchy basing on usages
-        for (po, se), po_usages in usages.items():
-            po_usages_info = zip(po_usages, total_usages, percentage)
+        for (po, se), po_usages_info in usages.items():
             result[se].extend(
                 self._add_hierarchy_costs(po, po_usages_info, costs_hierarchy)
             )
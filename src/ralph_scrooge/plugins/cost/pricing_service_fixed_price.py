@@ -13,6 +13,7 @@ from ralph.util import plugin as plugin_runner
 from ralph_scrooge.plugins.base import register
 from ralph_scrooge.plugins.cost.pricing_service import PricingServiceBasePlugin
 from ralph_scrooge.utils.common import memoize
+from ralph_scrooge.utils.costs_memo import costs_memo
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +25,7 @@ class PricingServiceFixedPricePlugin(PricingServiceBasePlugin):
     each of this service usage types must has price (and forecast price)
     defined for date, in which costs are generated.
     """
+    @costs_memo
     def total_cost(self, for_all_service_environments=False, *args, **kwargs):
         service_costs = self.costs(*args, **kwargs)
         return self._get_total_costs_from_costs(service_costs)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Compact (column-oriented) representation of DailyCost trees.
+
+Costs returned by collector (nested dicts with `_children` lists) are
+flattened into columns (one value per DailyCost row) without creating
+DailyCost model instances, which are the largest source of allocations
+during costs recalculation. Rows are built in the same way (and in the same
+order) as by `MultiPathNode._build_tree`.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import array
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class DailyCostsTree(object):
+    """
+    DailyCosts of single day stored as columns.
+
+    Every column is named after attname of DailyCost field. Date and forecast
+    are the same for every row, so they're stored only once.
+    """
+    _path_link = '/'
+
+    def __init__(self, date, forecast=False):
+        self.date = date
+        self.forecast = forecast
+        self.path = []
+        self.depth = array.array(str('l'))
+        self.type_id = array.array(str('l'))
+        self.service_environment_id = array.array(str('l'))
+        self.pricing_object_id = []
+        self.warehouse_id = []
+        self.cost = []
+        self.value = array.array(str('d'))
+
+    def __len__(self):
+        return len(self.path)
+
+    @classmethod
+    def _get_id(cls, node, name):
+        """
+        Returns id of related object - node could contain id (`<name>_id`) or
+        object itself (`<name>`), as DailyCost constructor accepts both.
+        """
+        if name + '_id' in node:
+            return node[name + '_id']
+        obj = node.get(name)
+        return getattr(obj, 'id', obj)
+
+    @classmethod
+    def from_costs(cls, date, costs, forecast=False):
+        """
+        Build tree from costs of every service environment (in format returned
+        by `Collector.process`).
+        """
+        tree = cls(date, forecast)
+        for service_environment_id, se_costs in costs.iteritems():
+            tree.add(service_environment_id, se_costs)
+        return tree
+
+    def add(self, service_environment_id, costs):
+        """
+        Flatten costs of single service environment into columns.
+
+        Nodes with cost not greater than 0 are skipped (with their children),
+        as in `DailyCost._are_params_valid`.
+
+        :param list costs: list of dicts. Dict '_children' list value is used
+            as node children.
+        """
+        assert isinstance(costs, (list, tuple))
+        # iterative pre-order traversal; every stack element is tuple of
+        # (parent path, depth, iterator over children)
+        stack = [('', 0, iter(costs))]
+        while stack:
+            parent_path, depth, children = stack[-1]
+            node = next(children, None)
+            if node is None:
+                stack.pop()
+                continue
+            if 'cost' in node and not node['cost'] > 0:
+                continue
+            type_id = self._get_id(node, 'type')
+            path = '{}'.format(type_id)
+            if parent_path:
+                path = self._path_link.join((parent_path, path))
+            self.path.append(path)
+            self.depth.append(depth)
+            self.type_id.append(type_id)
+            self.service_environment_id.append(service_environment_id)
+            self.pricing_object_id.append(
+                self._get_id(node, 'pricing_object')
+            )
+            self.warehouse_id.append(self._get_id(node, 'warehouse'))
+            self.cost.append(node.get('cost', 0))
+            self.value.append(node.get('value') or 0)
+            if node.get('_children'):
+                stack.append((path, depth + 1, iter(node['_children'])))
+
+    def iter_rows(self, fields, connection):
+        """
+        Returns iterator over rows of tree, where every row is a tuple of
+        values (prepared to save in database) of passed DailyCost fields.
+        """
+        columns = []
+        for field in fields:
+            if field.attname in ('date', 'forecast'):
+                columns.append(itertools.repeat(field.get_db_prep_save(
+                    getattr(self, field.attname),
+                    connection=connection,
+                )))
+            elif field.attname == 'cost':
+                columns.append(
+                    field.get_db_prep_save(cost, connection=connection)
+                    for cost in self.cost
+                )
+            else:
+                columns.append(getattr(self, field.attname))
+        return itertools.izip(*columns)
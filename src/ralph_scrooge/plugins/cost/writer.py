@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Writers of DailyCost rows.
+
+Every writer is consuming (possibly lazy) iterable of DailyCost instances or
+DailyCostsTree (costs stored as columns, without model instances) in batches
+of DAILY_COST_CREATE_BATCH_SIZE, so only single batch of rows is kept in
+memory. If SCROOGE_COSTS_FAST_WRITE is True and database backend supports
+it, rows are written using bulk load commands (PostgreSQL `COPY FROM STDIN`
+or MySQL `LOAD DATA LOCAL INFILE`); otherwise batched INSERTs are used.
+
+Notice that MySQL bulk load requires `local_infile` option to be enabled
+(ex. `'OPTIONS': {'local_infile': 1}` in DATABASES setting) - if it's not,
+writer falls back to batched INSERTs.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import itertools
+import logging
+import tempfile
+
+from django.conf import settings
+from django.db import connection, DatabaseError
+from django.db import models as db
+
+from ralph_scrooge.models import DailyCost
+
+logger = logging.getLogger(__name__)
+
+
+class DailyCostWriter(object):
+    """
+    Writes DailyCost rows using batched INSERTs.
+    """
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or settings.DAILY_COST_CREATE_BATCH_SIZE
+        self.fields = [
+            f for f in DailyCost._meta.local_fields
+            if not isinstance(f, db.AutoField)
+        ]
+        self.table = connection.ops.quote_name(DailyCost._meta.db_table)
+        self.columns = ', '.join(
+            connection.ops.quote_name(f.column) for f in self.fields
+        )
+
+    def write(self, daily_costs):
+        """
+        Write daily costs to database.
+
+        :param daily_costs: iterable of DailyCost instances
+        :returns: number of written daily costs
+        :rtype: int
+        """
+        return self.write_rows(self._get_row(dc) for dc in daily_costs)
+
+    def write_tree(self, tree):
+        """
+        Write daily costs stored as columns (without creating DailyCost
+        instances).
+
+        :param tree: DailyCostsTree instance
+        :returns: number of written daily costs
+        :rtype: int
+        """
+        return self.write_rows(tree.iter_rows(self.fields, connection))
+
+    def write_rows(self, rows):
+        """
+        Write rows (tuples of values of `self.fields` prepared to save in
+        database) in batches.
+        """
+        count = 0
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                break
+            self._write_batch(batch)
+            count += len(batch)
+        return count
+
+    def _get_row(self, daily_cost):
+        return tuple(
+            f.get_db_prep_save(
+                f.pre_save(daily_cost, True),
+                connection=connection,
+            ) for f in self.fields
+        )
+
+    def _write_batch(self, batch):
+        cursor = connection.cursor()
+        cursor.executemany(
+            'INSERT INTO {} ({}) VALUES ({})'.format(
+                self.table,
+                self.columns,
+                ', '.join(['%s'] * len(self.fields)),
+            ),
+            batch,
+        )
+
+
+class BulkLoadDailyCostWriter(DailyCostWriter):
+    """
+    Base class for writers using database bulk load commands. Rows are
+    serialized to tab-separated text format (with `\\N` as NULL), which is
+    accepted both by PostgreSQL `COPY` and MySQL `LOAD DATA`.
+    """
+    @classmethod
+    def _format_value(cls, value):
+        if value is None:
+            return '\\N'
+        if isinstance(value, bool):
+            return '1' if value else '0'
+        if isinstance(value, float):
+            value = repr(value)
+        return '{}'.format(value).replace(
+            '\\', '\\\\'
+        ).replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+    def _format_row(self, row):
+        return '\t'.join(self._format_value(v) for v in row) + '\n'
+
+    def _dump_batch(self, batch, stream):
+        for row in batch:
+            stream.write(self._format_row(row).encode('utf-8'))
+        stream.flush()
+        stream.seek(0)
+
+    def _write_batch(self, batch):
+        raise NotImplementedError()
+
+
+class PostgreSQLDailyCostWriter(BulkLoadDailyCostWriter):
+    """
+    Writes DailyCost instances using PostgreSQL `COPY FROM STDIN`.
+    """
+    def _write_batch(self, batch):
+        stream = io.BytesIO()
+        self._dump_batch(batch, stream)
+        cursor = connection.cursor()
+        cursor.copy_expert(
+            'COPY {} ({}) FROM STDIN'.format(self.table, self.columns),
+            stream,
+        )
+
+
+class MySQLDailyCostWriter(BulkLoadDailyCostWriter):
+    """
+    Writes DailyCost instances using MySQL `LOAD DATA LOCAL INFILE`. If bulk
+    load is not allowed, batched INSERTs are used.
+    """
+    def __init__(self, *args, **kwargs):
+        super(MySQLDailyCostWriter, self).__init__(*args, **kwargs)
+        self.use_inserts = False
+
+    def _write_batch(self, batch):
+        if not self.use_inserts:
+            with tempfile.NamedTemporaryFile() as stream:
+                self._dump_batch(batch, stream)
+                try:
+                    cursor = connection.cursor()
+                    cursor.execute(
+                        'LOAD DATA LOCAL INFILE %s INTO TABLE {} ({})'.format(
+                            self.table,
+                            self.columns,
+                        ),
+                        [stream.name],
+                    )
+                    return
+                except DatabaseError as e:
+                    logger.warning(
+                        'Could not load daily costs ({}) - using INSERTs'
+                        .format(e)
+                    )
+                    self.use_inserts = True
+        super(BulkLoadDailyCostWriter, self)._write_batch(batch)
+
+
+BULK_LOAD_WRITERS = {
+    'postgresql': PostgreSQLDailyCostWriter,
+    'mysql': MySQLDailyCostWriter,
+}
+
+
+def get_daily_cost_writer(**kwargs):
+    """
+    Returns the fastest DailyCost writer available for current database
+    backend.
+    """
+    writer_class = DailyCostWriter
+    if settings.SCROOGE_COSTS_FAST_WRITE:
+        writer_class = BULK_LOAD_WRITERS.get(connection.vendor, writer_class)
+    return writer_class(**kwargs)
@@ -318,15 +318,15 @@ class BasePluginReport(BaseReport):
 
     @classmethod
     @memoize
-    def _get_schema(cls):
+    def _get_plugins_schemas(cls):
         """
-        Use plugins to get full schema for report
+        Use plugins to get schema of columns of every plugin
 
-        :returns dict: Complete schema for all columns in report
-        :rtype dict:
+        :returns list: list of tuples (plugin, schema of plugin columns)
+        :rtype list:
         """
         logger.debug("Getting schema for report")
-        header = []
+        result = []
         for plugin in cls.get_plugins():
             try:
                 plugin_headers = plugin_runner.run(
@@ -335,12 +335,23 @@ class BasePluginReport(BaseReport):
                     type=cls.schema_name,
                     **plugin.get('plugin_kwargs', {})
                 )
-                header.append(plugin_headers)
+                result.append((plugin, plugin_headers))
             except KeyError:
                 logger.warning(
                     "Usage '{0}' has no schema plugin".format(plugin.name)
                 )
-        return header
+        return result
+
+    @classmethod
+    @memoize
+    def _get_schema(cls):
+        """
+        Use plugins to get full schema for report
+
+        :returns dict: Complete schema for all columns in report
+        :rtype dict:
+        """
+        return [schema for plugin, schema in cls._get_plugins_schemas()]
 
     @classmethod
     def get_header(cls, **kwargs):
@@ -8,9 +8,12 @@ from __future__ import unicode_literals
 import logging
 
 from django.conf import settings
+from django.core.cache import get_cache
+from django.core.cache.backends.dummy import DummyCache
 
 from ralph_scrooge.utils.common import get_cache_name, get_queue_name
-from ralph_scrooge.utils.worker_job import WorkerJob
+from ralph_scrooge.utils.report_storage import ChunkedReport
+from ralph_scrooge.utils.worker_job import _get_cache_key, WorkerJob
 
 logger = logging.getLogger(__name__)
 
@@ -27,11 +30,19 @@ class BaseReport(WorkerJob):
     ``section``, ``get_header`` and ``get_data`` in the specific reports.
 
     Make sure that ``get_header`` and ``get_data`` are static methods.
+
+    If ``chunked_result`` is True, rows of report (``get_data`` has to return
+    rows then) are stored in blocks (see
+    ``ralph_scrooge.utils.report_storage``) and result of report is
+    ``ChunkedReport`` instead of tuple (header, data). Rows of final result
+    could be any iterable (ex. generator) - they are stored block by block
+    as they are produced, so the whole report is never held in memory.
     """
     currency = 'PLN'
     queue_name = get_queue_name('scrooge_report')
     cache_name = get_cache_name('scrooge_report')
     cache_section = 'scrooge_report'
+    chunked_result = False
 
     def _format_header(self):
         """
@@ -56,6 +67,61 @@ class BaseReport(WorkerJob):
             yield 100, (header, data)
         logger.info("Report generated")
 
+    @classmethod
+    def _use_chunked_result(cls):
+        # with dummy cache, blocks could not be stored
+        return cls.chunked_result and not isinstance(
+            get_cache(cls.cache_name),
+            DummyCache,
+        )
+
+    @classmethod
+    def _get_partial_result(cls, data):
+        # partial report (ex. with already calculated columns) is stored in
+        # blocks too
+        if cls._use_chunked_result() and data is not None:
+            header, rows = data
+            if not rows:
+                return None
+            return ChunkedReport.save(
+                cls.cache_name,
+                header,
+                rows,
+                cls.cache_timeout,
+            )
+        return data
+
+    @classmethod
+    def _delete_partial_result(cls, partial_result):
+        if isinstance(partial_result, ChunkedReport):
+            partial_result.delete()
+
+    @classmethod
+    def _save_result(cls, data):
+        if data is None:
+            return data
+        header, rows = data
+        if cls._use_chunked_result():
+            return ChunkedReport.save(
+                cls.cache_name,
+                header,
+                rows,
+                cls.cache_final_result_timeout,
+            )
+        # rows could be produced lazily
+        return header, list(rows)
+
+    @classmethod
+    def _clear_cache(cls, **kwargs):
+        # remove blocks of stored report together with its descriptor
+        if cls._use_chunked_result():
+            cached = get_cache(cls.cache_name).get(
+                _get_cache_key(cls.cache_section, **kwargs)
+            )
+            if cached is not None and isinstance(cached[2], ChunkedReport):
+                cached[2].delete()
+        super(BaseReport, cls)._clear_cache(**kwargs)
+
     @staticmethod
     def get_data(**kwargs):
         """
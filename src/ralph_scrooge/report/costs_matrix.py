@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar (NumPy) engine of services costs report.
+
+Costs and values of every base usage (usage type, pricing service, team,
+extra cost etc.) for every service environment in the period are fetched
+using single grouped query (instead of one query per base usage) and pivoted
+into dense matrices - every row is single service environment, every column
+is single base usage. Report is then formatted column by column.
+
+Rounding policy: costs (and total cost) are kept as Decimals (in arrays of
+objects) and values as floats (float64); both are formatted only when
+building report, the same way as in the plugins-based report (costs are
+formatted with 2 decimal places, halves rounded to even).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+from decimal import Decimal as D
+
+import numpy as np
+
+from ralph_scrooge.utils.monthly_costs import get_costs_sums
+
+
+logger = logging.getLogger(__name__)
+
+
+def decimal_zeros(shape):
+    """
+    Returns array (of objects) of given shape filled with Decimal zeros.
+    """
+    array = np.empty(shape, dtype=object)
+    array.fill(D(0))
+    return array
+
+
+class CostsMatrix(object):
+    """
+    Total costs and values of base usages per service environment.
+
+    :param service_environments_ids: ids of service environments (rows)
+    :param base_usages_ids: ids of base usages (columns)
+    """
+    def __init__(self, service_environments_ids, base_usages_ids):
+        self.rows = dict(
+            (se_id, i) for i, se_id in enumerate(service_environments_ids)
+        )
+        self.columns = dict(
+            (bu_id, i) for i, bu_id in enumerate(base_usages_ids)
+        )
+        shape = (len(self.rows), len(self.columns))
+        self.costs = decimal_zeros(shape)
+        self.values = np.zeros(shape)
+
+    def load(self, start, end, forecast=False):
+        """
+        Fill matrices with total costs and values between start and end
+        (costs of months with every day accepted are taken from monthly
+        costs rollup).
+        """
+        rows, columns, costs, values = [], [], [], []
+        for se_id, type_id, total_value, total_cost in get_costs_sums(
+            start,
+            end,
+            forecast,
+            ['service_environment_id', 'type_id'],
+            accepted_only=False,
+        ):
+            row = self.rows.get(se_id)
+            column = self.columns.get(type_id)
+            # skip costs of base usages (or services) not visible on report
+            if row is None or column is None:
+                continue
+            rows.append(row)
+            columns.append(column)
+            costs.append(total_cost or D(0))
+            values.append(total_value)
+        logger.debug('{} cells of costs matrix filled'.format(len(rows)))
+        if rows:
+            self.costs[rows, columns] = costs
+            self.values[rows, columns] = values
+
+    def get_costs(self, base_usage_id):
+        return self.costs[:, self.columns[base_usage_id]]
+
+    def get_values(self, base_usage_id):
+        return self.values[:, self.columns[base_usage_id]]
+
+
+def format_column(values, field_rules):
+    """
+    Format whole column of report (array of values) according to field rules
+    (the same way as `BasePluginReport._prepare_field` formats single
+    field).
+
+    :returns tuple: list of formatted fields and array of costs (Decimals)
+        to include in total cost (or None if field is not included in total
+        cost)
+    """
+    usage_costs = None
+    if field_rules.get('total_cost'):
+        usage_costs = np.array(
+            [D(value) for value in values.tolist()],
+            dtype=object,
+        )
+    if field_rules.get('divide_by'):
+        values = values.astype(float) / float(10 ** field_rules['divide_by'])
+    values = values.tolist()
+    rounding = field_rules.get('rounding')
+    if rounding is not None:
+        values = [
+            '{:.{prec}f}'.format(round(value, rounding), prec=rounding)
+            for value in values
+        ]
+    elif field_rules.get('currency'):
+        values = ['{0:.2f}'.format(value) for value in values]
+    return values, usage_costs
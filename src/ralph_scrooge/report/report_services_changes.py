@@ -5,12 +5,21 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import datetime
 import logging
+import re
+import sqlite3
 
+from django.conf import settings
 from django.db import connection
 from django.utils.translation import ugettext_lazy as _
 
-from ralph_scrooge.models import PRICING_OBJECT_TYPES
+from ralph_scrooge.models import (
+    DailyPricingObject,
+    PRICING_OBJECT_TYPES,
+    PricingObject,
+    PricingObjectServiceChange,
+)
 from ralph_scrooge.report.base_report import BaseReport
 
 
@@ -28,10 +37,8 @@ ADDITIONAL_DATA = {
     PRICING_OBJECT_TYPES.ASSET: {
         'fields': ['ai.barcode', 'ai.sn', 'ai.asset_id'],
         'joins': [
-            'JOIN ralph_scrooge_assetinfo AS ai',
-        ],
-        'joins_conditions': [
-            'AND po.id = ai.pricingobject_ptr_id',
+            'JOIN ralph_scrooge_assetinfo AS ai '
+            'ON po.id = ai.pricingobject_ptr_id',
         ],
     }
 }
@@ -44,6 +51,25 @@ ADDITIONAL_HEADERS = {
 }
 
 
+def _get_db_engine(cursor):
+    return cursor.db.settings_dict['ENGINE'].split('.')[-1]
+
+
+def _window_functions_supported(cursor):
+    """
+    Check if database supports window functions (LAG).
+    """
+    db_engine = _get_db_engine(cursor)
+    if db_engine == 'sqlite3':
+        return sqlite3.sqlite_version_info >= (3, 25, 0)
+    if db_engine == 'mysql':
+        cursor.execute('SELECT VERSION()')
+        version = re.findall(r'\d+', cursor.fetchone()[0])
+        # every supported version of MariaDB (10.2+) has window functions
+        return tuple(map(int, version[:2])) >= (8, 0)
+    return db_engine in ('postgresql_psycopg2', 'oracle')
+
+
 class ServicesChangesReport(BaseReport):
     """
     Report with listing of pricing objects services changes. Contains basic
@@ -57,6 +83,165 @@ class ServicesChangesReport(BaseReport):
         types.remove(PRICING_OBJECT_TYPES.DUMMY)
         return types
 
+    @classmethod
+    def _get_source(cls, cursor):
+        """
+        Returns source of changes (SCROOGE_SERVICES_CHANGES_SOURCE), falling
+        back to self-join of daily pricing objects if window functions are
+        not supported by database.
+        """
+        source = settings.SCROOGE_SERVICES_CHANGES_SOURCE
+        if source == 'window' and not _window_functions_supported(cursor):
+            logger.warning(
+                'Window functions not supported by database - using '
+                'self-join of daily pricing objects'
+            )
+            source = 'self_join'
+        return source
+
+    @classmethod
+    def _get_query(
+        cls,
+        source,
+        cursor,
+        start,
+        end,
+        pricing_object_type,
+        service_environments=None,
+    ):
+        """
+        Returns query (and its params) of services changes of pricing objects
+        of single type between start and end.
+        """
+        # all db engines has differ way of days subtraction syntax
+        day_sub = SQL_DAY_SUB[_get_db_engine(cursor)]
+        changes_params = []
+        if source == 'log':
+            changes = PricingObjectServiceChange._meta.db_table
+        elif source == 'window':
+            # previous daily pricing object of every daily pricing object
+            # (in period starting one day before start) is found using LAG
+            # window function (single scan of daily pricing objects); it's
+            # change only if it's from the previous day and has different
+            # service environment
+            changes = """(
+                SELECT
+                    dpo_lag.pricing_object_id,
+                    dpo_lag.date,
+                    dpo_lag.service_environment_id,
+                    dpo_lag.previous_service_environment_id
+                FROM (
+                    SELECT
+                        dpo.pricing_object_id,
+                        dpo.date,
+                        dpo.service_environment_id,
+                        LAG(dpo.service_environment_id) OVER (
+                            PARTITION BY dpo.pricing_object_id
+                            ORDER BY dpo.date
+                        ) AS previous_service_environment_id,
+                        LAG(dpo.date) OVER (
+                            PARTITION BY dpo.pricing_object_id
+                            ORDER BY dpo.date
+                        ) AS previous_date
+                    FROM {daily} AS dpo
+                        JOIN {pricing_object} AS dpo_po
+                        ON dpo.pricing_object_id = dpo_po.id
+                    WHERE dpo.date >= %s
+                        AND dpo.date <= %s
+                        AND dpo_po.type_id = %s
+                ) AS dpo_lag
+                WHERE dpo_lag.previous_date = {previous_day}
+                    AND dpo_lag.service_environment_id !=
+                        dpo_lag.previous_service_environment_id
+            )""".format(
+                daily=DailyPricingObject._meta.db_table,
+                pricing_object=PricingObject._meta.db_table,
+                previous_day=day_sub('dpo_lag.date'),
+            )
+            changes_params = [
+                start - datetime.timedelta(days=1),
+                end,
+                pricing_object_type.id,
+            ]
+        else:
+            # join daily pricing objects table with self in such way, that
+            # joined record's date is one day sooner than original record -
+            # then filter only rows that have different service environment
+            # in two following days
+            changes = """(
+                SELECT
+                    dpo1.pricing_object_id,
+                    dpo1.date,
+                    dpo1.service_environment_id,
+                    dpo2.service_environment_id
+                        AS previous_service_environment_id
+                FROM {daily} AS dpo1
+                    JOIN {daily} AS dpo2
+                    ON dpo1.pricing_object_id = dpo2.pricing_object_id
+                WHERE dpo2.date = {previous_day}
+                    AND dpo1.date >= %s
+                    AND dpo1.date <= %s
+                    AND dpo1.service_environment_id !=
+                        dpo2.service_environment_id
+            )""".format(
+                daily=DailyPricingObject._meta.db_table,
+                previous_day=day_sub('dpo1.date'),
+            )
+            changes_params = [start, end]
+
+        # after finding changes, join service environments and pricing
+        # object to get pricing object info and services names
+        additional = ADDITIONAL_DATA.get(pricing_object_type, {})
+        additional_fields = ''.join(
+            '{},'.format(field) for field in additional.get('fields', [])
+        )
+        query = """
+            SELECT
+                po.id,
+                po.name,
+                {additional_fields}
+                changes.date,
+                s2.name as service_before_change,
+                e2.name as environment_before_change,
+                s1.name as service_after_change,
+                e1.name as environment_after_change
+            FROM {changes} AS changes
+                JOIN ralph_scrooge_serviceenvironment AS se1
+                    ON changes.service_environment_id = se1.id
+                JOIN ralph_scrooge_serviceenvironment AS se2
+                    ON changes.previous_service_environment_id = se2.id
+                JOIN ralph_scrooge_service AS s1 ON se1.service_id = s1.id
+                JOIN ralph_scrooge_service AS s2 ON se2.service_id = s2.id
+                JOIN ralph_scrooge_environment AS e1
+                    ON se1.environment_id = e1.id
+                JOIN ralph_scrooge_environment AS e2
+                    ON se2.environment_id = e2.id
+                JOIN ralph_scrooge_pricingobject AS po
+                    ON changes.pricing_object_id = po.id
+                {additional_joins}
+            WHERE changes.date >= %s
+                AND changes.date <= %s
+                AND po.type_id = %s
+        """.format(
+            additional_fields=additional_fields,
+            changes=changes,
+            additional_joins='\n'.join(additional.get('joins', [])),
+        )
+        params = changes_params + [start, end, pricing_object_type.id]
+        if service_environments is not None:
+            service_environments_set = ','.join(map(str, service_environments))
+            query += """
+                AND (
+                    changes.service_environment_id IN ({0})
+                    OR
+                    changes.previous_service_environment_id IN ({0})
+                )
+            """.format(service_environments_set)
+        query += """
+        ORDER BY changes.date, service_before_change, service_after_change
+        """
+        return query, params
+
     @classmethod
     def get_data(
         cls,
@@ -68,7 +253,9 @@ class ServicesChangesReport(BaseReport):
         """
         Main method. Create a full report for devices services changes. Notice
         that this method is a generator. Returns devices services changes
-        based on daily pricing objects imprints.
+        based on daily pricing objects imprints (read from log of changes or
+        found using window function or self-join of daily pricing objects -
+        see SCROOGE_SERVICES_CHANGES_SOURCE).
 
         Report data format:
         {
@@ -104,80 +291,23 @@ class ServicesChangesReport(BaseReport):
             service_environments = [
                 se.id for se in service.environments_services.all()
             ]
-        # query explanation:
-        # join dailydevice table with self in such way, that joined record's
-        # date is one day sooner than original record - then filter only rows
-        # that have different venture in two following days
-        # after filtering, join ventures and device to get device info and
-        # ventures names
-        query = """
-            SELECT
-                po.id,
-                po.name,
-                {additional_fields}
-                dpo1.date,
-                s2.name as service_before_change,
-                e2.name as environment_before_change,
-                s1.name as service_after_change,
-                e1.name as environment_after_change
-            FROM ralph_scrooge_dailypricingobject AS dpo1
-                JOIN ralph_scrooge_dailypricingobject AS dpo2
-                JOIN ralph_scrooge_serviceenvironment AS se1
-                JOIN ralph_scrooge_serviceenvironment AS se2
-                JOIN ralph_scrooge_service AS s1
-                JOIN ralph_scrooge_service AS s2
-                JOIN ralph_scrooge_environment AS e1
-                JOIN ralph_scrooge_environment AS e2
-                JOIN ralph_scrooge_pricingobject AS po
-                {additional_joins}
-            ON dpo1.pricing_object_id = dpo2.pricing_object_id
-                AND dpo1.service_environment_id = se1.id
-                AND dpo2.service_environment_id = se2.id
-                AND dpo1.pricing_object_id = po.id
-                AND se1.service_id = s1.id
-                AND se2.service_id = s2.id
-                AND se1.environment_id = e1.id
-                AND se2.environment_id = e2.id
-                {additional_joins_conditions}
-            WHERE dpo2.date = {dates_sub}
-                AND dpo1.date >= '{start}'
-                AND dpo1.date <= '{end}'
-                AND dpo1.service_environment_id != dpo2.service_environment_id
-                AND po.type_id = {pricing_object_type_id}
-        """
-        if service_environments is not None:
-            service_environments_set = ','.join(map(str, service_environments))
-            query += """
-                AND (
-                    dpo1.service_environment_id IN ({service_environments_set})
-                    OR
-                    dpo2.service_environment_id IN ({service_environments_set})
-                )
-            """
-        query += """
-        ORDER BY dpo1.date, service_before_change, service_after_change;
-        """
         cursor = connection.cursor()
-        # all db engines has differ way of days subtraction syntax
-        db_engine = cursor.db.settings_dict['ENGINE'].split('.')[-1]
-        dates_sub = SQL_DAY_SUB[db_engine]('dpo1.date')
+        source = cls._get_source(cursor)
+        logger.debug('Services changes source: {}'.format(source))
         result = {}
 
         progress = 0
         types = cls._get_types()
         for pricing_object_type in types:
-            additional = ADDITIONAL_DATA.get(pricing_object_type, {})
-            additional_fields = ','.join(additional.get('fields', []))
-            if additional_fields:
-                additional_fields += ','
-            additional_joins = '\n'.join(additional.get('joins', []))
-            additional_joins_conditions = '\n'.join(additional.get(
-                'joins_conditions',
-                []
-            ))
-            pricing_object_type_id = pricing_object_type.id
-            q = query.format(**locals())
-            cursor.execute(q)
+            query, params = cls._get_query(
+                source,
+                cursor,
+                start,
+                end,
+                pricing_object_type,
+                service_environments,
+            )
+            cursor.execute(query, params)
             result[pricing_object_type] = list(cursor.fetchall())
             progress += 100.0 / len(types)
             yield progress, result
@@ -5,11 +5,19 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import itertools
 import logging
 
+from django.conf import settings
 
 from ralph.util import plugin as plugin_runner
+from ralph_scrooge.plugins.report.base import BaseReportPlugin
 from ralph_scrooge.report.base_plugin_report import BasePluginReport
+from ralph_scrooge.report.costs_matrix import (
+    CostsMatrix,
+    decimal_zeros,
+    format_column,
+)
 from ralph_scrooge.utils.common import memoize, AttributeDict
 
 
@@ -21,6 +29,7 @@ class ServicesCostsReport(BasePluginReport):
     Reports for services
     """
     cache_section = 'services-costs-report'
+    chunked_result = True
 
     @classmethod
     @memoize
@@ -113,6 +122,144 @@ class ServicesCostsReport(BasePluginReport):
                 raise
         yield 100, data
 
+    @classmethod
+    def _is_matrix_plugin(cls, plugin):
+        """
+        Returns True if costs of plugin could be taken from costs matrix
+        (plugin uses default costs of base usage, calculated by
+        `BaseReportPlugin.costs`).
+        """
+        report_plugin = plugin_runner.BY_NAME['scrooge_reports'].get(
+            plugin.plugin_name
+        )
+        return (
+            'base_usage' in plugin.get('plugin_kwargs', {}) and
+            isinstance(report_plugin, BaseReportPlugin) and
+            type(report_plugin).costs.im_func is BaseReportPlugin.costs.im_func
+        )
+
+    @classmethod
+    def _get_plugin_columns(
+        cls,
+        plugin,
+        schema,
+        start,
+        end,
+        forecast,
+        services_environments,
+    ):
+        """
+        Returns formatted columns of plugin (calculated by plugin, not taken
+        from costs matrix) and list of costs (per service environment) to
+        include in total cost.
+        """
+        data = plugin_runner.run(
+            'scrooge_reports',
+            plugin.plugin_name,
+            start=start,
+            end=end,
+            forecast=forecast,
+            type='costs',
+            **plugin.get('plugin_kwargs', {})
+        )
+        columns = []
+        usage_costs = decimal_zeros(len(services_environments))
+        for field_name, field_rules in schema.iteritems():
+            column = []
+            for i, se in enumerate(services_environments):
+                field_content, usage_cost = cls._prepare_field(
+                    field_name,
+                    field_rules,
+                    data.get(se.id, {}),
+                )
+                column.append(field_content)
+                usage_costs[i] += usage_cost
+            columns.append(column)
+        return columns, usage_costs
+
+    @classmethod
+    def _get_partial_report(cls, columns, columns_count):
+        """
+        Returns rows of report with only first (already calculated) columns
+        filled in (the rest of columns is empty).
+        """
+        missing = [''] * (columns_count - len(columns))
+        return [list(row) + missing for row in zip(*columns)]
+
+    @classmethod
+    def _get_columnar_report(cls, start, end, forecast, services_environments):
+        """
+        Build report using costs matrix - costs of every base usage are
+        fetched using single query and formatted column by column.
+        Plugins which calculate costs in custom way are called separately.
+
+        Report is built plugin by plugin - partial report (with columns of
+        already processed plugins) is yielded every time when progress is
+        incremented by `progress_update`.
+
+        :returns tuple: percent of progress and prepared data to generating
+            report in html
+        :rtype tuple:
+        """
+        plugins_schemas = cls._get_plugins_schemas()
+        matrix = CostsMatrix(
+            [se.id for se in services_environments],
+            [
+                plugin.plugin_kwargs['base_usage'].id
+                for plugin, schema in plugins_schemas
+                if cls._is_matrix_plugin(plugin)
+            ],
+        )
+        matrix.load(start, end, forecast)
+        columns = []
+        # every column of plugins and total cost
+        columns_count = sum(
+            len(schema) for plugin, schema in plugins_schemas
+        ) + 1
+        total_cost = decimal_zeros(len(services_environments))
+        last_progress = 0
+        for i, (plugin, schema) in enumerate(plugins_schemas):
+            if cls._is_matrix_plugin(plugin):
+                base_usage = plugin.plugin_kwargs['base_usage']
+                report_plugin = plugin_runner.BY_NAME['scrooge_reports'][
+                    plugin.plugin_name
+                ]
+                for field_name, field_rules in schema.iteritems():
+                    if field_name == (
+                        report_plugin.base_usage_cost_symbol or ''
+                    ).format(base_usage.id):
+                        values = matrix.get_costs(base_usage.id)
+                    else:
+                        values = matrix.get_values(base_usage.id)
+                    column, usage_costs = format_column(values, field_rules)
+                    columns.append(column)
+                    if usage_costs is not None:
+                        total_cost += usage_costs
+            else:
+                plugin_columns, usage_costs = cls._get_plugin_columns(
+                    plugin,
+                    schema,
+                    start,
+                    end,
+                    forecast,
+                    services_environments,
+                )
+                columns.extend(plugin_columns)
+                total_cost += usage_costs
+            progress = 100 * (i + 1) / len(plugins_schemas)
+            if (
+                progress < 100 and
+                progress - last_progress > cls.progress_update
+            ):
+                yield progress, cls._get_partial_report(
+                    columns,
+                    columns_count,
+                )
+                last_progress = progress
+        columns.append(['{0:.2f}'.format(cost) for cost in total_cost])
+        # rows are produced lazily (to store them in blocks one by one)
+        yield 100, (list(row) for row in itertools.izip(*columns))
+
     @classmethod
     def get_data(
         cls,
@@ -132,6 +279,15 @@ class ServicesCostsReport(BasePluginReport):
         """
         logger.info("Generating report from {0} to {1}".format(start, end))
         services_environments = cls._get_services_environments(is_active)
+        if settings.SCROOGE_COLUMNAR_COSTS_REPORT:
+            for progress, data in cls._get_columnar_report(
+                start,
+                end,
+                forecast,
+                list(services_environments),
+            ):
+                yield progress, data
+            return
         for progress, data in cls._get_report_data(
             start,
             end,
@@ -1,17 +1,35 @@
 # -*- coding: utf-8 -*-
+"""
+Report with usages of resources (usage types) by service environments per
+days.
+
+By default (SCROOGE_VECTORIZED_USAGES_REPORT) usages of all usage types are
+fetched using single grouped query and stored in 3-D NumPy array (service
+environment x day x usage type). Rows are formatted lazily, service
+environment by service environment (divide_by and rounding are applied to
+whole column of usage type using NumPy, so halves are rounded to even).
+Usage types with custom report plugins are still processed by their
+plugins.
+"""
 
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import itertools
 import logging
 from dateutil import rrule
 from decimal import Decimal as D
 
+import numpy as np
+from django.conf import settings
+from django.db.models import Sum
 from django.utils.translation import ugettext_lazy as _
 
 from ralph.util import plugin as plugin_runner
+from ralph_scrooge.models import DailyUsage
+from ralph_scrooge.plugins.report.usage_type import UsageTypePlugin
 from ralph_scrooge.report.base_plugin_report import BasePluginReport
 
 
@@ -24,6 +42,7 @@ class ServicesUsagesReport(BasePluginReport):
     per days
     """
     cache_section = 'services-usages-report'
+    chunked_result = True
 
     @classmethod
     def _prepare_field(cls, value, usage_type):
@@ -154,6 +173,143 @@ class ServicesUsagesReport(BasePluginReport):
                 raise
         return data
 
+    @classmethod
+    def _is_default_usages_plugin(cls, usage_type):
+        """
+        Returns True if usages of usage type are calculated by default
+        `UsageTypePlugin.usages` (so they could be fetched together with
+        usages of other usage types).
+        """
+        report_plugin = plugin_runner.BY_NAME['scrooge_reports'].get(
+            usage_type.get_plugin_name()
+        )
+        # UsageTypePlugin is registered plugin (instance of plugin class)
+        plugin_class = type(UsageTypePlugin)
+        return (
+            isinstance(report_plugin, plugin_class) and
+            type(report_plugin).usages.im_func is plugin_class.usages.im_func
+        )
+
+    @classmethod
+    def _get_usages_array(
+        cls,
+        start,
+        end,
+        usage_types,
+        service_environments,
+    ):
+        """
+        Returns 3-D array of usages (service environment x day x usage type).
+        """
+        se_index = dict(
+            (se.id, i) for i, se in enumerate(service_environments)
+        )
+        ut_index = dict((ut.id, i) for i, ut in enumerate(usage_types))
+        usages = np.zeros(
+            (len(service_environments), (end - start).days + 1, len(ut_index))
+        )
+        default_usage_types = []
+        for usage_type in usage_types:
+            if cls._is_default_usages_plugin(usage_type):
+                default_usage_types.append(usage_type)
+                continue
+            # usage type with custom plugin
+            try:
+                plugin_report = plugin_runner.run(
+                    'scrooge_reports',
+                    usage_type.get_plugin_name(),
+                    type='usages',
+                    start=start,
+                    end=end,
+                    usage_type=usage_type,
+                    service_environments=service_environments,
+                )
+            except KeyError:
+                logger.warning("Usage '{0}' has no usage plugin".format(
+                    usage_type.get_plugin_name()
+                ))
+                continue
+            for day, day_usages in plugin_report.iteritems():
+                for se_id, value in day_usages.iteritems():
+                    if se_id in se_index:
+                        usages[
+                            se_index[se_id],
+                            (day - start).days,
+                            ut_index[usage_type.id],
+                        ] = value
+        if default_usage_types:
+            daily_usages = DailyUsage.objects.filter(
+                date__gte=start,
+                date__lte=end,
+                type__in=default_usage_types,
+            ).values_list(
+                'service_environment_id',
+                'date',
+                'type_id',
+            ).annotate(
+                total=Sum('value'),
+            )
+            for se_id, day, type_id, total in daily_usages:
+                if se_id in se_index:
+                    usages[
+                        se_index[se_id],
+                        (day - start).days,
+                        ut_index[type_id],
+                    ] = total or 0
+        return usages
+
+    @classmethod
+    def _format_usages(cls, usages, usage_type):
+        """
+        Format usages (1-D array) of single usage type. Rounding is applied
+        to whole array (using NumPy, so halves are rounded to even).
+
+        :returns list: list of formatted usages
+        """
+        if usage_type.divide_by:
+            usages = usages / float(10 ** usage_type.divide_by)
+        rounding = usage_type.rounding
+        return [
+            '{:.{prec}f}'.format(value, prec=rounding)
+            for value in np.round(usages, rounding).tolist()
+        ]
+
+    @classmethod
+    def _get_vectorized_report(
+        cls,
+        start,
+        end,
+        usage_types,
+        service_environments,
+    ):
+        """
+        Build report using 3-D array of usages.
+
+        :returns generator: rows of report (produced lazily)
+        """
+        usages = cls._get_usages_array(
+            start,
+            end,
+            usage_types,
+            service_environments,
+        )
+
+        def format_row(se_usages):
+            # se_usages is 2-D array (day x usage type) of single service
+            # environment; row contains usages of every usage type day by day
+            columns = [
+                cls._format_usages(se_usages[:, i], usage_type)
+                for i, usage_type in enumerate(usage_types)
+            ]
+            return list(itertools.chain.from_iterable(
+                itertools.izip(*columns)
+            ))
+
+        return (
+            [se.service.name, se.environment.name] + format_row(se_usages)
+            for se, se_usages in itertools.izip(service_environments, usages)
+        )
+
     @classmethod
     def get_data(
         cls,
@@ -181,6 +337,14 @@ class ServicesUsagesReport(BasePluginReport):
             )
         )
         service_environments = cls._get_services_environments(is_active)
+        if settings.SCROOGE_VECTORIZED_USAGES_REPORT:
+            yield 100, cls._get_vectorized_report(
+                start,
+                end,
+                list(usage_types),
+                list(service_environments),
+            )
+            return
         data = cls._get_report_data(
             start,
             end,
@@ -12,6 +12,7 @@ from ralph_scrooge.rest.costcard import (
 )
 from ralph_scrooge.rest.object_costs import (
     ObjectCostsContent,
+    ObjectCostsPageContent,
 )
 
 
@@ -23,4 +24,5 @@ __all__ = [
     'CostCardContent',
     'left_menu',
     'ObjectCostsContent',
+    'ObjectCostsPageContent',
 ]
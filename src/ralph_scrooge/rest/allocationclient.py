@@ -31,6 +31,7 @@ from ralph_scrooge.models import (
     TeamServiceEnvironmentPercent,
     UsageType,
 )
+from ralph_scrooge.utils.costs_changes import register_costs_input_change
 
 
 class CannotDetermineValidServiceUsageTypeError(APIException):
@@ -236,6 +237,11 @@ class AllocationClientService(APIView):
                         value=row['value'],
                         type=service_usage_type.usage_type,
                     )
+            register_costs_input_change(
+                [service_usage_type.usage_type_id],
+                first_day,
+                last_day,
+            )
         if kwargs.get('allocate_type') == 'serviceextracost':
             service_environment = ServiceEnvironment.objects.get(
                 service__id=service,
@@ -5,26 +5,40 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import hashlib
 from decimal import Decimal as D
 
-from django.db.models import Sum
+from django.conf import settings
+from django.core.cache import get_cache
+from django.utils import translation
 from django.utils.translation import ugettext as _
 from rest_framework.response import Response
-from rest_framework.status import HTTP_404_NOT_FOUND
+from rest_framework.status import HTTP_304_NOT_MODIFIED, HTTP_404_NOT_FOUND
 from rest_framework.views import APIView
 
 from ralph_scrooge.models import (
     BaseUsage,
     CostDateStatus,
-    DailyCost,
     ServiceEnvironment,
 )
 from ralph_scrooge.rest.common import get_dates
+from ralph_scrooge.utils.common import get_cache_name
+from ralph_scrooge.utils.monthly_costs import (
+    get_costs_sums,
+    get_month_version,
+)
 
 
 class CostCardContent(APIView):
     """
     Collect and sort all pre-generated costs per BaseUsage.
+
+    Responses are cached (in `scrooge_costcard` cache) under key containing
+    current version of costs of month, so cached response is not used anymore
+    when costs of month are accepted. Response contains translated texts, so
+    the key contains active language too. ETag of response is built from the
+    same key, so revalidation (using If-None-Match) does not require any
+    query.
     """
     def get(self, request, service, env, month, year, format=None):
         """
@@ -37,23 +51,50 @@ class CostCardContent(APIView):
         :returns object: json response
         """
         first_day, last_day, days_in_month = get_dates(year, month)
-        try:
-            service_environment = ServiceEnvironment.objects.get(
-                service__id=service,
-                environment_id=env,
-            )
-        except ServiceEnvironment.DoesNotExist:
+        forecast = bool(request.QUERY_PARAMS.get('forecast', False))
+        key = b'scrooge_costcard:{}:{}:{}:{}:{}:{}'.format(
+            get_month_version(first_day, forecast),
+            service,
+            env,
+            first_day.strftime('%Y-%m'),
+            'forecast' if forecast else 'real',
+            translation.get_language(),
+        )
+        etag = '"{}"'.format(hashlib.md5(key).hexdigest())
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
             return Response(
-                {
-                    "status": False,
-                    "message": _(
-                        "Service {0} or environment {1} "
-                        "does not exist".format(service, env)
-                        )
-                },
-                status=HTTP_404_NOT_FOUND
+                status=HTTP_304_NOT_MODIFIED,
+                headers={'ETag': etag},
+            )
+        cache = get_cache(get_cache_name('scrooge_costcard'))
+        data = cache.get(key)
+        if data is None:
+            try:
+                service_environment = ServiceEnvironment.objects.get(
+                    service__id=service,
+                    environment_id=env,
+                )
+            except ServiceEnvironment.DoesNotExist:
+                return Response(
+                    {
+                        "status": False,
+                        "message": _(
+                            "Service {0} or environment {1} "
+                            "does not exist".format(service, env)
+                            )
+                    },
+                    status=HTTP_404_NOT_FOUND
+                )
+            data = self._get_costs(
+                service_environment,
+                first_day,
+                last_day,
+                forecast,
             )
-        forecast = request.QUERY_PARAMS.get('forecast', False)
+            cache.set(key, data, settings.SCROOGE_COSTCARD_CACHE_TIMEOUT)
+        return Response(data, headers={'ETag': etag})
+
+    def _get_costs(self, service_environment, first_day, last_day, forecast):
         dates = CostDateStatus.objects.filter(
             date__gte=first_day,
             date__lte=last_day,
@@ -61,40 +102,38 @@ class CostCardContent(APIView):
         ).values_list('date', flat=True)
 
         if len(dates) == 0:
-            return Response({
+            return {
                 "status": False,
                 "message": _(
                     'There are no accepted costs for chosen date.'
                     ' Please choose different date or back later.'
                 )
-            })
+            }
 
-        monthly_costs = DailyCost.objects.filter(
-            date__in=dates,
+        monthly_costs = get_costs_sums(
+            first_day,
+            last_day,
+            forecast,
+            ['type'],
             service_environment=service_environment,
-            forecast=forecast,
-        ).values(
-            'type'
-        ).annotate(
-            sum_cost=Sum('cost')
         )
 
         base_usages = {bu.id: bu.name for bu in BaseUsage.objects.all()}
 
         total = D(0)
         results = []
-        for monthly_cost in monthly_costs:
+        for type_id, sum_value, sum_cost in monthly_costs:
             results.append({
-                'name': base_usages[monthly_cost['type']],
-                'cost': round(monthly_cost['sum_cost'], 2)
+                'name': base_usages[type_id],
+                'cost': round(sum_cost, 2)
             })
-            total += monthly_cost['sum_cost']
+            total += sum_cost
         results.append({
             'name': _('Total'),
             'cost': round(total, 2),
         })
 
-        return Response({
+        return {
             "status": True,
             "results": results
-        })
+        }
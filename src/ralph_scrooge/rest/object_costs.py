@@ -6,19 +6,26 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import datetime
+
 from django.conf import settings
-from django.db.models import Sum, Q
+from django.db.models import Q
 from django.template.defaultfilters import slugify
+from django.utils.translation import ugettext as _
 from rest_framework.response import Response
+from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
 
 from ralph_scrooge.rest.components import ComponentsContent
 from ralph_scrooge.models import (
-    DailyCost,
     PricingObject,
-    CostDateStatus,
     PricingObjectType,
     PRICING_OBJECT_TYPES,
 )
+from ralph_scrooge.utils.monthly_costs import get_costs_sums
+
+
+def _parse_date(date):
+    return datetime.datetime.strptime(date, '%Y-%m-%d').date()
 
 
 class ObjectCostsContent(ComponentsContent):
@@ -34,9 +41,7 @@ class ObjectCostsContent(ComponentsContent):
             name__in=settings.PRICING_OBJECTS_COSTS_TABLE_SCHEMA.keys()
         )
 
-    def get_daily_pricing_objects(
-            self, start_date, end_date, service, env=None
-    ):
+    def _get_pricing_objects(self, start_date, end_date, service, env=None):
         query = PricingObject.objects.filter(
             daily_pricing_objects__service_environment__service__id=service,
             daily_pricing_objects__date__gte=start_date,
@@ -46,46 +51,61 @@ class ObjectCostsContent(ComponentsContent):
             query = query.filter(
                 daily_pricing_objects__service_environment__environment__id=env
             )
-        query = query.distinct()
-        query_daily_cost = DailyCost.objects.filter(
-            pricing_object_id__in=query.values_list('id', flat=True),
-            forecast=False,
-            date__in=CostDateStatus.objects.filter(
-                accepted=True,
-                date__gte=start_date,
-                date__lte=end_date
-            ).values_list('date', flat=True),
-            service_environment__service__id=service
-        )
+        return query.distinct()
+
+    def _get_costs(
+        self, start_date, end_date, service, env, pricing_objects_ids
+    ):
+        """
+        Returns costs (list of tuples (pricing object id, type name, value,
+        cost)) of pricing objects grouped by pricing object.
+        """
+        filters = {}
         if env:
-            query_daily_cost = query_daily_cost.filter(
-                service_environment__environment_id=env
-            )
-        query_daily_cost = query_daily_cost.values_list(
-            'pricing_object_id', 'type__name'
-        ).annotate(Sum('value')).annotate(Sum('cost'))
+            filters['service_environment__environment_id'] = env
+        query_daily_cost = get_costs_sums(
+            _parse_date(start_date),
+            _parse_date(end_date),
+            False,
+            ['pricing_object_id', 'type__name'],
+            pricing_object_id__in=pricing_objects_ids,
+            service_environment__service__id=service,
+            **filters
+        )
         daily_costs = {}
         for cost in query_daily_cost:
             daily_costs.setdefault(cost[0], []).append(cost)
+        return daily_costs
+
+    def get_daily_pricing_objects(
+            self, start_date, end_date, service, env=None
+    ):
+        query = self._get_pricing_objects(start_date, end_date, service, env)
+        daily_costs = self._get_costs(
+            start_date,
+            end_date,
+            service,
+            env,
+            query.values_list('id', flat=True),
+        )
         return (query, daily_costs)
 
-    def process_single_type(self, single_type, data):
-        """Appends some extra data to every row"""
-        query_pricing_object, daily_costs = data
+    def _get_values(self, pricing_objects, daily_costs):
+        """
+        Returns rows of pricing objects (first field of every pricing object
+        is it's id) with nested costs.
+        """
         values = []
-        django_fields, headers = self.process_schema(
-            settings.PRICING_OBJECTS_COSTS_TABLE_SCHEMA[single_type.name]
-        )
-        django_fields.insert(0, 'id')
-        for po in query_pricing_object.filter(
-            type=single_type,
-        ).values_list(*django_fields):
+        for po in pricing_objects:
             value = {k: v for k, v in enumerate(po[1:])}
             value['__nested'] = [
                 {str(k): v for k, v in enumerate(daily_cost[1:])}
                 for daily_cost in daily_costs.get(po[0], [])
             ]
             values.append(value)
+        return values
+
+    def _get_type_data(self, single_type, values, headers):
         return {
             'name': single_type.name,
             'icon_class': single_type.icon_class,
@@ -98,28 +118,37 @@ class ObjectCostsContent(ComponentsContent):
             'color': single_type.color,
         }
 
+    def process_single_type(self, single_type, data):
+        """Appends some extra data to every row"""
+        query_pricing_object, daily_costs = data
+        django_fields, headers = self.process_schema(
+            settings.PRICING_OBJECTS_COSTS_TABLE_SCHEMA[single_type.name]
+        )
+        django_fields.insert(0, 'id')
+        values = self._get_values(
+            query_pricing_object.filter(
+                type=single_type,
+            ).values_list(*django_fields),
+            daily_costs,
+        )
+        return self._get_type_data(single_type, values, headers)
+
     def _get_rest_of_costs(self, start_date, end_date, service, env=None):
-        query_daily_cost = DailyCost.objects.filter(
-            Q(pricing_object_id=None) |
-            Q(pricing_object__type_id__in=[
+        filters = {}
+        if env:
+            filters['service_environment__environment_id'] = env
+        query_daily_cost = get_costs_sums(
+            _parse_date(start_date),
+            _parse_date(end_date),
+            False,
+            ['type__name'],
+            q=Q(pricing_object_id=None) | Q(pricing_object__type_id__in=[
                 PRICING_OBJECT_TYPES.UNKNOWN,
                 PRICING_OBJECT_TYPES.DUMMY
             ]),  # Dummy and unknown
-            forecast=False,
-            date__in=CostDateStatus.objects.filter(
-                accepted=True,
-                date__gte=start_date,
-                date__lte=end_date
-            ).values_list('date', flat=True),
-            service_environment__service__id=service
+            service_environment__service__id=service,
+            **filters
         )
-        if env:
-            query_daily_cost = query_daily_cost.filter(
-                service_environment__environment_id=env
-            )
-        query_daily_cost = query_daily_cost.values_list(
-            'type__name'
-        ).annotate(Sum('value')).annotate(Sum('cost'))
         daily_costs = []
         for cost in query_daily_cost:
             daily_costs.append({str(k): v for k, v in enumerate(cost)})
@@ -143,3 +172,93 @@ class ObjectCostsContent(ComponentsContent):
             *args, **kwargs
         ))
         return Response(results if results else [])
+
+
+class ObjectCostsPageContent(ObjectCostsContent):
+    """
+    Single page of pricing objects (of single type) with their costs.
+
+    Pricing objects are paginated using keyset pagination on pricing object
+    id - `after` query param is id of last pricing object on previous page
+    (returned as `next` in response; `next` is null on the last page). Page
+    size is passed in `limit` query param (PRICING_OBJECTS_COSTS_PAGE_SIZE
+    by default, no more than PRICING_OBJECTS_COSTS_MAX_PAGE_SIZE).
+    """
+    def get_page(
+        self, single_type, start_date, end_date, service, env, after, limit
+    ):
+        django_fields, headers = self.process_schema(
+            settings.PRICING_OBJECTS_COSTS_TABLE_SCHEMA[single_type.name]
+        )
+        django_fields.insert(0, 'id')
+        pricing_objects = list(self._get_pricing_objects(
+            start_date,
+            end_date,
+            service,
+            env,
+        ).filter(
+            type=single_type,
+            id__gt=after,
+        ).order_by('id').values_list(*django_fields)[:limit])
+        daily_costs = self._get_costs(
+            start_date,
+            end_date,
+            service,
+            env,
+            [po[0] for po in pricing_objects],
+        ) if pricing_objects else {}
+        result = self._get_type_data(
+            single_type,
+            self._get_values(pricing_objects, daily_costs),
+            headers,
+        )
+        result['next'] = (
+            pricing_objects[-1][0] if len(pricing_objects) == limit else None
+        )
+        return result
+
+    def get(
+        self, request, start_date, end_date, service, type_id, env=None
+    ):
+        try:
+            after = int(request.QUERY_PARAMS.get('after', 0))
+            limit = min(
+                int(request.QUERY_PARAMS.get(
+                    'limit',
+                    settings.PRICING_OBJECTS_COSTS_PAGE_SIZE,
+                )),
+                settings.PRICING_OBJECTS_COSTS_MAX_PAGE_SIZE,
+            )
+        except ValueError:
+            limit = 0
+        if limit <= 0:
+            return Response(
+                {
+                    'status': False,
+                    'message': _('Invalid after or limit param'),
+                },
+                status=HTTP_400_BAD_REQUEST
+            )
+        try:
+            single_type = self.get_types().get(id=type_id)
+        except PricingObjectType.DoesNotExist:
+            return Response(
+                {
+                    'status': False,
+                    'message': _(
+                        'Pricing object type {} does not exist'.format(
+                            type_id
+                        )
+                    ),
+                },
+                status=HTTP_404_NOT_FOUND
+            )
+        return Response(self.get_page(
+            single_type,
+            start_date,
+            end_date,
+            service,
+            env,
+            after,
+            limit,
+        ))
@@ -16,6 +16,7 @@ from ralph_scrooge.rest import (
     CostCardContent,
     ComponentsContent,
     ObjectCostsContent,
+    ObjectCostsPageContent,
 )
 
 from ralph_scrooge.rest.menu import SubMenu
@@ -68,6 +69,11 @@ urlpatterns = patterns(
         service_permission(ObjectCostsContent.as_view()),
         name='pricing_object_costs'
     ),
+    url(
+        r'^pricing_object_costs/(?P<service>\d+)/(?P<env>\d+)/(?P<start_date>[0-9-]+)/(?P<end_date>[0-9-]+)/(?P<type_id>\d+)/?$',  # noqa
+        service_permission(ObjectCostsPageContent.as_view()),
+        name='pricing_object_costs_page'
+    ),
     url(
         r'^submenu/?$',
         login_required(SubMenu.as_view()),
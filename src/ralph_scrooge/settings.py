@@ -5,6 +5,8 @@ SSH_NFSEN_CREDENTIALS = {}
 NFSEN_CHANNELS = []
 NFSEN_CLASS_ADDRESS = []
 NFSEN_FILES_PATH = ''
+# max number of nfdump commands executed at the same time (on all servers)
+NFSEN_MAX_SESSIONS = 4
 
 # Virtual Usages plugin default config
 VIRTUAL_SERVICES = {}
@@ -14,6 +16,11 @@ SHARE_SERVICES = {}
 
 # OpenStack
 OPENSTACK_CEILOMETER = []
+# number of ceilometer sites processed at the same time (every site in
+# separate thread)
+OPENSTACK_CEILOMETER_THREADS = 1
+# number of documents fetched at once from ceilometer MongoDB
+OPENSTACK_CEILOMETER_BATCH_SIZE = 1000
 OPENSTACK_SIMPLE_USAGES = []
 OPENSTACK_TENANTS_MODELS = []
 
@@ -41,6 +48,37 @@ COLLECT_PLUGINS = set([
     'vip',
     'virtual',
 ])
+# time (in seconds) after which collect plugin run in parallel sync
+# (scrooge_sync --parallel) is marked as failed if its worker did not report
+# back (ex. was killed); None means no limit
+COLLECT_PLUGIN_TIMEOUT = 60 * 60 * 6  # 6 hours
+# collect plugins with master data (not related to particular day) - in
+# multi-day backfill (scrooge_sync --start/--end) they are run only once
+COLLECT_MASTER_DATA_PLUGINS = set([
+    'asset_model',
+    'business_line',
+    'environment',
+    'owner',
+    'profit_center',
+    'service',
+    'warehouse',
+])
+# daily collect plugins which create pricing objects (using get-or-create
+# logic) - in multi-day backfill they are run day by day in main process;
+# remaining daily plugins are run for many days in parallel: blade_server,
+# san, share and openstack_simple_usage (fixed set of usage types, created
+# by the first day of backfill, which is run in main process) and ceilometer
+# plugins (usage type per flavor - flavor appearing first time on many days
+# is created by get_or_create, which falls back to fetching usage type
+# created concurrently)
+COLLECT_PRICING_OBJECTS_PLUGINS = set([
+    'asset',
+    'database',
+    'netflow',
+    'tenant',
+    'vip',
+    'virtual',
+])
 
 UNKNOWN_SERVICES_ENVIRONMENTS = {
     'tenant': {},
@@ -51,10 +89,61 @@ ADDITIONAL_PRICING_OBJECT_TYPES = {}
 
 SAVE_ONLY_FIRST_DEPTH_COSTS = True
 DAILY_COST_CREATE_BATCH_SIZE = 10000
+DAILY_USAGE_CREATE_BATCH_SIZE = 10000
+# number of assets processed at once by asset collect plugin (0 to process
+# every asset separately)
+ASSET_COLLECT_BATCH_SIZE = 1000
+# max number of params of single `__in` query (SQLite allows at most 999)
+IN_QUERY_BATCH_SIZE = 500
+# write daily costs using COPY (PostgreSQL) or LOAD DATA (MySQL) if available
+SCROOGE_COSTS_FAST_WRITE = True
+# build services costs report using single grouped query of daily costs
+# (instead of querying costs of every column by report plugins)
+SCROOGE_COLUMNAR_COSTS_REPORT = True
+# build services usages report using single grouped query of daily usages
+# and 3-D NumPy array (instead of querying usages of every usage type)
+SCROOGE_VECTORIZED_USAGES_REPORT = True
+# source of services changes report: 'window' - LAG window function over
+# daily pricing objects (with fallback to 'self_join' if it's not supported
+# by database), 'self_join' - self-join of daily pricing objects, 'log' - log
+# of changes rebuilt by scrooge_sync after every synchronized day (daily
+# pricing objects created outside of it, ex. by API, are not in the log)
+SCROOGE_SERVICES_CHANGES_SOURCE = 'window'
 SCROOGE_COSTS_MASTER_SLEEP = 1
+# number of processes used to collect costs for single day (1 - serially)
+SCROOGE_COSTS_COLLECT_PROCESSES = 1
+# shared (between processes) memo of plugins total costs; possible values:
+# None (disabled), 'ralph_scrooge.utils.costs_memo.DjangoCacheCostsMemo' or
+# 'ralph_scrooge.utils.costs_memo.SQLiteCostsMemo'
+SCROOGE_COSTS_MEMO = None
+SCROOGE_COSTS_MEMO_TIMEOUT = 60 * 60 * 24  # 24 hours
+SCROOGE_COSTS_MEMO_SQLITE_PATH = '/tmp/scrooge_costs_memo.sqlite'
+# versions of monthly costs (see ralph_scrooge.utils.monthly_costs) and cached
+# cost card responses (stored in `scrooge_monthly_costs` and
+# `scrooge_costcard` caches - `default` if not configured); versions are
+# computed from the database if `scrooge_monthly_costs` cache is not shared
+# between processes (ex. local memory cache)
+SCROOGE_MONTHLY_COSTS_VERSION_TIMEOUT = 60 * 60 * 24 * 7  # 7 days
+SCROOGE_COSTCARD_CACHE_TIMEOUT = 60 * 60 * 24  # 24 hours
+# distribute pricing services costs using NumPy (see
+# ralph_scrooge.plugins.cost.distribution for rounding policy)
+SCROOGE_COSTS_VECTORIZED_DISTRIBUTION = False
+# directory for usages pushed to async API (has to be accessible by RQ
+# workers, ex. shared volume); async API is disabled (returns 503) if None
+SCROOGE_USAGES_UPLOAD_DIR = None
+# number of rows (usages objects) of async usages push saved at once
+SCROOGE_USAGES_INGESTION_BATCH_SIZE = 1000
+
+# number of rows of report stored in single cache value (see
+# ralph_scrooge.utils.report_storage)
+SCROOGE_REPORT_BLOCK_SIZE = 1000
 
 TESTING = 'test' in sys.argv
 
+# default and max number of pricing objects on single page of pricing objects
+# costs (see ralph_scrooge.rest.object_costs.ObjectCostsPageContent)
+PRICING_OBJECTS_COSTS_PAGE_SIZE = 500
+PRICING_OBJECTS_COSTS_MAX_PAGE_SIZE = 5000
 PRICING_OBJECTS_COSTS_TABLE_SCHEMA = {
     'Asset': {
         'fields': [
@@ -6,7 +6,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import datetime
-from mock import call, patch
+from mock import call, Mock, patch
 
 from django.core.management import call_command
 from django.test import TestCase
@@ -14,12 +14,33 @@ from django.test.utils import override_settings
 
 from ralph.util import plugin
 from ralph_scrooge.management.commands import scrooge_sync
+from ralph_scrooge.models import SyncStatus
 
 
 COLLECT_PLUGINS = ['asset', 'business_line', 'warehouse']
 COMMAND_NAME = scrooge_sync.Command.__module__.split('.')[-1]
 
 
+class SerialPool(object):
+    """
+    Pool of processes replacement which runs tasks in current process.
+    """
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def apply_async(self, func, args, callback=None):
+        result = func(*args)
+        if callback:
+            callback(result)
+        return Mock(get=Mock(return_value=result))
+
+    def terminate(self):
+        pass
+
+    def join(self):
+        pass
+
+
 class TestScroogeSync(TestCase):
     def test_load_plugins(self):
         scrooge_sync._load_plugins()
@@ -87,8 +108,214 @@ class TestScroogeSync(TestCase):
         ]))
 
     @override_settings(COLLECT_PLUGINS=COLLECT_PLUGINS)
+    @patch.object(scrooge_sync, '_get_pool', SerialPool)
+    @patch('ralph_scrooge.management.commands.scrooge_sync._run_plugin')
+    def test_run_plugins_parallel(self, run_plugin_mock):
+        def side_effect(name, today):
+            if name == 'business_line':
+                raise scrooge_sync.PluginError()
+        run_plugin_mock.side_effect = side_effect
+        today = datetime.date.today()
+        timings = {}
+        result = [r for r in scrooge_sync.run_plugins_parallel(
+            today,
+            COLLECT_PLUGINS + ['abc', 'def'],
+            4,
+            timings,
+        )]
+        # the same as in serial run - asset plugin has not fulfilled
+        # dependiencies
+        run_plugin_mock.assert_has_calls(
+            [
+                call('business_line', today),
+                call('warehouse', today),
+            ],
+            any_order=True
+        )
+        self.assertEquals(set(result), set([
+            ('business_line', False),
+            ('warehouse', True),
+        ]))
+        self.assertEquals(set(timings.keys()), set([
+            'business_line',
+            'warehouse',
+        ]))
+        self.assertFalse(timings['business_line'][1])
+        self.assertTrue(timings['warehouse'][1])
+
+    @override_settings(
+        COLLECT_PLUGINS=COLLECT_PLUGINS,
+        COLLECT_PLUGIN_TIMEOUT=0.01,
+    )
+    @patch.object(scrooge_sync, '_get_pool')
+    @patch('ralph_scrooge.management.commands.scrooge_sync._run_plugin')
+    def test_run_plugins_parallel_timeout(
+        self,
+        run_plugin_mock,
+        get_pool_mock,
+    ):
+        pool = SerialPool()
+        apply_async = pool.apply_async
+
+        def lost_apply_async(func, args, callback=None):
+            # worker running business_line plugin died - its result is never
+            # reported back
+            if args[0] == 'business_line':
+                return Mock()
+            return apply_async(func, args, callback)
+
+        pool.apply_async = lost_apply_async
+        get_pool_mock.return_value = pool
+        today = datetime.date.today()
+        timings = {}
+        result = list(scrooge_sync.run_plugins_parallel(
+            today,
+            COLLECT_PLUGINS,
+            4,
+            timings,
+        ))
+        self.assertEquals(set(result), set([
+            ('business_line', False),
+            ('warehouse', True),
+        ]))
+        self.assertFalse(timings['business_line'][1])
+        status = SyncStatus.objects.get(date=today, plugin='business_line')
+        self.assertFalse(status.success)
+        self.assertEquals(status.remarks, 'Timeout')
+
+    @override_settings(COLLECT_PLUGINS=COLLECT_PLUGINS)
+    @patch('ralph_scrooge.management.commands.scrooge_sync.'
+           'run_plugins_parallel')
+    def test_command_parallel(self, run_plugins_parallel_mock):
+        def side_effect(today, plugins, processes, timings):
+            timings['warehouse'] = (1.5, True)
+            return iter([('warehouse', True)])
+        run_plugins_parallel_mock.side_effect = side_effect
+        today = datetime.date.today()
+        call_command(COMMAND_NAME, parallel=2)
+        run_plugins_parallel_mock.assert_called_with(
+            today,
+            COLLECT_PLUGINS,
+            2,
+            {'warehouse': (1.5, True)},
+        )
+
+    def _backfill(self, processes=1, plugins=None):
+        SyncStatus.objects.create(
+            date=datetime.date(2014, 1, 2),
+            plugin='profit_center',
+            success=True,
+        )
+        return list(scrooge_sync.run_plugins_backfill(
+            datetime.date(2014, 1, 1),
+            datetime.date(2014, 1, 3),
+            plugins or ['business_line', 'profit_center'],
+            processes,
+        ))
+
+    @override_settings(COLLECT_MASTER_DATA_PLUGINS=set(['business_line']))
+    @patch('ralph_scrooge.management.commands.scrooge_sync._run_plugin')
+    def test_run_plugins_backfill(self, run_plugin_mock):
+        result = self._backfill()
+        # master data plugin is run only once (for the last day), daily
+        # plugin is not run for already synchronized day
+        self.assertEquals(result, [
+            (datetime.date(2014, 1, 3), 'business_line', True),
+            (datetime.date(2014, 1, 1), 'profit_center', True),
+            (datetime.date(2014, 1, 3), 'profit_center', True),
+        ])
+        self.assertEquals(run_plugin_mock.call_count, 3)
+
+    @override_settings(COLLECT_MASTER_DATA_PLUGINS=set(['business_line']))
+    @patch.object(scrooge_sync, '_get_pool', SerialPool)
+    @patch('ralph_scrooge.management.commands.scrooge_sync._run_plugin')
+    def test_run_plugins_backfill_parallel(self, run_plugin_mock):
+        result = self._backfill(processes=2)
+        self.assertEquals(result, [
+            (datetime.date(2014, 1, 3), 'business_line', True),
+            (datetime.date(2014, 1, 1), 'profit_center', True),
+            (datetime.date(2014, 1, 3), 'profit_center', True),
+        ])
+
+    @override_settings(
+        COLLECT_MASTER_DATA_PLUGINS=set(['business_line']),
+        COLLECT_PRICING_OBJECTS_PLUGINS=set(['profit_center']),
+    )
+    @patch.object(scrooge_sync, 'update_service_changes')
+    @patch.object(scrooge_sync, '_get_pool')
+    @patch('ralph_scrooge.management.commands.scrooge_sync._run_plugin')
+    def test_run_plugins_backfill_parallel_pricing_objects(
+        self,
+        run_plugin_mock,
+        get_pool_mock,
+        update_service_changes_mock,
+    ):
+        pool = SerialPool()
+        pool.apply_async = Mock(side_effect=pool.apply_async)
+        get_pool_mock.return_value = pool
+        result = self._backfill(
+            processes=2,
+            plugins=['business_line', 'profit_center', 'owner'],
+        )
+        # plugins creating pricing objects are run day by day before other
+        # daily plugins
+        self.assertEquals(result, [
+            (datetime.date(2014, 1, 3), 'business_line', True),
+            (datetime.date(2014, 1, 1), 'profit_center', True),
+            (datetime.date(2014, 1, 3), 'profit_center', True),
+            (datetime.date(2014, 1, 1), 'owner', True),
+            (datetime.date(2014, 1, 2), 'owner', True),
+            (datetime.date(2014, 1, 3), 'owner', True),
+        ])
+        # only remaining daily plugins are run in pool (except the first
+        # day, which is run in current process)
+        self.assertEquals(
+            [args[1][0] for args, kwargs in pool.apply_async.call_args_list],
+            [datetime.date(2014, 1, 2), datetime.date(2014, 1, 3)],
+        )
+        for args, kwargs in pool.apply_async.call_args_list:
+            self.assertEquals(args[1][1], ['owner'])
+        # services changes are rebuilt for days with pricing objects synced
+        self.assertEquals(update_service_changes_mock.call_args_list, [
+            call(datetime.date(2014, 1, 1)),
+            call(datetime.date(2014, 1, 3)),
+        ])
+
+    @override_settings(COLLECT_MASTER_DATA_PLUGINS=set(['business_line']))
+    @patch('ralph_scrooge.management.commands.scrooge_sync._run_plugin')
+    def test_run_plugins_backfill_master_data_failure(self, run_plugin_mock):
+        run_plugin_mock.side_effect = scrooge_sync.PluginError()
+        result = self._backfill()
+        self.assertEquals(result, [
+            (datetime.date(2014, 1, 3), 'business_line', False),
+        ])
+        self.assertFalse(SyncStatus.objects.get(
+            date=datetime.date(2014, 1, 1),
+            plugin='profit_center',
+        ).success)
+
+    @override_settings(COLLECT_PLUGINS=COLLECT_PLUGINS)
+    @patch('ralph_scrooge.management.commands.scrooge_sync.'
+           'run_plugins_backfill')
+    def test_command_backfill(self, run_plugins_backfill_mock):
+        run_plugins_backfill_mock.return_value = iter([])
+        call_command(
+            COMMAND_NAME,
+            start='2014-01-01',
+            end='2014-01-03',
+            parallel=2,
+        )
+        run_plugins_backfill_mock.assert_called_with(
+            datetime.date(2014, 1, 1),
+            datetime.date(2014, 1, 3),
+            COLLECT_PLUGINS,
+            2,
+        )
+
+    @override_settings(COLLECT_PLUGINS=COLLECT_PLUGINS)
+    @patch.object(scrooge_sync, 'update_service_changes')
     @patch('ralph_scrooge.management.commands.scrooge_sync.run_plugins')
-    def test_command(self, run_plugins_mock):
+    def test_command(self, run_plugins_mock, update_service_changes_mock):
         run_plugins_mock.iter.return_value.__iter__.return_value = iter([
             ('business_line', False),
             ('warehouse', True),
@@ -96,6 +323,7 @@ class TestScroogeSync(TestCase):
         today = datetime.date.today()
         call_command(COMMAND_NAME)
         run_plugins_mock.assert_called_with(today, COLLECT_PLUGINS)
+        update_service_changes_mock.assert_called_once_with(today)
 
     @override_settings(COLLECT_PLUGINS=COLLECT_PLUGINS)
     @patch('ralph_scrooge.management.commands.scrooge_sync.run_plugins')
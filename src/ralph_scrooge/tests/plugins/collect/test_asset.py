@@ -248,3 +248,98 @@ class TestAssetPlugin(TestCase):
             asset.asset(today=self.date),
             (True, u'0 new, 0 updated, 1 total')
         )
+
+    def _get_usages(self):
+        return {
+            'depreciation': UsageTypeFactory.create(),
+            'assets_count': UsageTypeFactory.create(),
+            'cores_count': UsageTypeFactory.create(),
+            'power_consumption': UsageTypeFactory.create(),
+            'collocation': UsageTypeFactory.create(),
+        }
+
+    def test_batch_update(self):
+        AssetInfoFactory(
+            asset_id=self.data['asset_id'],
+            warehouse=self.warehouse,
+        )
+        data = [self.data.copy(), self.data.copy(), self.data.copy()]
+        data[1]['asset_id'] = 2
+        data[1]['barcode'] = 'Barcode2'
+        data[2]['asset_id'] = 3
+        data[2]['service_id'] = ServiceFactory.build().ci_id
+        usages = self._get_usages()
+        updater = asset.AssetsBatchUpdater(self.date, usages)
+        self.assertEqual(updater.update(data), (1, 1))
+        self.assertEqual(AssetInfo.objects.count(), 2)
+        self.assertEqual(DailyAssetInfo.objects.count(), 2)
+        self.assertEqual(DailyUsage.objects.count(), 10)
+        asset1 = AssetInfo.objects.get(asset_id=1)
+        asset2 = AssetInfo.objects.get(asset_id=2)
+        self.assertEqual(asset1.barcode, data[0]['barcode'])
+        self.assertEqual(asset2.barcode, data[1]['barcode'])
+        self.assertEqual(asset2.sn, data[1]['sn'])
+        self.assertIsNone(asset1.sn)
+        self.assertIsNone(asset1.device_id)
+        daily_asset_info = DailyAssetInfo.objects.get(asset_info=asset2)
+        self.assertEqual(
+            daily_asset_info.service_environment,
+            self.service_environment,
+        )
+        self.assertEqual(
+            DailyUsage.objects.get(
+                type=usages['power_consumption'],
+                daily_pricing_object=daily_asset_info,
+            ).value,
+            200,
+        )
+
+    def test_batch_update_only_changed_usages(self):
+        usages = self._get_usages()
+        asset.AssetsBatchUpdater(self.date, usages).update([self.data])
+        previous_ids = dict(DailyUsage.objects.values_list('type_id', 'id'))
+        self.data['cores_count'] = 8
+        self.assertEqual(
+            asset.AssetsBatchUpdater(self.date, usages).update([self.data]),
+            (0, 1),
+        )
+        self.assertEqual(DailyAssetInfo.objects.count(), 1)
+        current_ids = dict(DailyUsage.objects.values_list('type_id', 'id'))
+        self.assertEqual(len(current_ids), 5)
+        for usage, usage_type in usages.items():
+            if usage == 'cores_count':
+                self.assertNotEqual(
+                    current_ids[usage_type.id],
+                    previous_ids[usage_type.id],
+                )
+            else:
+                self.assertEqual(
+                    current_ids[usage_type.id],
+                    previous_ids[usage_type.id],
+                )
+        self.assertEqual(
+            DailyUsage.objects.get(type=usages['cores_count']).value,
+            8,
+        )
+
+    def test_batch_update_same_as_single(self):
+        usages = self._get_usages()
+        asset.update_assets(self.data, self.date, usages)
+        expected = sorted(DailyUsage.objects.values_list(
+            'type_id',
+            'value',
+            'service_environment_id',
+            'warehouse_id',
+        ))
+        DailyUsage.objects.all().delete()
+        DailyAssetInfo.objects.all().delete()
+        asset.AssetsBatchUpdater(self.date, usages).update([self.data])
+        self.assertEqual(
+            sorted(DailyUsage.objects.values_list(
+                'type_id',
+                'value',
+                'service_environment_id',
+                'warehouse_id',
+            )),
+            expected,
+        )
@@ -32,15 +32,20 @@ class SshClientMock():
         self.stderr = stderr
 
     def exec_command(self, command):
+        stdout = MagicMock(
+            read=MagicMock(return_value=self.stdout),
+            readlines=MagicMock(return_value=self.stdout),
+        )
+        stdout.__iter__.return_value = iter(self.stdout)
         return (
             MagicMock(read=MagicMock(return_value=self.stdin)),
-            MagicMock(
-                read=MagicMock(return_value=self.stdout),
-                readlines=MagicMock(return_value=self.stdout),
-            ),
+            stdout,
             MagicMock(read=MagicMock(return_value=self.stderr)),
         )
 
+    def close(self):
+        self.closed = True
+
 
 def get_ssh_client_mock(address, login, password):
     return SshClientMock(
@@ -83,14 +88,14 @@ class TestNetwork(TestCase):
 
     def test_execute_nfdump(self):
         self.assertEqual(
-            netflow.execute_nfdump(
+            list(netflow.execute_nfdump(
                 SshClientMock(stdout=['0', '1', '2', '3', '4', '5', '6']),
                 'test-channel',
                 '2014-10-01',
                 ['file1', 'file2'],
                 'srcip',
                 settings.NFSEN_CLASS_ADDRESS,
-            ),
+            )),
             [u'1', u'2'],
         )
 
@@ -170,6 +175,37 @@ class TestNetwork(TestCase):
             None
         )
 
+    def test_network_index(self):
+        network_index = netflow.NetworkIndex([
+            '10.0.0.0/8',
+            '10.1.2.0/24',
+            '192.168.1.0/24',
+            '192.168.2.0/24',
+            '8.8.8.8',
+        ])
+        # overlapping and adjacent networks are merged
+        self.assertEqual(len(network_index.starts), 3)
+        for ip_address, expected in (
+            ('10.0.0.0', True),
+            ('10.255.255.255', True),
+            ('11.0.0.0', False),
+            ('192.168.2.255', True),
+            ('192.168.3.0', False),
+            ('8.8.8.8', True),
+            ('8.8.8.9', False),
+            ('1.1.1.1', False),
+        ):
+            self.assertEqual(ip_address in network_index, expected)
+
+    def test_network_index_invalid_address(self):
+        network_index = netflow.NetworkIndex(['10.0.0.0/8'])
+        for ip_address in ('10.0.0', '10.0.0.256', 'abc'):
+            with self.assertRaises(ValueError):
+                ip_address in network_index
+
+    def test_network_index_empty(self):
+        self.assertFalse('10.0.0.1' in netflow.NetworkIndex([]))
+
     def test_get_network_usage_when_ip_and_byte_is_none(self):
         self.assertEqual(
             netflow.get_network_usage(
@@ -236,6 +272,34 @@ class TestNetwork(TestCase):
             {('20.20.20.20', '443'): 30, ('10.10.10.10', '80'): 30},
         )
 
+    @override_settings(
+        NFSEN_CHANNELS=['channel1', 'channel2'],
+        SSH_NFSEN_CREDENTIALS={
+            'address1': {'login': 'login', 'password': 'password'},
+            'address2': {'login': 'login', 'password': 'password'},
+        },
+        NFSEN_MAX_SESSIONS=3,
+    )
+    def test_get_network_usages_many_servers(self):
+        ssh_clients = []
+
+        def get_ssh_client(address, login, password):
+            ssh_clients.append(get_ssh_client_mock(address, login, password))
+            return ssh_clients[-1]
+
+        with patch.object(netflow, 'get_ssh_client', get_ssh_client):
+            usages = netflow.get_network_usages(
+                '2014-10-01',
+                ['10.10.10.10', '20.20.20.20'],
+            )
+        # 2 servers * 2 channels (every row is returned for src and dst)
+        self.assertEqual(
+            usages,
+            {('20.20.20.20', '443'): 120, ('10.10.10.10', '80'): 120},
+        )
+        self.assertEqual(len(ssh_clients), 2)
+        self.assertTrue(all(c.closed for c in ssh_clients))
+
     def test_get_usages_type(self):
         self.assertEqual(netflow.get_usage_type(), UsageType.objects.get())
 
@@ -261,6 +325,56 @@ class TestNetwork(TestCase):
             (0, 1, 1)
         )
 
+    def test_update_many_ips(self):
+        service_environment = ServiceEnvironmentFactory()
+        default_service_environment = ServiceEnvironmentFactory()
+        today = date(year=2014, month=1, day=1)
+        usage_type = netflow.get_usage_type()
+        pricing_object = PricingObjectFactory.create(
+            name='8.8.8.8',
+            type_id=PRICING_OBJECT_TYPES.IP_ADDRESS,
+            service_environment=service_environment,
+        )
+        daily_pricing_object = DailyPricingObjectFactory.create(
+            date=today,
+            pricing_object=pricing_object,
+            service_environment=service_environment,
+        )
+        DailyUsage.objects.create(
+            date=today,
+            type=usage_type,
+            daily_pricing_object=daily_pricing_object,
+            service_environment=service_environment,
+            value=10,
+        )
+        self.assertEqual(
+            netflow.update(
+                {
+                    ('8.8.8.8', '80'): 30,
+                    ('8.8.8.8', '443'): 5,
+                    ('10.0.0.1', '80'): 20,
+                    ('10.0.0.2', '80'): 40,
+                },
+                usage_type,
+                default_service_environment,
+                today,
+            ),
+            (2, 1, 3)
+        )
+        self.assertEqual(
+            dict(DailyUsage.objects.values_list(
+                'daily_pricing_object__pricing_object__name',
+                'value',
+            )),
+            {'8.8.8.8': 45, '10.0.0.1': 20, '10.0.0.2': 40},
+        )
+        self.assertEqual(
+            DailyUsage.objects.filter(
+                service_environment=default_service_environment,
+            ).count(),
+            2,
+        )
+
     @patch.object(netflow, 'get_ssh_client', get_ssh_client_mock)
     @override_settings(
         UNKNOWN_SERVICES_ENVIRONMENTS={'netflow': (1, 'env1')},
@@ -119,3 +119,15 @@ class TestSharesPlugin(TestCase):
             share.share(today=self.date),
             (True, 'None new, 1 updated, 1 total'),
         )
+
+    @override_settings(SHARE_SERVICES={'group': ['ci_uid']})
+    @patch.object(share, 'register_costs_input_change')
+    def test_share_registers_costs_input_change(self, register_mock):
+        share.get_shares = lambda service_uid, include_virtual: [self.data]
+        share.share(today=self.date)
+        usage_type = UsageType.objects.get(symbol='disk_share_group')
+        register_mock.assert_called_once_with(
+            [usage_type.id],
+            self.date,
+            self.date,
+        )
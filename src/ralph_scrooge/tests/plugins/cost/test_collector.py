@@ -11,11 +11,33 @@ import mock
 
 from django.test import TestCase
 
+from ralph_scrooge.models import CostInputChange, DailyCost
 from ralph_scrooge.plugins.cost.collector import Collector
 from ralph_scrooge.tests.utils.factory import (
     CostDateStatusFactory,
+    CostInputChangeFactory,
+    PricingServiceFactory,
     ServiceEnvironmentFactory,
+    ServiceUsageTypesFactory,
+    UsageTypeFactory,
 )
+from ralph_scrooge.utils.common import AttributeDict
+
+
+class SerialPool(object):
+    """
+    Pool of processes replacement, which run tasks in current process.
+    """
+    def apply_async(self, func, args):
+        result = mock.Mock()
+        result.get.return_value = func(*args)
+        return result
+
+    def terminate(self):
+        pass
+
+    def join(self):
+        pass
 
 
 class TestCollector(TestCase):
@@ -92,4 +114,179 @@ class TestCollector(TestCase):
             ))
         process_mock.assert_has_calls(calls)
 
+    def test_get_plugins_waves(self):
+        dependencies = {
+            0: set(),
+            1: set(),
+            2: set([0, 1, 3]),
+            3: set([0]),
+        }
+        self.assertEquals(
+            self.collector._get_plugins_waves(dependencies),
+            [[0, 1], [3], [2]]
+        )
+
+    def test_get_plugins_waves_with_cycle(self):
+        dependencies = {
+            0: set(),
+            1: set([0, 2]),
+            2: set([0, 1]),
+        }
+        self.assertEquals(
+            self.collector._get_plugins_waves(dependencies),
+            [[0], [1, 2]]
+        )
+
+    @mock.patch(
+        'ralph_scrooge.models.PricingServiceDependencyGraph._get_dependencies'
+    )
+    def test_get_plugins_dependencies(self, dependencies_mock):
+        ps1, ps2 = PricingServiceFactory.create_batch(2)
+        dependencies_mock.return_value = {ps1.id: set([ps2.id]), ps2.id: set()}
+        plugins = [
+            AttributeDict(name='a', plugin_name='a', plugin_kwargs={}),
+            AttributeDict(name='b', plugin_name='b', plugin_kwargs={}),
+            AttributeDict(
+                name=ps1.name,
+                plugin_name='pricing_service_plugin',
+                plugin_kwargs={'pricing_service': ps1},
+            ),
+            AttributeDict(
+                name=ps2.name,
+                plugin_name='pricing_service_plugin',
+                plugin_kwargs={'pricing_service': ps2},
+            ),
+        ]
+        dependencies = self.collector._get_plugins_dependencies(
+            self.today,
+            plugins,
+        )
+        self.assertEquals(dependencies, {
+            0: set(),
+            1: set(),
+            2: set([0, 1, 3]),
+            3: set([0, 1]),
+        })
+
+    @mock.patch('ralph.util.plugin.run')
+    @mock.patch('ralph_scrooge.plugins.cost.collector.Collector._get_pool')
+    @mock.patch('ralph_scrooge.plugins.cost.collector.Collector._get_plugins_dependencies')  # noqa
+    def test_collect_costs_parallel(
+        self,
+        dependencies_mock,
+        get_pool_mock,
+        plugin_run_mock,
+    ):
+        def plugin_run(chain, plugin_name, **kwargs):
+            return {
+                1: [{'cost': plugin_name}],
+                2: [{'cost': plugin_name}],
+            }
+        plugin_run_mock.side_effect = plugin_run
+        get_pool_mock.return_value = SerialPool()
+        dependencies_mock.return_value = {0: set([2]), 1: set(), 2: set()}
+        plugins = [
+            AttributeDict(name=n, plugin_name=n, plugin_kwargs={})
+            for n in ('a', 'b', 'c')
+        ]
+        serial = self.collector._collect_costs(
+            self.today,
+            plugins=plugins,
+            processes=1,
+        )
+        parallel = self.collector._collect_costs(
+            self.today,
+            plugins=plugins,
+            processes=2,
+        )
+        self.assertEquals(parallel, serial)
+        self.assertEquals(parallel[1], [
+            {'cost': 'a'},
+            {'cost': 'b'},
+            {'cost': 'c'},
+        ])
+
+    @mock.patch('ralph_scrooge.plugins.cost.collector.Collector._get_plugins_dependencies')  # noqa
+    def test_get_changed_plugins(self, dependencies_mock):
+        service_usage_types = ServiceUsageTypesFactory()
+        pricing_service = service_usage_types.pricing_service
+        dependencies_mock.return_value = {
+            0: set(),
+            1: set(),
+            2: set([0, 1]),
+            3: set([0, 1, 2]),
+        }
+        plugins = [
+            AttributeDict(name='a', type_id=100, plugin_kwargs={}),
+            AttributeDict(name='b', type_id=101, plugin_kwargs={}),
+            AttributeDict(
+                name='c',
+                type_id=pricing_service.id,
+                plugin_kwargs={},
+            ),
+            AttributeDict(name='d', type_id=102, plugin_kwargs={}),
+        ]
+        self.assertEquals(
+            self.collector._get_changed_plugins(self.today, [], plugins),
+            [],
+        )
+        self.assertEquals(
+            self.collector._get_changed_plugins(self.today, [101], plugins),
+            plugins[1:],
+        )
+        # usage type used by pricing service
+        self.assertEquals(
+            self.collector._get_changed_plugins(
+                self.today,
+                [service_usage_types.usage_type.id],
+                plugins,
+            ),
+            plugins[2:],
+        )
+
+    @mock.patch('ralph_scrooge.plugins.cost.collector.Collector._collect_costs')  # noqa
+    @mock.patch('ralph_scrooge.plugins.cost.collector.Collector._get_changed_plugins')  # noqa
+    def test_process_incremental(self, changed_plugins_mock, collect_mock):
+        collect_mock.return_value = {1: [{'type_id': 100, 'cost': 1}]}
+        changed_plugins_mock.return_value = [
+            AttributeDict(name='a', type_id=100, plugin_kwargs={}),
+        ]
+        costs, types = self.collector.process_incremental(self.today)
+        self.assertIsNone(types)
+        self.assertEquals(costs, collect_mock.return_value)
+        self.assertFalse(changed_plugins_mock.called)
+
+        CostDateStatusFactory(date=self.today, calculated=True)
+        costs, types = self.collector.process_incremental(self.today)
+        self.assertEquals(types, [100])
+        self.assertEquals(
+            collect_mock.call_args[1]['plugins'],
+            changed_plugins_mock.return_value,
+        )
+
+    def test_save_daily_costs_types(self):
+        ut1, ut2 = UsageTypeFactory.create_batch(2)
+        se = self.service_environments[0]
+        CostInputChangeFactory(date=self.today, type=ut1)
+        costs = {
+            se.id: [
+                {'type': ut1, 'cost': 10, '_children': [
+                    {'type': ut2, 'cost': 10},
+                ]},
+                {'type': ut2, 'cost': 20},
+            ],
+        }
+        self.collector.save_daily_costs(self.today, False, costs)
+        self.collector.save_daily_costs(
+            self.today,
+            False,
+            {se.id: [{'type': ut1, 'cost': 30}]},
+            types=[ut1.id],
+        )
+        self.assertEquals(
+            sorted(DailyCost.objects_tree.values_list('path', 'cost')),
+            sorted([('{}'.format(ut1.id), 30), ('{}'.format(ut2.id), 20)]),
+        )
+        self.assertFalse(CostInputChange.objects.exists())
+
     # TODO: add more unit tests
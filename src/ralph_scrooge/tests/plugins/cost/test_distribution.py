@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+from decimal import Decimal as D
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from ralph_scrooge.plugins.cost.distribution import UsagesDistribution
+from ralph_scrooge.plugins.cost.pricing_service import PricingServicePlugin
+
+
+class TestUsagesDistribution(TestCase):
+    def setUp(self):
+        random.seed(1234)
+        self.percentage = [70, 20, 10]
+        self.usages_per_type = []
+        self.total_usages = []
+        for i in range(len(self.percentage)):
+            usages = [
+                (po, po % 7, random.random() * 1000) for po in range(100)
+            ]
+            self.usages_per_type.append(usages)
+            self.total_usages.append(sum(u[2] for u in usages))
+        self.costs_hierarchy = {
+            1: (D('12345.678901'), {
+                2: (D('10000.1'), {}),
+                3: (D('2345.578901'), {
+                    4: (D('2345.578901'), {}),
+                }),
+            }),
+        }
+
+    def _flatten(self, costs):
+        result = {}
+
+        def flatten(costs, path):
+            for cost in costs:
+                cost_path = path + (cost['type_id'], cost['pricing_object_id'])
+                result[cost_path] = (cost['cost'], cost.get('value'))
+                flatten(cost.get('_children', []), cost_path)
+
+        for se, se_costs in costs.items():
+            flatten(se_costs, (se,))
+        return result
+
+    @override_settings(SAVE_ONLY_FIRST_DEPTH_COSTS=False)
+    def _assert_parity(self, usages_per_type, total_usages, percentage):
+        # registered plugin is an instance - create a new one explicitly
+        plugin = type(PricingServicePlugin)()
+        decimal_costs = self._flatten(plugin._distribute_usages(
+            usages_per_type,
+            total_usages,
+            percentage,
+            self.costs_hierarchy,
+        ))
+        vectorized_costs = self._flatten(UsagesDistribution(
+            usages_per_type,
+            total_usages,
+            percentage,
+        ).distribute(self.costs_hierarchy))
+        self.assertEquals(set(decimal_costs), set(vectorized_costs))
+        for key, (cost, value) in decimal_costs.items():
+            self.assertAlmostEqual(cost, vectorized_costs[key][0], places=6)
+            self.assertEquals(value, vectorized_costs[key][1])
+        return vectorized_costs
+
+    def test_parity_with_decimal_distribution(self):
+        self._assert_parity(
+            self.usages_per_type,
+            self.total_usages,
+            self.percentage,
+        )
+
+    def test_parity_with_single_usage_type(self):
+        self._assert_parity(
+            self.usages_per_type[:1],
+            self.total_usages[:1],
+            [100],
+        )
+
+    def test_parity_with_zero_total_usage(self):
+        self.usages_per_type[1] = [
+            (po, se, 0) for po, se, usage in self.usages_per_type[1]
+        ]
+        self.total_usages[1] = 0
+        costs = self._assert_parity(
+            self.usages_per_type,
+            self.total_usages,
+            self.percentage,
+        )
+        # costs of usage types after the one with zero total usage are
+        # distributed
+        self.assertGreater(sum(cost for cost, value in costs.values()), 0)
+
+    def test_parity_with_sparse_usages(self):
+        # pricing objects have usages only of some of service usage types
+        self.usages_per_type[0] = [
+            u for u in self.usages_per_type[0] if u[0] % 3
+        ]
+        self.usages_per_type[1] = [
+            u for u in self.usages_per_type[1] if u[0] % 2
+        ]
+        self.total_usages = [
+            sum(u[2] for u in usages) for usages in self.usages_per_type
+        ]
+        costs = self._assert_parity(
+            self.usages_per_type,
+            self.total_usages,
+            self.percentage,
+        )
+        # pricing object 0 has usage only of the last usage type
+        usage = self.usages_per_type[2][0][2]
+        self.assertAlmostEqual(
+            costs[(0, 1, 0)][0],
+            D('12345.678901') * D(usage / self.total_usages[2]) * D('0.1'),
+            places=6,
+        )
+        self.assertEquals(costs[(0, 1, 0)][1], usage)
+
+    def test_distribute_without_children(self):
+        costs = UsagesDistribution(
+            self.usages_per_type,
+            self.total_usages,
+            self.percentage,
+        ).distribute(self.costs_hierarchy, with_children=False)
+        for se_costs in costs.values():
+            for cost in se_costs:
+                self.assertNotIn('_children', cost)
+        self.assertAlmostEqual(
+            sum(c['cost'] for se_costs in costs.values() for c in se_costs),
+            D('12345.678901'),
+            places=6,
+        )
+
+    def test_distribute_empty(self):
+        costs = UsagesDistribution([[]], [0], [100]).distribute(
+            self.costs_hierarchy
+        )
+        self.assertEquals(costs, {})
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from datetime import date
+from decimal import Decimal as D
+
+from django.db import connection
+from django.test import TestCase
+
+from ralph_scrooge import models
+from ralph_scrooge.plugins.cost.tree import DailyCostsTree
+from ralph_scrooge.tests.utils.factory import (
+    UsageTypeFactory,
+    WarehouseFactory,
+)
+
+
+class TestDailyCostsTree(TestCase):
+    def setUp(self):
+        self.today = date(2014, 10, 11)
+        self.costs = {
+            1: [
+                {
+                    'type_id': 1,
+                    'pricing_object_id': 10,
+                    'cost': D('100'),
+                    'value': 10.0,
+                    'percent': D('0.5'),
+                    '_children': [
+                        {
+                            'type_id': 2,
+                            'cost': D('60'),
+                            '_children': [
+                                {'type_id': 3, 'cost': D('60')},
+                                {'type_id': 4, 'cost': D('0')},
+                            ],
+                        },
+                        {'type_id': 5, 'cost': D('40')},
+                    ],
+                },
+                {
+                    'type_id': 6,
+                    'cost': D('-1'),
+                    '_children': [{'type_id': 7, 'cost': D('1')}],
+                },
+            ],
+            2: [
+                {'type_id': 8, 'value': 3.0},
+            ],
+        }
+
+    def _build_tree(self):
+        result = []
+        for se, se_costs in self.costs.items():
+            result.extend(models.DailyCost._build_tree(
+                se_costs,
+                service_environment_id=se,
+                date=self.today,
+                forecast=False,
+            ))
+        return result
+
+    def test_from_costs(self):
+        tree = DailyCostsTree.from_costs(self.today, self.costs)
+        self.assertEquals(len(tree), 5)
+        self.assertEquals(tree.path, ['1', '1/2', '1/2/3', '1/5', '8'])
+        self.assertEquals(list(tree.depth), [0, 1, 2, 1, 0])
+        self.assertEquals(list(tree.service_environment_id), [1, 1, 1, 1, 2])
+        self.assertEquals(tree.pricing_object_id, [10, None, None, None, None])
+        self.assertEquals(
+            tree.cost,
+            [D('100'), D('60'), D('60'), D('40'), 0],
+        )
+        self.assertEquals(list(tree.value), [10.0, 0, 0, 0, 3.0])
+
+    def test_related_objects(self):
+        usage_type = UsageTypeFactory()
+        warehouse = WarehouseFactory()
+        tree = DailyCostsTree.from_costs(self.today, {
+            1: [{'type': usage_type, 'warehouse': warehouse, 'cost': D(1)}],
+        })
+        self.assertEquals(tree.path, [str(usage_type.id)])
+        self.assertEquals(list(tree.type_id), [usage_type.id])
+        self.assertEquals(tree.warehouse_id, [warehouse.id])
+
+    def test_parity_with_build_tree(self):
+        tree = DailyCostsTree.from_costs(self.today, self.costs)
+        fields = [
+            f for f in models.DailyCost._meta.local_fields if f.name != 'id'
+        ]
+        expected = [
+            tuple(
+                f.get_db_prep_save(getattr(dc, f.attname), connection)
+                for f in fields
+            ) for dc in self._build_tree()
+        ]
+        self.assertEquals(list(tree.iter_rows(fields, connection)), expected)
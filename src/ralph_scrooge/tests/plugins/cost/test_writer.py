@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from datetime import date
+from decimal import Decimal as D
+
+import mock
+from django.db import DatabaseError
+from django.test import TestCase
+
+from ralph_scrooge import models
+from ralph_scrooge.plugins.cost.collector import Collector
+from ralph_scrooge.plugins.cost.tree import DailyCostsTree
+from ralph_scrooge.plugins.cost.writer import (
+    BulkLoadDailyCostWriter,
+    DailyCostWriter,
+    MySQLDailyCostWriter,
+    PostgreSQLDailyCostWriter,
+)
+from ralph_scrooge.tests.utils.factory import (
+    PricingObjectFactory,
+    ServiceEnvironmentFactory,
+    UsageTypeFactory,
+)
+
+
+class TestDailyCostWriter(TestCase):
+    def setUp(self):
+        self.today = date(2014, 10, 11)
+        self.se = ServiceEnvironmentFactory()
+        self.po = PricingObjectFactory(service_environment=self.se)
+        self.usage_type = UsageTypeFactory()
+        self.costs = {
+            self.se.id: [
+                {
+                    'type_id': self.usage_type.id,
+                    'pricing_object_id': self.po.id,
+                    'cost': D('10.5'),
+                    'value': 20.0,
+                    '_children': [{
+                        'type_id': self.usage_type.id,
+                        'cost': D('10.5'),
+                    }],
+                },
+                {
+                    'type_id': self.usage_type.id,
+                    'cost': D('1.25'),
+                },
+            ],
+        }
+
+    def _daily_costs(self):
+        return Collector()._iter_daily_costs(self.today, self.costs, False)
+
+    def test_write(self):
+        count = DailyCostWriter(batch_size=2).write(self._daily_costs())
+        self.assertEquals(count, 3)
+        self.assertEquals(models.DailyCost.objects_tree.count(), 3)
+        self.assertEquals(models.DailyCost.objects.count(), 2)
+
+    def test_format_row(self):
+        writer = BulkLoadDailyCostWriter()
+        daily_cost = list(self._daily_costs())[1]
+        row = writer._format_row(
+            writer._get_row(daily_cost)
+        ).rstrip('\n').split('\t')
+        values = dict(zip([f.attname for f in writer.fields], row))
+        self.assertEquals(values['path'], '{0}/{0}'.format(self.usage_type.id))
+        self.assertEquals(values['depth'], '1')
+        self.assertEquals(values['pricing_object_id'], '\\N')
+        self.assertEquals(values['service_environment_id'], str(self.se.id))
+        self.assertEquals(values['forecast'], '0')
+        self.assertEquals(D(values['cost']), D('10.5'))
+        self.assertEquals(values['date'], '2014-10-11')
+
+    def test_write_tree(self):
+        tree = DailyCostsTree.from_costs(self.today, self.costs)
+        count = DailyCostWriter(batch_size=2).write_tree(tree)
+        self.assertEquals(count, 3)
+        self.assertEquals(
+            sorted(models.DailyCost.objects_tree.values_list(
+                'path',
+                'depth',
+                'pricing_object_id',
+                'cost',
+                'value',
+            )),
+            sorted(
+                (
+                    dc.path,
+                    dc.depth,
+                    dc.pricing_object_id,
+                    dc.cost,
+                    dc.value,
+                ) for dc in self._daily_costs()
+            ),
+        )
+
+    def test_format_value(self):
+        self.assertEquals(
+            BulkLoadDailyCostWriter._format_value('a\tb\\c\nd'),
+            'a\\tb\\\\c\\nd',
+        )
+        self.assertEquals(BulkLoadDailyCostWriter._format_value(0.1), '0.1')
+
+    @mock.patch('ralph_scrooge.plugins.cost.writer.connection')
+    def test_postgresql_copy(self, connection_mock):
+        connection_mock.ops.quote_name.side_effect = lambda n: '"{}"'.format(n)
+        cursor = connection_mock.cursor.return_value
+        writer = PostgreSQLDailyCostWriter(batch_size=2)
+        self.assertEquals(writer.write(self._daily_costs()), 3)
+        self.assertEquals(cursor.copy_expert.call_count, 2)
+        self.assertTrue(cursor.copy_expert.call_args[0][0].startswith(
+            'COPY "ralph_scrooge_dailycost" ('
+        ))
+
+    @mock.patch('ralph_scrooge.plugins.cost.writer.connection')
+    def test_mysql_fallback_to_inserts(self, connection_mock):
+        connection_mock.ops.quote_name.side_effect = lambda n: '`{}`'.format(n)
+        cursor = connection_mock.cursor.return_value
+        cursor.execute.side_effect = DatabaseError('local infile disabled')
+        writer = MySQLDailyCostWriter(batch_size=2)
+        with mock.patch.object(
+            DailyCostWriter,
+            '_write_batch',
+        ) as write_batch_mock:
+            self.assertEquals(writer.write(self._daily_costs()), 3)
+        self.assertEquals(cursor.execute.call_count, 1)
+        self.assertEquals(write_batch_mock.call_count, 2)
+
+    def test_save_daily_costs(self):
+        collector = Collector()
+        collector.save_daily_costs(self.today, False, self.costs)
+        collector.save_daily_costs(self.today, False, self.costs)
+        self.assertEquals(models.DailyCost.objects_tree.count(), 3)
+        self.assertTrue(
+            models.CostDateStatus.objects.get(date=self.today).calculated
+        )
@@ -7,9 +7,13 @@ from __future__ import unicode_literals
 
 from datetime import date, timedelta
 
+from django.test.utils import override_settings
 from django.utils.translation import ugettext_lazy as _
 
-from ralph_scrooge.models import PRICING_OBJECT_TYPES
+from ralph_scrooge.models import (
+    PRICING_OBJECT_TYPES,
+    PricingObjectServiceChange,
+)
 from ralph_scrooge.report.report_services_changes import ServicesChangesReport
 from ralph_scrooge.tests import ScroogeTestCase
 from ralph_scrooge.tests.utils.factory import (
@@ -19,6 +23,9 @@ from ralph_scrooge.tests.utils.factory import (
     PricingObjectFactory,
     ServiceEnvironmentFactory,
 )
+from ralph_scrooge.utils.service_changes import update_service_changes
+
+SOURCES = ('log', 'window', 'self_join')
 
 
 class TestServicesChangesReport(ScroogeTestCase):
@@ -46,6 +53,8 @@ class TestServicesChangesReport(ScroogeTestCase):
             pricing_object=self.po1,
             date=self.yesterday,
         )
+        update_service_changes(self.yesterday)
+        update_service_changes(self.today)
 
     def _create_asset_info(self):
         self.ai = AssetInfoFactory(
@@ -65,6 +74,15 @@ class TestServicesChangesReport(ScroogeTestCase):
             asset_info=self.ai,
             date=self.yesterday,
         )
+        update_service_changes(self.yesterday)
+        update_service_changes(self.today)
+
+    def _get_report(self, **kwargs):
+        return list(ServicesChangesReport.get_data(
+            start=date(2013, 10, 10),
+            end=date(2013, 10, 13),
+            **kwargs
+        ))[-1][1]
 
     def _get_default_result(self, update_with=None):
         pricing_object_types = ServicesChangesReport._get_types()
@@ -83,12 +101,7 @@ class TestServicesChangesReport(ScroogeTestCase):
 
     def test_report_pricing_object(self):
         self._create_pricing_objects()
-        for percent, result in ServicesChangesReport.get_data(
-            start=date(2013, 10, 10),
-            end=date(2013, 10, 13),
-        ):
-            pass
-        self.assertEquals(result, self._get_default_result({
+        expected = self._get_default_result({
             PRICING_OBJECT_TYPES.UNKNOWN: [(
                 self.po1.id,
                 self.po1.name,
@@ -98,16 +111,14 @@ class TestServicesChangesReport(ScroogeTestCase):
                 self.se1.service.name,
                 self.se1.environment.name,
             )],
-        }))
+        })
+        for source in SOURCES:
+            with override_settings(SCROOGE_SERVICES_CHANGES_SOURCE=source):
+                self.assertEquals(self._get_report(), expected)
 
     def test_report_asset(self):
         self._create_asset_info()
-        for percent, result in ServicesChangesReport.get_data(
-            start=date(2013, 10, 10),
-            end=date(2013, 10, 13),
-        ):
-            pass
-        self.assertEquals(result, self._get_default_result({
+        expected = self._get_default_result({
             PRICING_OBJECT_TYPES.ASSET: [(
                 self.ai.id,
                 self.ai.name,
@@ -120,7 +131,62 @@ class TestServicesChangesReport(ScroogeTestCase):
                 self.se1.service.name,
                 self.se1.environment.name,
             )],
-        }))
+        })
+        for source in SOURCES:
+            with override_settings(SCROOGE_SERVICES_CHANGES_SOURCE=source):
+                self.assertEquals(self._get_report(), expected)
+
+    def test_report_not_following_days(self):
+        self._create_pricing_objects()
+        # pricing object missing at 2013-10-13 - change from 2013-10-12 to
+        # 2013-10-14 is not reported
+        DailyPricingObjectFactory(
+            service_environment=self.se3,
+            pricing_object=self.po1,
+            date=date(2013, 10, 14),
+        )
+        update_service_changes(date(2013, 10, 14))
+        for source in SOURCES:
+            with override_settings(SCROOGE_SERVICES_CHANGES_SOURCE=source):
+                result = list(ServicesChangesReport.get_data(
+                    start=date(2013, 10, 10),
+                    end=date(2013, 10, 15),
+                ))[-1][1]
+                self.assertEquals(
+                    [row[2] for row in result[PRICING_OBJECT_TYPES.UNKNOWN]],
+                    [date(2013, 10, 12)],
+                )
+
+    def test_report_service_filter(self):
+        self._create_pricing_objects()
+        for source in SOURCES:
+            with override_settings(SCROOGE_SERVICES_CHANGES_SOURCE=source):
+                # service before change
+                self.assertEquals(
+                    len(self._get_report(service=self.se2.service)[
+                        PRICING_OBJECT_TYPES.UNKNOWN
+                    ]),
+                    1,
+                )
+                self.assertEquals(
+                    self._get_report(
+                        service=ServiceEnvironmentFactory().service,
+                    ),
+                    self._get_default_result(),
+                )
+
+    def test_update_service_changes(self):
+        self._create_pricing_objects()
+        change = PricingObjectServiceChange.objects.get()
+        self.assertEquals(change.date, self.today)
+        self.assertEquals(change.pricing_object_id, self.po1.id)
+        self.assertEquals(change.previous_service_environment, self.se2)
+        self.assertEquals(change.service_environment, self.se1)
+        # change of service environment is reverted
+        self.dpo1.service_environment = self.se2
+        self.dpo1.save()
+        update_service_changes(self.today)
+        self.assertFalse(PricingObjectServiceChange.objects.exists())
 
     def test_get_header(self):
         header = ServicesChangesReport.get_header()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from datetime import date, timedelta
+from decimal import Decimal as D
+
+from django.db import connection
+from mock import patch
+from django.test.utils import override_settings
+
+from ralph_scrooge.report.report_services_costs import ServicesCostsReport
+from ralph_scrooge.tests import ScroogeTestCase
+from ralph_scrooge.tests.utils.factory import (
+    DailyCostFactory,
+    PricingServiceFactory,
+    ServiceEnvironmentFactory,
+    TeamFactory,
+    UsageTypeFactory,
+)
+
+
+class TestServicesCostsReport(ScroogeTestCase):
+    def setUp(self):
+        self.today = date(2013, 10, 12)
+        self.yesterday = self.today - timedelta(days=1)
+        self.se1 = ServiceEnvironmentFactory()
+        self.se2 = ServiceEnvironmentFactory()
+        self.se3 = ServiceEnvironmentFactory()
+        self.base_usage_type = UsageTypeFactory(
+            usage_type='BU',
+            divide_by=1,
+            rounding=2,
+        )
+        self.regular_usage_type = UsageTypeFactory(usage_type='RU')
+        self.pricing_service = PricingServiceFactory()
+        self.team = TeamFactory(show_in_report=True)
+        for day, se, base_usage, cost, value in (
+            (self.today, self.se1, self.base_usage_type, 10.5, 100),
+            (self.yesterday, self.se1, self.base_usage_type, 20.25, 200),
+            (self.today, self.se2, self.base_usage_type, 1.1, 15),
+            (self.today, self.se2, self.regular_usage_type, 3.3, 7),
+            (self.today, self.se1, self.pricing_service, 123.45, 0),
+            (self.today, self.se3, self.team, 99.99, 0),
+            # out of range
+            (self.today + timedelta(days=1), self.se3, self.team, 10, 0),
+        ):
+            DailyCostFactory(
+                date=day,
+                service_environment=se,
+                type=base_usage,
+                cost=cost,
+                value=value,
+            )
+
+    def _get_report(self):
+        progress, rows = list(ServicesCostsReport.get_data(
+            start=self.yesterday,
+            end=self.today,
+        ))[-1]
+        return progress, list(rows)
+
+    def test_columnar_report_same_as_plugins_report(self):
+        with override_settings(SCROOGE_COLUMNAR_COSTS_REPORT=False):
+            expected = self._get_report()
+        with override_settings(SCROOGE_COLUMNAR_COSTS_REPORT=True):
+            result = self._get_report()
+        self.assertEquals(result, expected)
+
+    def test_columnar_report_half_cent_costs(self):
+        se = ServiceEnvironmentFactory()
+        for day in (self.today, self.yesterday):
+            DailyCostFactory(
+                date=day,
+                service_environment=se,
+                type=self.regular_usage_type,
+                cost=D('1.3375'),
+                value=1,
+            )
+        with override_settings(SCROOGE_COLUMNAR_COSTS_REPORT=False):
+            expected = self._get_report()
+        with override_settings(SCROOGE_COLUMNAR_COSTS_REPORT=True):
+            result = self._get_report()
+        self.assertEquals(result, expected)
+        row = [r for r in result[1] if se.service.name in r][0]
+        # sum of costs (2.675) is rounded as Decimal (not as float 2.67499..)
+        self.assertIn('2.68', row[:-1])
+        self.assertEquals(row[-1], '2.68')
+
+    @override_settings(SCROOGE_COLUMNAR_COSTS_REPORT=True)
+    def test_columnar_report_queries_count(self):
+        connection.use_debug_cursor = True
+        try:
+            queries_count = len(connection.queries)
+            self._get_report()
+            report_queries_count = len(connection.queries) - queries_count
+        finally:
+            connection.use_debug_cursor = None
+        # the same number of queries for another column of costs
+        UsageTypeFactory(usage_type='RU')
+        connection.use_debug_cursor = True
+        try:
+            queries_count = len(connection.queries)
+            self._get_report()
+            self.assertEquals(
+                len(connection.queries) - queries_count,
+                report_queries_count,
+            )
+        finally:
+            connection.use_debug_cursor = None
+
+    @override_settings(SCROOGE_COLUMNAR_COSTS_REPORT=True)
+    @patch.object(ServicesCostsReport, 'progress_update', 0)
+    def test_columnar_report_partial_results(self):
+        results = list(ServicesCostsReport.get_data(
+            start=self.yesterday,
+            end=self.today,
+        ))
+        progress, final = results[-1]
+        final = list(final)
+        self.assertEquals(progress, 100)
+        self.assertGreater(len(results), 1)
+        for progress, partial in results[:-1]:
+            self.assertLess(progress, 100)
+            self.assertEquals(len(partial), len(final))
+            for partial_row, row in zip(partial, final):
+                self.assertEquals(len(partial_row), len(row))
+                # already calculated columns are the same as in final report
+                filled = [
+                    i for i, value in enumerate(partial_row) if value != ''
+                ]
+                self.assertEquals(
+                    [partial_row[i] for i in filled],
+                    [row[i] for i in filled],
+                )
+                # total cost is calculated at the end
+                self.assertEquals(partial_row[-1], '')
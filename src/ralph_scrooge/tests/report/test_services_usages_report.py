@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import connection
+from django.test.utils import override_settings
+
+from ralph_scrooge.report.report_services_usages import ServicesUsagesReport
+from ralph_scrooge.tests import ScroogeTestCase
+from ralph_scrooge.tests.utils.factory import (
+    DailyUsageFactory,
+    ServiceEnvironmentFactory,
+    UsageTypeFactory,
+)
+
+
+class TestServicesUsagesReport(ScroogeTestCase):
+    def setUp(self):
+        self.today = date(2013, 10, 12)
+        self.yesterday = self.today - timedelta(days=1)
+        self.se1 = ServiceEnvironmentFactory()
+        self.se2 = ServiceEnvironmentFactory()
+        self.ut1 = UsageTypeFactory(divide_by=1, rounding=2)
+        self.ut2 = UsageTypeFactory(rounding=0)
+        for day, se, usage_type, value in (
+            (self.today, self.se1, self.ut1, 123),
+            (self.today, self.se1, self.ut1, 7),
+            (self.yesterday, self.se1, self.ut2, 10.6),
+            (self.today, self.se2, self.ut2, 3),
+            # out of range
+            (self.today + timedelta(days=1), self.se2, self.ut2, 5),
+        ):
+            DailyUsageFactory(
+                date=day,
+                service_environment=se,
+                type=usage_type,
+                value=value,
+            )
+
+    def _get_report(self, usage_types):
+        return list(list(ServicesUsagesReport.get_data(
+            start=self.yesterday,
+            end=self.today,
+            usage_types=usage_types,
+        ))[-1][1])
+
+    def test_vectorized_report_same_as_plugins_report(self):
+        usage_types = [self.ut1, self.ut2]
+        with override_settings(SCROOGE_VECTORIZED_USAGES_REPORT=False):
+            expected = self._get_report(usage_types)
+        with override_settings(SCROOGE_VECTORIZED_USAGES_REPORT=True):
+            result = self._get_report(usage_types)
+        self.assertEquals(result, expected)
+
+    @override_settings(SCROOGE_VECTORIZED_USAGES_REPORT=True)
+    def test_vectorized_report(self):
+        report = dict(
+            ((row[0], row[1]), row[2:])
+            for row in self._get_report([self.ut1, self.ut2])
+        )
+        self.assertEquals(
+            report[(self.se1.service.name, self.se1.environment.name)],
+            ['0.00', '11', '13.00', '0'],
+        )
+        self.assertEquals(
+            report[(self.se2.service.name, self.se2.environment.name)],
+            ['0.00', '0', '0.00', '3'],
+        )
+
+    def test_format_usages(self):
+        self.assertEquals(
+            ServicesUsagesReport._format_usages(
+                np.array([123.0, 0.5, -4.0]),
+                self.ut1,
+            ),
+            ['12.30', '0.05', '-0.40'],
+        )
+        # halves are rounded to even
+        self.assertEquals(
+            ServicesUsagesReport._format_usages(
+                np.array([0.5, 1.5, 2.4]),
+                self.ut2,
+            ),
+            ['0', '2', '2'],
+        )
+
+    @override_settings(SCROOGE_VECTORIZED_USAGES_REPORT=True)
+    def test_vectorized_report_queries_count(self):
+        ut3 = UsageTypeFactory()
+        connection.use_debug_cursor = True
+        try:
+            queries_count = len(connection.queries)
+            self._get_report([self.ut1])
+            report_queries_count = len(connection.queries) - queries_count
+            # the same number of queries for more usage types
+            queries_count = len(connection.queries)
+            self._get_report([self.ut1, self.ut2, ut3])
+            self.assertEquals(
+                len(connection.queries) - queries_count,
+                report_queries_count,
+            )
+        finally:
+            connection.use_debug_cursor = None
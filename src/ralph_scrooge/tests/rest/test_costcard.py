@@ -10,12 +10,19 @@ import datetime
 from decimal import Decimal as D
 
 from django.contrib.auth.models import User
+from django.core.cache import get_cache
+from django.db import connection
 from django.test import TestCase
+from django.utils import translation
 from django.utils.translation import ugettext as _
+from mock import patch
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from ralph_scrooge.tests.utils import factory
+from ralph_scrooge.utils.common import get_cache_name
+from ralph_scrooge.utils import monthly_costs
+from ralph_scrooge.utils.monthly_costs import refresh_monthly_costs
 
 
 class TestCardCost(TestCase):
@@ -36,6 +43,8 @@ class TestCardCost(TestCase):
         )
 
         self.base_usage = factory.BaseUsageFactory()
+        for cache_name in ('scrooge_costcard', 'scrooge_monthly_costs'):
+            get_cache(get_cache_name(cache_name)).clear()
 
     def _init(self, forecast=False):
         self.daily_cost_1 = factory.DailyCostFactory(
@@ -64,6 +73,11 @@ class TestCardCost(TestCase):
                 date=datetime.date(year=self.year, month=self.month, day=day),
                 **{'forecast_accepted' if forecast else 'accepted': True}
             )
+        refresh_monthly_costs(
+            datetime.date(year=self.year, month=self.month, day=1),
+            datetime.date(year=self.year, month=self.month, day=3),
+            forecast,
+        )
 
     def test_get_cost_card(self):
         self._init()
@@ -87,6 +101,82 @@ class TestCardCost(TestCase):
             }
         )
 
+    def _get_cost_card(self, **kwargs):
+        return self.client.get(
+            '/scrooge/rest/costcard/{0}/{1}/{2}/{3}/'.format(
+                self.service.id,
+                self.environment.id,
+                self.year,
+                self.month,
+            ),
+            **kwargs
+        )
+
+    @patch.object(monthly_costs, '_is_shared_cache', return_value=True)
+    def test_get_cost_card_not_modified(self, is_shared_cache_mock):
+        self._init()
+        etag = self._get_cost_card()['ETag']
+        connection.use_debug_cursor = True
+        try:
+            queries_count = len(connection.queries)
+            response = self._get_cost_card(HTTP_IF_NONE_MATCH=etag)
+            self.assertEquals(len(connection.queries), queries_count)
+        finally:
+            connection.use_debug_cursor = None
+        self.assertEquals(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @patch.object(monthly_costs, '_is_shared_cache', return_value=True)
+    def test_get_cost_card_cached_per_language(self, is_shared_cache_mock):
+        self._init()
+        etag = self._get_cost_card()['ETag']
+        with patch.object(translation, 'get_language', return_value='pl'):
+            response = self._get_cost_card(HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertNotEquals(response['ETag'], etag)
+
+    def test_get_cost_card_cache_invalidated_on_accept(self):
+        self._init()
+        etag = self._get_cost_card()['ETag']
+        # third day is accepted
+        factory.CostDateStatusFactory(
+            date=datetime.date(year=self.year, month=self.month, day=3),
+            accepted=True,
+        )
+        refresh_monthly_costs(
+            datetime.date(year=self.year, month=self.month, day=3),
+            datetime.date(year=self.year, month=self.month, day=3),
+        )
+        response = self._get_cost_card(HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertNotEquals(response['ETag'], etag)
+        self.assertEquals(
+            json.loads(response.content)['results'][-1],
+            {'cost': 300.0, 'name': 'Total'},
+        )
+
+    @patch.object(monthly_costs, '_is_shared_cache', return_value=False)
+    def test_get_cost_card_local_cache_version(self, is_shared_cache_mock):
+        self._init()
+        etag = self._get_cost_card()['ETag']
+        response = self._get_cost_card(HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        # costs accepted by another process (version in its local cache is
+        # changed only) - version is computed from the database
+        factory.CostDateStatusFactory(
+            date=datetime.date(year=self.year, month=self.month, day=3),
+            accepted=True,
+        )
+        monthly_costs._refresh_months(
+            [datetime.date(year=self.year, month=self.month, day=1)],
+            False,
+        )
+        response = self._get_cost_card(HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(
+            json.loads(response.content)['results'][-1],
+            {'cost': 300.0, 'name': 'Total'},
+        )
+
     def test_get_cost_card_forecast(self):
         self._init(forecast=True)
         response = self.client.get(
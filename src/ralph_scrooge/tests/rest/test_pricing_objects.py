@@ -155,3 +155,54 @@ class TestPricingObjects(TestCase):
                 }
             }
         )
+
+    def _get_page(self, type_id, **params):
+        User.objects.create_superuser('test', 'test@test.test', 'test')
+        client = APIClient()
+        client.login(username='test', password='test')
+        return client.get(
+            reverse(
+                'pricing_object_costs_page',
+                kwargs={
+                    'service': self.se1.service.id,
+                    'env': self.se1.environment.id,
+                    'start_date': self.today.strftime('%Y-%m-%d'),
+                    'end_date': self.today.strftime('%Y-%m-%d'),
+                    'type_id': type_id,
+                }
+            ),
+            params,
+        )
+
+    def test_pricing_objects_page(self):
+        type_id = self.dpo1.pricing_object.type_id
+        pricing_objects = sorted(
+            [self.dpo1.pricing_object, self.dpo2.pricing_object],
+            key=lambda po: po.id,
+        )
+        after = 0
+        pages = []
+        while after is not None:
+            data = json.loads(
+                self._get_page(type_id, after=after, limit=1).content
+            )
+            pages.append(data['value'])
+            after = data['next']
+        self.assertEquals(len(pages), 3)
+        self.assertEquals(
+            [page[0]['0'] for page in pages[:2]],
+            [po.id for po in pricing_objects],
+        )
+        self.assertEquals(pages[2], [])
+        costs = dict(
+            (page[0]['0'], page[0]['__nested']) for page in pages[:2]
+        )
+        self.assertSetEqual(
+            {Decimal(x['2']) for x in costs[self.dpo1.pricing_object.id]},
+            {Decimal('50.0'), Decimal('35.0')}
+        )
+        self.assertEquals(costs[self.dpo2.pricing_object.id], [])
+
+    def test_pricing_objects_page_invalid_type(self):
+        resp = self._get_page(999999)
+        self.assertEquals(resp.status_code, 404)
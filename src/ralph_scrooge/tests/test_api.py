@@ -10,9 +10,14 @@ import json
 import urllib
 
 from django.contrib.auth.models import User
+from django.db import connection
 from tastypie.test import ResourceTestCase
 
-from ralph_scrooge.models import DailyUsage, ServiceUsageTypes
+from ralph_scrooge.models import (
+    DailyPricingObject,
+    DailyUsage,
+    ServiceUsageTypes,
+)
 from ralph_scrooge.api import (
     PricingServiceUsageObject,
     PricingServiceUsageResource,
@@ -133,6 +138,43 @@ class TestPricingServiceUsagesApi(ScroogeTestCaseMixin, ResourceTestCase):
         PricingServiceUsageResource.save_usages(pricing_service_usages)
         self._compare_sample_usages()
 
+    def _get_save_usages_queries_count(self, date, pricing_objects_count):
+        pricing_service_usages = PricingServiceUsageObject(
+            date=date,
+            pricing_service=self.pricing_service.name,
+            usages=[
+                UsagesObject(
+                    pricing_object=PricingObjectFactory().name,
+                    usages=[
+                        UsageObject(symbol=self.usage_type1.symbol, value=1),
+                        UsageObject(symbol=self.usage_type2.symbol, value=2),
+                    ]
+                ) for i in range(pricing_objects_count)
+            ]
+        )
+        connection.use_debug_cursor = True
+        try:
+            queries_count = len(connection.queries)
+            PricingServiceUsageResource.save_usages(pricing_service_usages)
+            return len(connection.queries) - queries_count
+        finally:
+            connection.use_debug_cursor = None
+
+    def test_save_usages_queries_count(self):
+        date2 = self.date + datetime.timedelta(days=1)
+        self.assertEquals(
+            self._get_save_usages_queries_count(self.date, 3),
+            self._get_save_usages_queries_count(date2, 30),
+        )
+        self.assertEquals(
+            DailyUsage.objects.filter(date=date2).count(),
+            60,
+        )
+        self.assertEquals(
+            DailyPricingObject.objects.filter(date=date2).count(),
+            30,
+        )
+
     def test_to_dict(self):
         service_usages = self._get_sample()
         self.assertEquals(service_usages.to_dict(), {
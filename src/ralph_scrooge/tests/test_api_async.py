@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+import json
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test.utils import override_settings
+from mock import MagicMock, patch
+from tastypie.test import ResourceTestCase
+
+from ralph_scrooge.api_async import (
+    get_upload_path,
+    parse_header,
+    parse_usages,
+    UsagesIngestionJob,
+)
+from ralph_scrooge.models import DailyUsage
+from ralph_scrooge.tests import ScroogeTestCaseMixin
+from ralph_scrooge.tests.utils.factory import (
+    DailyUsageFactory,
+    PricingObjectFactory,
+    PricingServiceFactory,
+    ServiceEnvironmentFactory,
+    UsageTypeFactory,
+)
+
+DUMMY_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+}
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'scrooge-test-usages',
+    },
+}
+
+
+@override_settings(SCROOGE_USAGES_UPLOAD_DIR=tempfile.gettempdir())
+class TestPricingServiceUsagesAsyncApi(ScroogeTestCaseMixin, ResourceTestCase):
+    def setUp(self):
+        super(TestPricingServiceUsagesAsyncApi, self).setUp()
+        self.user = User.objects.create_user(
+            'ralph',
+            'ralph@ralph.local',
+            'ralph'
+        )
+        self.api_key = self.create_apikey(
+            self.user.username,
+            self.user.api_key.key,
+        )
+        self.date = datetime.date(2013, 10, 10)
+        self.pricing_service = PricingServiceFactory()
+        self.service_environment = ServiceEnvironmentFactory()
+        self.pricing_object = PricingObjectFactory()
+        self.usage_type = UsageTypeFactory()
+
+    def _get_body(self, overwrite='no'):
+        rows = [
+            {
+                'pricing_service': self.pricing_service.name,
+                'date': '2013-10-10',
+                'overwrite': overwrite,
+            },
+            {
+                'service': self.service_environment.service.name,
+                'environment': self.service_environment.environment.name,
+                'usages': [{'symbol': self.usage_type.symbol, 'value': 10}],
+            },
+            {
+                'pricing_object': 'invalid',
+                'usages': [{'symbol': self.usage_type.symbol, 'value': 20}],
+            },
+            {
+                'pricing_object': self.pricing_object.name,
+                'usages': [{'symbol': self.usage_type.symbol, 'value': 30}],
+            },
+            {
+                'pricing_object': self.pricing_object.name,
+                'usages': [{'symbol': self.usage_type.symbol}],
+            },
+        ]
+        return '\n'.join(json.dumps(row) for row in rows) + '\n'
+
+    def _run(self, body):
+        with open(get_upload_path('test'), 'wb') as f:
+            f.write(body)
+        return list(UsagesIngestionJob.run(upload_id='test'))[-1]
+
+    def test_parse_header(self):
+        header = parse_header(json.dumps({
+            'pricing_service_id': self.pricing_service.id,
+            'date': '2013-10-10',
+        }))
+        self.assertEquals(header.pricing_service_id, self.pricing_service.id)
+        self.assertEquals(header.date, self.date)
+        self.assertEquals(header.overwrite, 'no')
+
+    def test_parse_header_invalid(self):
+        for header in (
+            '[]',
+            '{"date": "2013-10-10"}',
+            '{"pricing_service": "ps1"}',
+            '{"pricing_service": "ps1", "date": "2013-10-10", "overwrite": 1}',
+        ):
+            with self.assertRaises(ValueError):
+                parse_header(header)
+
+    def test_parse_usages_invalid(self):
+        for row in (
+            '"abc"',
+            '{"service_id": "abc", "environment": "env1"}',
+            '{"pricing_object": "po1", "usages": [{"value": 1}]}',
+            '{"pricing_object": "po1", "usages": [{"symbol": "a"}]}',
+        ):
+            with self.assertRaises((ValueError, TypeError)):
+                parse_usages(row)
+
+    def test_run(self):
+        progress, status = self._run(self._get_body())
+        self.assertEquals(progress, 100)
+        self.assertEquals(status, {
+            'rows': 4,
+            'saved': 2,
+            'errors': 2,
+            'error_messages': [
+                [3, 'Invalid pricing object name or id (invalid)'],
+                [5, 'Invalid row: float() argument must be a string or a '
+                    'number'],
+            ],
+        })
+        self.assertEquals(
+            sorted(DailyUsage.objects.values_list(
+                'service_environment',
+                'value',
+            )),
+            sorted([
+                (self.service_environment.id, 10),
+                (self.pricing_object.service_environment.id, 30),
+            ])
+        )
+        self.assertFalse(os.path.exists(get_upload_path('test')))
+
+    @override_settings(SCROOGE_USAGES_INGESTION_BATCH_SIZE=1)
+    def test_run_delete_all_previous_in_batches(self):
+        DailyUsageFactory(date=self.date, type=self.usage_type)
+        progress, status = self._run(self._get_body('delete_all_previous'))
+        self.assertEquals(status['saved'], 2)
+        # previous usages are removed only once (before first batch)
+        self.assertEquals(
+            DailyUsage.objects.filter(type=self.usage_type).count(),
+            2,
+        )
+
+    @override_settings(CACHES=DUMMY_CACHES)
+    def test_push_usages(self):
+        resp = self.client.post(
+            '/scrooge/api/v0.9/pricingserviceusagesasync/',
+            data=self._get_body(),
+            content_type='application/x-ndjson',
+            HTTP_AUTHORIZATION=self.api_key,
+        )
+        self.assertEquals(resp.status_code, 202)
+        data = json.loads(resp.content)
+        self.assertTrue(data['finished'])
+        self.assertEquals(data['saved'], 2)
+        self.assertEquals(data['errors'], 2)
+        self.assertEquals(DailyUsage.objects.count(), 2)
+
+    def test_push_usages_invalid_pricing_service(self):
+        body = self._get_body().replace(
+            self.pricing_service.name,
+            'invalid',
+            1,
+        )
+        resp = self.client.post(
+            '/scrooge/api/v0.9/pricingserviceusagesasync/',
+            data=body,
+            content_type='application/x-ndjson',
+            HTTP_AUTHORIZATION=self.api_key,
+        )
+        self.assertEquals(resp.status_code, 400)
+        self.assertEquals(DailyUsage.objects.count(), 0)
+
+    @override_settings(SCROOGE_USAGES_UPLOAD_DIR=None)
+    def test_push_usages_upload_dir_not_configured(self):
+        resp = self.client.post(
+            '/scrooge/api/v0.9/pricingserviceusagesasync/',
+            data=self._get_body(),
+            content_type='application/x-ndjson',
+            HTTP_AUTHORIZATION=self.api_key,
+        )
+        self.assertEquals(resp.status_code, 503)
+        self.assertEquals(DailyUsage.objects.count(), 0)
+
+    def test_push_usages_unauthorized(self):
+        resp = self.client.post(
+            '/scrooge/api/v0.9/pricingserviceusagesasync/',
+            data=self._get_body(),
+            content_type='application/x-ndjson',
+        )
+        self.assertEquals(resp.status_code, 401)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    @patch('ralph_scrooge.utils.worker_job.Job')
+    @patch('ralph_scrooge.utils.worker_job.django_rq')
+    def test_push_usages_status_failed(self, django_rq_mock, job_mock):
+        job = MagicMock(id='abc', is_finished=False, is_failed=False)
+        django_rq_mock.get_queue.return_value.enqueue_call.return_value = job
+        job_mock.fetch.return_value = job
+        resp = self.client.post(
+            '/scrooge/api/v0.9/pricingserviceusagesasync/',
+            data=self._get_body(),
+            content_type='application/x-ndjson',
+            HTTP_AUTHORIZATION=self.api_key,
+        )
+        self.assertEquals(resp.status_code, 202)
+        job_id = json.loads(resp.content)['job_id']
+        # job is not really run
+        os.remove(get_upload_path(job_id))
+        job.is_failed = True
+        # failed state is kept for next status requests
+        for i in range(2):
+            resp = self.client.get(
+                '/scrooge/api/v0.9/pricingserviceusagesasync/{}/'.format(
+                    job_id,
+                ),
+                HTTP_AUTHORIZATION=self.api_key,
+            )
+            self.assertEquals(resp.status_code, 200)
+            data = json.loads(resp.content)
+            self.assertTrue(data['finished'])
+            self.assertTrue(data['failed'])
+        self.assertEquals(
+            django_rq_mock.get_queue.return_value.enqueue_call.call_count,
+            1,
+        )
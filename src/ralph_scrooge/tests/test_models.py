@@ -185,6 +185,98 @@ class TestPricingService(ScroogeTestCase):
         )
         self.assertEquals(set(result), set())
 
+    def test_get_dependent_services_exclude(self):
+        self._set_sample_usages()
+        result = self.ps1.get_dependent_services(
+            date=datetime.date(2013, 10, 3),
+            exclude=[self.ps2],
+        )
+        self.assertEquals(set(result), set([self.ps3]))
+
+    def test_get_dependent_services_excluded_service(self):
+        self._set_sample_usages()
+        self.ps2.excluded_services.add(self.ps1.services.all()[0])
+        result = self.ps1.get_dependent_services(
+            date=datetime.date(2013, 10, 3),
+        )
+        self.assertEquals(set(result), set([self.ps3]))
+
+
+class TestPricingServiceDependencyGraph(ScroogeTestCase):
+    def setUp(self):
+        self.today = datetime.date(2013, 10, 3)
+        self.ps1, self.ps2, self.ps3, self.ps4 = (
+            PricingServiceFactory.create_batch(4)
+        )
+        self.ut1, self.ut2, self.ut3, self.ut4 = UsageTypeFactory.create_batch(
+            4,
+            usage_type='SU',
+        )
+        for ps, ut in [
+            (self.ps1, self.ut1),
+            (self.ps2, self.ut2),
+            (self.ps3, self.ut3),
+            (self.ps4, self.ut4),
+        ]:
+            models.ServiceUsageTypes.objects.create(
+                usage_type=ut,
+                pricing_service=ps,
+            )
+
+    def _add_usage(self, ps, usage_type):
+        models.DailyUsage.objects.create(
+            daily_pricing_object=DailyPricingObjectFactory(),
+            type=usage_type,
+            date=self.today,
+            service_environment=ServiceEnvironmentFactory(
+                service__pricing_service=ps,
+            ),
+            value=100,
+        )
+
+    def test_dependencies(self):
+        # ps1 -> ps2 -> ps3
+        self._add_usage(self.ps1, self.ut2)
+        self._add_usage(self.ps2, self.ut3)
+        graph = models.PricingServiceDependencyGraph(self.today)
+        self.assertEquals(
+            graph.get_dependent_services_ids(self.ps1.id),
+            set([self.ps2.id]),
+        )
+        self.assertEquals(
+            graph.get_all_dependent_services_ids(self.ps1.id),
+            set([self.ps2.id, self.ps3.id]),
+        )
+        self.assertEquals(graph.get_dependent_services_ids(self.ps4.id), set())
+        self.assertEquals(graph.cycles, set())
+
+    def test_topological_order(self):
+        # ps1 -> ps2 -> ps3, ps4 -> ps1
+        self._add_usage(self.ps1, self.ut2)
+        self._add_usage(self.ps2, self.ut3)
+        self._add_usage(self.ps4, self.ut1)
+        graph = models.PricingServiceDependencyGraph(self.today)
+        self.assertEquals(
+            graph.topological_order(),
+            [self.ps3.id, self.ps2.id, self.ps1.id, self.ps4.id],
+        )
+
+    def test_cycle(self):
+        # ps1 -> ps2 -> ps3 -> ps1, ps4 -> ps1
+        self._add_usage(self.ps1, self.ut2)
+        self._add_usage(self.ps2, self.ut3)
+        self._add_usage(self.ps3, self.ut1)
+        self._add_usage(self.ps4, self.ut1)
+        graph = models.PricingServiceDependencyGraph(self.today)
+        self.assertEquals(
+            graph.cycles,
+            set([self.ps1.id, self.ps2.id, self.ps3.id]),
+        )
+        self.assertEquals(
+            graph.topological_order(),
+            sorted([self.ps1.id, self.ps2.id, self.ps3.id, self.ps4.id]),
+        )
+
 
 class TestDailyCost(ScroogeTestCase):
     def setUp(self):
@@ -5,11 +5,30 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from datetime import date
+import os
+import tempfile
+from datetime import date, datetime, timedelta
 
+import mock
 from django.test import TestCase
+from django.test.utils import override_settings
 
-from ralph_scrooge.utils import common
+from ralph_scrooge.models import CostDateStatus, CostInputChange, MonthlyCost
+from ralph_scrooge.tests.utils.factory import (
+    CostDateStatusFactory,
+    DailyCostFactory,
+    DailyUsageFactory,
+    ServiceEnvironmentFactory,
+    UsagePriceFactory,
+    UsageTypeFactory,
+)
+from ralph_scrooge.utils import (
+    common,
+    costs_changes,
+    costs_memo,
+    monthly_costs,
+    report_storage,
+)
 
 
 class TestRangesOverlap(TestCase):
@@ -50,3 +69,316 @@ class TestRangesOverlap(TestCase):
             ],
             result
         )
+
+
+class SamplePlugin(object):
+    def __init__(self):
+        self.calls = 0
+
+    @costs_memo.costs_memo
+    def total_cost(self, **kwargs):
+        self.calls += 1
+        return {1: (self.calls, {})}
+
+
+class TestCostsMemo(TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        costs_memo._costs_memo.clear()
+        self.settings = override_settings(
+            SCROOGE_COSTS_MEMO=(
+                'ralph_scrooge.utils.costs_memo.SQLiteCostsMemo'
+            ),
+            SCROOGE_COSTS_MEMO_SQLITE_PATH=self.path,
+        )
+        self.settings.enable()
+        self.plugin = SamplePlugin()
+        self.usage_type = UsageTypeFactory()
+        self.service_environments = ServiceEnvironmentFactory.create_batch(2)
+
+    def tearDown(self):
+        self.settings.disable()
+        costs_memo._costs_memo.clear()
+        os.remove(self.path)
+
+    def test_memo_key(self):
+        key1 = costs_memo.get_costs_memo_key(self.plugin, 'total_cost', dict(
+            date=date(2014, 10, 1),
+            usage_type=self.usage_type,
+            service_environments=self.service_environments,
+        ))
+        key2 = costs_memo.get_costs_memo_key(self.plugin, 'total_cost', dict(
+            date=date(2014, 10, 1),
+            usage_type=self.usage_type,
+            service_environments=list(reversed(self.service_environments)),
+        ))
+        key3 = costs_memo.get_costs_memo_key(self.plugin, 'total_cost', dict(
+            date=date(2014, 10, 2),
+            usage_type=self.usage_type,
+            service_environments=self.service_environments,
+        ))
+        self.assertEquals(key1, key2)
+        self.assertNotEquals(key1, key3)
+
+    def test_costs_memo(self):
+        kwargs = dict(
+            date=date(2014, 10, 1),
+            usage_type=self.usage_type,
+            forecast=False,
+        )
+        self.assertEquals(self.plugin.total_cost(**kwargs), {1: (1, {})})
+        self.assertEquals(self.plugin.total_cost(**kwargs), {1: (1, {})})
+        self.assertEquals(self.plugin.calls, 1)
+        kwargs['forecast'] = True
+        self.assertEquals(self.plugin.total_cost(**kwargs), {1: (2, {})})
+
+    def test_costs_memo_cleared_on_usage_price_change(self):
+        kwargs = dict(date=date(2014, 10, 1), usage_type=self.usage_type)
+        self.plugin.total_cost(**kwargs)
+        UsagePriceFactory(type=self.usage_type)
+        self.assertEquals(self.plugin.total_cost(**kwargs), {1: (2, {})})
+        self.assertEquals(self.plugin.calls, 2)
+
+    @override_settings(SCROOGE_COSTS_MEMO=None)
+    def test_costs_memo_disabled(self):
+        kwargs = dict(date=date(2014, 10, 1), usage_type=self.usage_type)
+        self.plugin.total_cost(**kwargs)
+        self.plugin.total_cost(**kwargs)
+        self.assertEquals(self.plugin.calls, 2)
+
+    @mock.patch('ralph_scrooge.utils.costs_memo.get_cache')
+    def test_django_cache_memo_clear(self, get_cache_mock):
+        cache = {}
+        get_cache_mock.return_value.get.side_effect = cache.get
+        get_cache_mock.return_value.set.side_effect = (
+            lambda key, value, timeout: cache.__setitem__(key, value)
+        )
+        get_cache_mock.return_value.add.side_effect = (
+            lambda key, value, timeout: cache.setdefault(key, value)
+        )
+        memo = costs_memo.DjangoCacheCostsMemo()
+        memo.set('a', 1)
+        self.assertEquals(memo.get('a'), 1)
+        memo.clear()
+        self.assertEquals(memo.get('a'), None)
+
+
+class TestCostsChanges(TestCase):
+    def setUp(self):
+        self.usage_type = UsageTypeFactory()
+        self.day1 = date(2014, 10, 1)
+        self.day2 = date(2014, 10, 2)
+        self.day3 = date(2014, 11, 1)
+        CostDateStatusFactory(date=self.day1, calculated=True)
+        CostDateStatusFactory(
+            date=self.day2,
+            calculated=True,
+            forecast_calculated=True,
+        )
+        CostDateStatusFactory(date=self.day3, calculated=True)
+
+    def _get_changes(self):
+        return sorted(CostInputChange.objects.values_list(
+            'date',
+            'forecast',
+            'type_id',
+        ))
+
+    def test_register_change(self):
+        costs_changes.register_costs_input_change(
+            [self.usage_type.id],
+            self.day2,
+            self.day2,
+        )
+        self.assertEquals(self._get_changes(), [
+            (self.day2, False, self.usage_type.id),
+            (self.day2, True, self.usage_type.id),
+        ])
+
+    def test_register_change_unlimited_period(self):
+        usage_type2 = UsageTypeFactory()
+        costs_changes.register_costs_input_change(
+            [self.usage_type.id, usage_type2.id],
+        )
+        self.assertEquals(self._get_changes(), sorted(
+            (day, forecast, type_id)
+            for day, forecast in [
+                (self.day1, False),
+                (self.day2, False),
+                (self.day2, True),
+                (self.day3, False),
+            ]
+            for type_id in (self.usage_type.id, usage_type2.id)
+        ))
+
+    def test_register_change_touches_registered(self):
+        modified = datetime.now() - timedelta(days=1)
+        CostInputChange.objects.create(
+            date=self.day1,
+            forecast=False,
+            type=self.usage_type,
+            modified=modified,
+        )
+        costs_changes.register_costs_input_change(
+            [self.usage_type.id],
+            self.day1,
+            self.day2,
+        )
+        self.assertEquals(self._get_changes(), [
+            (self.day1, False, self.usage_type.id),
+            (self.day2, False, self.usage_type.id),
+            (self.day2, True, self.usage_type.id),
+        ])
+        self.assertGreater(
+            CostInputChange.objects.get(date=self.day1).modified,
+            modified,
+        )
+
+    def test_not_calculated_day(self):
+        costs_changes.register_costs_input_change(
+            [self.usage_type.id],
+            date(2014, 10, 3),
+            date(2014, 10, 3),
+        )
+        self.assertEquals(self._get_changes(), [])
+
+    def test_daily_usage_not_tracked_by_signals(self):
+        # daily usages changes are registered explicitly by collect plugins
+        DailyUsageFactory(date=self.day2, type=self.usage_type)
+        self.assertEquals(self._get_changes(), [])
+
+    def test_usage_price_period_change(self):
+        usage_price = UsagePriceFactory(
+            type=self.usage_type,
+            start=self.day1,
+            end=self.day1,
+        )
+        CostInputChange.objects.all().delete()
+        usage_price.start = usage_price.end = self.day3
+        usage_price.save()
+        # both previous and current period of price are changed
+        self.assertEquals(self._get_changes(), [
+            (self.day1, False, self.usage_type.id),
+            (self.day3, False, self.usage_type.id),
+        ])
+
+    def test_clear_changes(self):
+        costs_changes.register_costs_input_change([self.usage_type.id])
+        costs_changes.clear_costs_inputs_changes(
+            self.day1,
+            False,
+            changed_before=datetime.now() - timedelta(days=1),
+        )
+        self.assertEquals(
+            costs_changes.get_changed_types(self.day1, False),
+            set([self.usage_type.id]),
+        )
+        costs_changes.clear_costs_inputs_changes(self.day1, False)
+        self.assertEquals(
+            costs_changes.get_changed_types(self.day1, False),
+            set(),
+        )
+
+
+class TestMonthlyCosts(TestCase):
+    def setUp(self):
+        self.se = ServiceEnvironmentFactory()
+        self.usage_type = UsageTypeFactory()
+        self.start = date(2014, 9, 30)
+        self.end = date(2014, 11, 2)
+        day = self.start
+        while day <= self.end:
+            CostDateStatusFactory(date=day, accepted=day.day != 15)
+            DailyCostFactory(
+                date=day,
+                service_environment=self.se,
+                type=self.usage_type,
+                value=1,
+                cost=2,
+            )
+            day += timedelta(days=1)
+
+    def _get_sums(self, **kwargs):
+        return monthly_costs.get_costs_sums(
+            self.start,
+            self.end,
+            False,
+            ['type'],
+            service_environment=self.se,
+            **kwargs
+        )
+
+    def test_refresh_monthly_costs(self):
+        monthly_costs.refresh_monthly_costs(self.start, self.end)
+        self.assertEquals(
+            sorted(MonthlyCost.objects.values_list('month', 'value', 'cost')),
+            [
+                (date(2014, 9, 1), 1, 2),
+                (date(2014, 10, 1), 30, 60),
+                (date(2014, 11, 1), 2, 4),
+            ]
+        )
+
+    def test_accept_costs(self):
+        monthly_costs.accept_costs(date(2014, 10, 15), date(2014, 10, 15))
+        self.assertTrue(
+            CostDateStatus.objects.get(date=date(2014, 10, 15)).accepted
+        )
+        # rollup of whole month is rebuilt
+        self.assertEquals(
+            list(MonthlyCost.objects.values_list('month', 'value', 'cost')),
+            [(date(2014, 10, 1), 31, 62)],
+        )
+
+    def test_get_costs_sums(self):
+        monthly_costs.refresh_monthly_costs(self.start, self.end)
+        # only October is taken from rollup
+        self.assertEquals(
+            self._get_sums(),
+            [(self.usage_type.id, 33, 66)],
+        )
+        # not accepted 15th of October is included, so rollup is not used
+        self.assertEquals(
+            self._get_sums(accepted_only=False),
+            [(self.usage_type.id, 34, 68)],
+        )
+
+    def test_get_costs_sums_not_refreshed(self):
+        self.assertEquals(
+            self._get_sums(accepted_only=False),
+            [(self.usage_type.id, 34, 68)],
+        )
+
+
+class TestChunkedReport(TestCase):
+    cache_name = 'django.core.cache.backends.locmem.LocMemCache'
+
+    def setUp(self):
+        self.header = [['a', 'b']]
+        self.rows = [[i, i * 2] for i in range(5)]
+
+    def test_save_in_blocks(self):
+        report = report_storage.ChunkedReport.save(
+            self.cache_name,
+            self.header,
+            iter(self.rows),
+            timeout=60,
+            block_size=2,
+        )
+        self.assertEquals(report.blocks_count, 3)
+        self.assertEquals(report.rows_count, 5)
+        self.assertEquals(report.header, self.header)
+        self.assertEquals(list(report.iter_rows()), self.rows)
+
+    def test_missing_block(self):
+        report = report_storage.ChunkedReport.save(
+            self.cache_name,
+            self.header,
+            self.rows,
+            timeout=60,
+            block_size=2,
+        )
+        report.delete()
+        with self.assertRaises(report_storage.ReportBlockMissingError):
+            list(report.iter_rows())
@@ -315,6 +315,13 @@ class CostDateStatusFactory(DjangoModelFactory):
     date = datetime.date.today()
 
 
+class CostInputChangeFactory(DjangoModelFactory):
+    FACTORY_FOR = models.CostInputChange
+
+    date = datetime.date.today()
+    type = SubFactory(BaseUsageFactory)
+
+
 class ServiceUsageTypesFactory(DjangoModelFactory):
     FACTORY_FOR = models.ServiceUsageTypes
 
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import csv
+import json
+
+from django.contrib.auth.models import User
+from django.core.cache import get_cache
+from django.test import TestCase, Client
+from django.utils.translation import ugettext_lazy as _
+from mock import patch
+from ralph.account.models import Perm
+
+from ralph_scrooge.app import Scrooge
+from ralph_scrooge.report.report_services_costs import ServicesCostsReport
+from ralph_scrooge.utils.report_storage import ChunkedReport
+
+LOCMEM_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+class TestReportExport(TestCase):
+    def setUp(self):
+        self.client = Client()
+        user = User.objects.create_user(
+            username='accountant',
+            password='12345'
+        )
+        user.profile.boundperm_set.create(perm=Perm.has_scrooge_access)
+        self.client.login(username='accountant', password='12345')
+        self.header = [
+            [(_('Service'), {'rowspan': 2}), (_('Costs'), {'colspan': 2})],
+            [_('Total cost'), 'count'],
+        ]
+        self.rows = [['s1', '1.00', 2], ['s2', '3.50', None]]
+        self.report = ChunkedReport.save(
+            LOCMEM_CACHE,
+            self.header,
+            self.rows,
+            60,
+            block_size=1,
+        )
+
+    def tearDown(self):
+        self.report.delete()
+
+    def _get_report(self, export_format):
+        with patch.object(
+            ServicesCostsReport,
+            'run_on_worker',
+            return_value=(100, self.report),
+        ):
+            response = self.client.get(
+                '/{}/services-costs-report/'.format(Scrooge.url_prefix),
+                {
+                    'start': '2014-01-01',
+                    'end': '2014-01-31',
+                    'format': export_format,
+                },
+            )
+        self.assertEquals(response.status_code, 200)
+        return response
+
+    def test_json_export(self):
+        response = self._get_report('json')
+        self.assertEquals(response['Content-Type'], 'application/json')
+        self.assertEquals(json.loads(response.content), {
+            'header': [
+                [['Service', {'rowspan': 2}], ['Costs', {'colspan': 2}]],
+                [['Total cost', {}], ['count', {}]],
+            ],
+            'data': self.rows,
+        })
+
+    def test_csv_export(self):
+        response = self._get_report('csv')
+        self.assertEquals(response['Content-Type'], 'text/csv')
+        self.assertEquals(list(csv.reader(response.content.splitlines())), [
+            [b'Service', b'Costs', b''],
+            [b'', b'Total cost', b'count'],
+            [b's1', b'1.00', b'2'],
+            [b's2', b'3.50', b''],
+        ])
+
+    def test_unknown_format_falls_back_to_html(self):
+        response = self._get_report('xml')
+        self.assertIn('text/html', response['Content-Type'])
+        self.assertFalse(response.has_header('Content-Disposition'))
+
+    @patch.object(ServicesCostsReport, '_clear_cache')
+    def test_expired_report_export(self, clear_cache_mock):
+        get_cache(LOCMEM_CACHE).delete(
+            ChunkedReport._get_block_key(self.report.token, 1),
+        )
+        response = self._get_report('csv')
+        self.assertIn('text/html', response['Content-Type'])
+        self.assertTrue(clear_cache_mock.called)
@@ -11,6 +11,7 @@ from rest_framework import routers
 from tastypie.api import Api
 
 from ralph_scrooge.api import PricingServiceUsageResource, SyncStatusViewSet
+from ralph_scrooge.api_async import push_usages, push_usages_status
 from ralph_scrooge.views.bootstrapangular import BootstrapAngular
 from ralph_scrooge.views.collect_plugins import CollectPlugins
 from ralph_scrooge.views.extra_costs import ExtraCosts
@@ -37,6 +38,16 @@ urlpatterns = patterns(
     '',
     url(r'^rest/', include('ralph_scrooge.rest.urls')),
     url(r'^leftmenu/(?P<menu_type>\S+)/$', login_required(left_menu)),
+    url(
+        r'^api/v0.9/pricingserviceusagesasync/$',
+        push_usages,
+        name='push_usages',
+    ),
+    url(
+        r'^api/v0.9/pricingserviceusagesasync/(?P<job_id>[0-9a-f]+)/$',
+        push_usages_status,
+        name='push_usages_status',
+    ),
     url(r'^api/', include(v09_api.urls)),
     url(r'^api/', include(v09_router.urls)),
     url(
@@ -5,6 +5,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import itertools
 from decimal import Decimal
 from functools import wraps
 
@@ -73,6 +74,23 @@ def ranges_overlap(start1, end1, start2, end2):
     return start1 <= end2 and end1 >= start2
 
 
+def chunks(iterable, size):
+    """
+    Split iterable into lists of (at most) size elements. Useful to limit
+    number of params of `__in` queries (ex. SQLite allows at most 999 params
+    in single query).
+
+    >>> list(chunks(range(5), 2))
+    [[0, 1], [2, 3], [4]]
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            break
+        yield chunk
+
+
 def sum_of_intervals(intervals):
     """
     Returns (list of) sum of intervals. Intervals could be tuple of any
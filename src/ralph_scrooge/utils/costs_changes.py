@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Tracking of changes of costs inputs.
+
+Every change of costs input (daily usage, usage price, team cost, extra
+cost etc.) is registered as CostInputChange of type, which costs are
+affected by it (ex. usage type for daily usages and usage prices, team for
+team costs), for every day in input's period, on which costs were already
+calculated (costs of other days will be calculated from scratch anyway).
+Registered changes are used by incremental costs recalculation (see
+`Collector.process_incremental`) and are removed when costs are saved.
+
+Changes are registered on `pre_save` (previous state of input) and
+`post_save`/`post_delete` (current state) signals. Notice that signals are not
+sent on bulk operations (ex. `bulk_create` or `QuerySet.update`) - in such
+case `register_costs_input_change` should be called explicitly. Daily usages
+are saved in large numbers by collect plugins, so they are not tracked by
+signals at all - every code saving or deleting daily usages should register
+change of their types once (per plugin run and day).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from ralph_scrooge import models
+
+logger = logging.getLogger(__name__)
+
+
+def _get_usage_type_change(instance):
+    return instance.type_id, instance.start, instance.end
+
+
+def _get_team_cost_change(instance):
+    return instance.team_id, instance.start, instance.end
+
+
+def _get_team_percent_change(instance):
+    team_cost = instance.team_cost
+    return team_cost.team_id, team_cost.start, team_cost.end
+
+
+def _get_extra_cost_change(instance):
+    return instance.extra_cost_type_id, instance.start, instance.end
+
+
+def _get_dynamic_extra_cost_change(instance):
+    return instance.dynamic_extra_cost_type_id, instance.start, instance.end
+
+
+def _get_service_usage_types_change(instance):
+    return instance.pricing_service_id, instance.start, instance.end
+
+
+# functions returning tuple (type id, start, end) of change of input model
+COSTS_INPUTS = {
+    models.DynamicExtraCost: _get_dynamic_extra_cost_change,
+    models.ExtraCost: _get_extra_cost_change,
+    models.ServiceUsageTypes: _get_service_usage_types_change,
+    models.SupportCost: _get_extra_cost_change,
+    models.TeamCost: _get_team_cost_change,
+    models.TeamServiceEnvironmentPercent: _get_team_percent_change,
+    models.UsagePrice: _get_usage_type_change,
+}
+
+
+def register_costs_input_change(types_ids, start=None, end=None):
+    """
+    Register change of costs of types between start and end (None means
+    unlimited period) on every day, on which costs were already calculated
+    (separately for real and forecast costs).
+
+    Changes are registered in bulk - affected days are fetched in single
+    query, already registered changes are touched by single update and
+    missing ones are inserted by single `bulk_create`.
+
+    :param types_ids: list of types (BaseUsage) ids
+    """
+    types_ids = set(types_ids)
+    if not types_ids:
+        return
+    statuses = models.CostDateStatus.objects.filter(
+        Q(calculated=True) | Q(forecast_calculated=True)
+    )
+    changes = models.CostInputChange.objects.filter(type_id__in=types_ids)
+    if start:
+        statuses = statuses.filter(date__gte=start)
+        changes = changes.filter(date__gte=start)
+    if end:
+        statuses = statuses.filter(date__lte=end)
+        changes = changes.filter(date__lte=end)
+    affected = set()
+    for date, calculated, forecast_calculated in statuses.values_list(
+        'date',
+        'calculated',
+        'forecast_calculated',
+    ):
+        if calculated:
+            affected.add((date, False))
+        if forecast_calculated:
+            affected.add((date, True))
+    if not affected:
+        return
+    now = datetime.datetime.now()
+    changes.update(modified=now)
+    registered = set(changes.values_list('date', 'forecast', 'type_id'))
+    missing = [
+        models.CostInputChange(
+            date=date,
+            forecast=forecast,
+            type_id=type_id,
+            modified=now,
+        )
+        for date, forecast in sorted(affected)
+        for type_id in sorted(types_ids)
+        if (date, forecast, type_id) not in registered
+    ]
+    if not missing:
+        return
+    sid = transaction.savepoint()
+    try:
+        models.CostInputChange.objects.bulk_create(missing)
+    except IntegrityError:
+        # some of changes were registered concurrently
+        transaction.savepoint_rollback(sid)
+        for change in missing:
+            models.CostInputChange.concurrent_get_or_create(
+                date=change.date,
+                type_id=change.type_id,
+                forecast=change.forecast,
+            )
+    else:
+        transaction.savepoint_commit(sid)
+
+
+def get_changed_types(date, forecast):
+    """
+    Returns ids of types which costs changed on date since last calculation.
+    """
+    return set(models.CostInputChange.objects.filter(
+        date=date,
+        forecast=forecast,
+    ).values_list('type_id', flat=True))
+
+
+def clear_costs_inputs_changes(date, forecast, changed_before=None):
+    """
+    Remove changes registered for date (and before changed_before time, if
+    passed, to not lose changes made during costs calculation).
+    """
+    changes = models.CostInputChange.objects.filter(
+        date=date,
+        forecast=forecast,
+    )
+    if changed_before:
+        changes = changes.filter(modified__lte=changed_before)
+    changes.delete()
+
+
+def _register_instance_change(instance):
+    type_id, start, end = COSTS_INPUTS[instance.__class__](instance)
+    logger.debug('Registering change of {} costs ({} - {})'.format(
+        type_id,
+        start,
+        end,
+    ))
+    register_costs_input_change([type_id], start, end)
+
+
+def costs_input_pre_save(sender, instance, **kwargs):
+    """
+    Register change of previous state of input (ex. when period of input
+    changed).
+    """
+    if instance.pk:
+        try:
+            _register_instance_change(sender.objects.get(pk=instance.pk))
+        except sender.DoesNotExist:
+            pass
+
+
+def costs_input_changed(sender, instance, **kwargs):
+    _register_instance_change(instance)
+
+
+for model in COSTS_INPUTS:
+    pre_save.connect(costs_input_pre_save, sender=model)
+    post_save.connect(costs_input_changed, sender=model)
+    post_delete.connect(costs_input_changed, sender=model)
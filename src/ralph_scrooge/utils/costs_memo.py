@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Shared memo of costs plugins results.
+
+Unlike `memoize` (which caches results only in current process), costs memo
+is shared between processes (ex. RQ workers calculating costs for different
+days or collector pool workers), so total cost of (dependent) pricing service
+is calculated only once for every set of service environments.
+
+Memo backend is configured by SCROOGE_COSTS_MEMO setting (dotted path to memo
+class, ex. `ralph_scrooge.utils.costs_memo.DjangoCacheCostsMemo`). If it's
+None (default), costs memo is disabled.
+
+Memo is cleared every time when any of costs inputs (usage prices, daily
+usages, teams costs, extra costs etc.) is changed. Notice that signals are not
+sent on bulk operations (ex. `bulk_create` or `QuerySet.update`) - in such
+case `clear_costs_memo` should be called explicitly.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import cPickle as pickle
+import datetime
+import hashlib
+import logging
+import os
+import sqlite3
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.db import models as db
+from django.db.models.query import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.utils.importlib import import_module
+
+from ralph_scrooge import models
+from ralph_scrooge.utils.common import get_cache_name
+
+logger = logging.getLogger(__name__)
+
+# models, which change invalidates costs memo
+COSTS_INPUT_MODELS = (
+    models.DailyUsage,
+    models.DynamicExtraCost,
+    models.ExtraCost,
+    models.ServiceUsageTypes,
+    models.SupportCost,
+    models.TeamCost,
+    models.TeamServiceEnvironmentPercent,
+    models.UsagePrice,
+)
+
+
+class BaseCostsMemo(object):
+    """
+    Base class for costs memo backends.
+    """
+    def get(self, key):
+        """
+        Returns value stored under key or None if there is no such key.
+        """
+        raise NotImplementedError()
+
+    def set(self, key, value):
+        raise NotImplementedError()
+
+    def clear(self):
+        """
+        Invalidate all values stored in memo.
+        """
+        raise NotImplementedError()
+
+
+class DjangoCacheCostsMemo(BaseCostsMemo):
+    """
+    Costs memo stored in `scrooge_costs` Django cache.
+
+    Every key is prefixed by memo version (random token), so clearing memo is
+    just changing it's version (old values will expire eventually).
+    """
+    version_key = 'scrooge_costs_memo_version'
+
+    def __init__(self):
+        self.cache = get_cache(get_cache_name('scrooge_costs'))
+        self.timeout = settings.SCROOGE_COSTS_MEMO_TIMEOUT
+
+    def _get_version(self):
+        version = self.cache.get(self.version_key)
+        if version is None:
+            # if version expired, old values are not valid anymore
+            self.cache.add(self.version_key, uuid.uuid4().hex, self.timeout)
+            version = self.cache.get(self.version_key)
+        return version
+
+    def _get_key(self, key):
+        return b'scrooge_costs_memo:{}:{}'.format(self._get_version(), key)
+
+    def get(self, key):
+        return self.cache.get(self._get_key(key))
+
+    def set(self, key, value):
+        self.cache.set(self._get_key(key), value, self.timeout)
+
+    def clear(self):
+        self.cache.set(self.version_key, uuid.uuid4().hex, self.timeout)
+
+
+class SQLiteCostsMemo(BaseCostsMemo):
+    """
+    Costs memo stored in local SQLite file (SCROOGE_COSTS_MEMO_SQLITE_PATH).
+    Useful when all costs are calculated on single host.
+    """
+    def __init__(self):
+        self.path = settings.SCROOGE_COSTS_MEMO_SQLITE_PATH
+        self._connection = None
+        self._pid = None
+
+    @property
+    def connection(self):
+        # every process should use it's own connection
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(
+                self.path,
+                timeout=60,
+                isolation_level=None,
+            )
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS costs_memo '
+                '(key TEXT PRIMARY KEY, value BLOB)'
+            )
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, key):
+        row = self.connection.execute(
+            'SELECT value FROM costs_memo WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(bytes(row[0]))
+
+    def set(self, key, value):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO costs_memo (key, value) VALUES (?, ?)',
+            (key, sqlite3.Binary(
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            ))
+        )
+
+    def clear(self):
+        self.connection.execute('DELETE FROM costs_memo')
+
+
+_costs_memo = {}
+
+
+def get_costs_memo():
+    """
+    Returns costs memo backend configured in settings or None, if costs memo
+    is disabled.
+    """
+    path = settings.SCROOGE_COSTS_MEMO
+    if not path:
+        return None
+    if path not in _costs_memo:
+        module_name, class_name = path.rsplit('.', 1)
+        _costs_memo[path] = getattr(import_module(module_name), class_name)()
+    return _costs_memo[path]
+
+
+def clear_costs_memo(**kwargs):
+    """
+    Invalidate costs memo (if enabled). Could be used as a signal handler.
+    """
+    memo = get_costs_memo()
+    if memo is not None:
+        logger.debug('Clearing costs memo')
+        memo.clear()
+
+
+def _get_key_part(value):
+    if isinstance(value, db.Model):
+        return '{}:{}'.format(value._meta.object_name, value.pk)
+    if isinstance(value, QuerySet):
+        parts = [
+            '{}:{}'.format(value.model._meta.object_name, pk)
+            for pk in value.values_list('pk', flat=True)
+        ]
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        parts = [_get_key_part(v) for v in value]
+    elif isinstance(value, (datetime.date, datetime.datetime)):
+        # dates are passed to plugins as date or datetime objects
+        return value.strftime('%Y-%m-%d')
+    else:
+        return repr(value)
+    # use hash of (sorted) elements of collection to keep key short
+    return hashlib.md5(','.join(sorted(parts)).encode('utf-8')).hexdigest()
+
+
+def get_costs_memo_key(plugin, func_name, kwargs):
+    """
+    Returns memo key for plugin method call - it's built from plugin name,
+    method name and all call arguments (model instances are represented by
+    their ids, collections of model instances (ex. service environments) by
+    hash of their ids).
+    """
+    parts = [plugin.__class__.__name__, func_name]
+    for key, value in sorted(kwargs.items()):
+        parts.append('{}={}'.format(key, _get_key_part(value)))
+    return hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def costs_memo(func):
+    """
+    Store result of plugin method in costs memo. Method should be called only
+    with keyword arguments (as it is when plugin is called through ralph
+    plugin runner) - otherwise memo is not used.
+    """
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        memo = get_costs_memo()
+        if memo is None or args:
+            return func(self, *args, **kwargs)
+        key = get_costs_memo_key(self, func.__name__, kwargs)
+        result = memo.get(key)
+        if result is None:
+            result = func(self, **kwargs)
+            memo.set(key, result)
+        return result
+    return wrapper
+
+
+for model in COSTS_INPUT_MODELS:
+    post_save.connect(clear_costs_memo, sender=model)
+    post_delete.connect(clear_costs_memo, sender=model)
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Monthly rollup of accepted costs.
+
+Sum of (first depth) costs and values of every accepted day of month is
+stored in MonthlyCost (per service environment, type, pricing object and
+forecast flag). Rollup of month is rebuilt (using single INSERT ... SELECT
+query) every time when costs of any day of this month are accepted.
+
+Views which sum costs over period read whole months of the period from the
+rollup (thousands of rows instead of millions of daily costs) and only the
+remaining days from DailyCost (see `get_costs_sums`).
+
+Every month has also version (random token stored in `scrooge_monthly_costs`
+Django cache), which is changed when rollup of month is refreshed or when
+status of any day of month is changed. It could be used as a part of cache
+key of responses built from costs of month (ex. cost card). If this cache is
+not shared between processes (ex. local memory cache), version is computed
+from the database instead (statuses of days and rollup of month), because
+invalidation would reach only the process which changed costs.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import calendar
+import datetime
+import hashlib
+import logging
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.signals import post_delete, post_save
+
+from ralph_scrooge.models import CostDateStatus, DailyCost, MonthlyCost
+from ralph_scrooge.utils.common import get_cache_name
+
+logger = logging.getLogger(__name__)
+
+
+def _month_end(month):
+    return month.replace(day=calendar.monthrange(month.year, month.month)[1])
+
+
+def _get_months(start, end):
+    """
+    Returns first days of every month between start and end (including
+    months partially in this period).
+    """
+    months = []
+    month = start.replace(day=1)
+    while month <= end:
+        months.append(month)
+        month = _month_end(month) + datetime.timedelta(days=1)
+    return months
+
+
+def _get_version_key(month, forecast):
+    return b'scrooge_monthly_costs_version:{}:{}'.format(
+        month.strftime('%Y-%m'),
+        'forecast' if forecast else 'real',
+    )
+
+
+def _is_shared_cache(cache):
+    # local memory (and dummy) cache is separate for every process
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+
+def _get_db_version(month, forecast):
+    """
+    Returns version of costs of month computed from statuses of its days and
+    its rollup (every refresh of rollup creates new rows, with new ids).
+    """
+    month = month.replace(day=1)
+    statuses = list(CostDateStatus.objects.filter(
+        date__gte=month,
+        date__lte=_month_end(month),
+    ).order_by('date').values_list(
+        'date',
+        'calculated',
+        'forecast_calculated',
+        'accepted',
+        'forecast_accepted',
+    ))
+    rollup = MonthlyCost.objects.filter(
+        month=month,
+        forecast=forecast,
+    ).aggregate(count=Count('id'), max_id=Max('id'))
+    return hashlib.md5(repr(
+        (statuses, rollup['count'], rollup['max_id'])
+    )).hexdigest()
+
+
+def get_month_version(month, forecast=False):
+    """
+    Returns current version of costs of month (month is any day of it).
+    """
+    cache = get_cache(get_cache_name('scrooge_monthly_costs'))
+    if not _is_shared_cache(cache):
+        return _get_db_version(month, forecast)
+    key = _get_version_key(month, forecast)
+    version = cache.get(key)
+    if version is None:
+        cache.add(
+            key,
+            uuid.uuid4().hex,
+            settings.SCROOGE_MONTHLY_COSTS_VERSION_TIMEOUT,
+        )
+        version = cache.get(key)
+    return version
+
+
+def invalidate_month(month, forecast=False):
+    """
+    Change version of costs of month (month is any day of it).
+    """
+    cache = get_cache(get_cache_name('scrooge_monthly_costs'))
+    cache.set(
+        _get_version_key(month, forecast),
+        uuid.uuid4().hex,
+        settings.SCROOGE_MONTHLY_COSTS_VERSION_TIMEOUT,
+    )
+
+
+def _get_accepted_dates(start, end, forecast):
+    return list(CostDateStatus.objects.filter(
+        date__gte=start,
+        date__lte=end,
+        **{'forecast_accepted' if forecast else 'accepted': True}
+    ).values_list('date', flat=True))
+
+
+def _rebuild_months(months, forecast):
+    for month in months:
+        month_end = _month_end(month)
+        logger.info('Refreshing monthly costs of {} ({})'.format(
+            month.strftime('%Y-%m'),
+            'forecast' if forecast else 'real',
+        ))
+        cursor = connection.cursor()
+        # raw SQL is used, because Django (1.4) fetches every deleted object
+        # to send signals
+        cursor.execute(
+            'DELETE FROM {} WHERE month = %s AND forecast = %s'.format(
+                MonthlyCost._meta.db_table,
+            ),
+            [month, forecast],
+        )
+        dates = _get_accepted_dates(month, month_end, forecast)
+        if not dates:
+            continue
+        cursor.execute(
+            """
+            INSERT INTO {monthly} (
+                month, service_environment_id, type_id, pricing_object_id,
+                forecast, value, cost
+            )
+            SELECT
+                %s, service_environment_id, type_id, pricing_object_id,
+                forecast, SUM(value), SUM(cost)
+            FROM {daily}
+            WHERE depth = 0 AND forecast = %s AND date IN ({dates})
+            GROUP BY
+                service_environment_id, type_id, pricing_object_id, forecast
+            """.format(
+                monthly=MonthlyCost._meta.db_table,
+                daily=DailyCost._meta.db_table,
+                dates=', '.join(['%s'] * len(dates)),
+            ),
+            [month, forecast] + dates,
+        )
+
+
+@transaction.commit_on_success
+def _refresh_months(months, forecast):
+    _rebuild_months(months, forecast)
+
+
+@transaction.commit_on_success
+def _accept_and_refresh_months(start, end, months, forecast):
+    CostDateStatus.objects.filter(date__gte=start, date__lte=end).update(**{
+        'forecast_accepted' if forecast else 'accepted': True,
+    })
+    _rebuild_months(months, forecast)
+
+
+def refresh_monthly_costs(start, end, forecast=False):
+    """
+    Rebuild rollup of every month between start and end (including months
+    partially in this period) using currently accepted costs.
+    """
+    months = _get_months(start, end)
+    _refresh_months(months, forecast)
+    # version is changed after commit, to not cache old costs with new version
+    for month in months:
+        invalidate_month(month, forecast)
+
+
+def accept_costs(start, end, forecast=False):
+    """
+    Accept costs of every day between start and end and rebuild rollup of
+    their months - both in single transaction, so accepted days are never
+    left without (or with stale) rollup.
+    """
+    months = _get_months(start, end)
+    _accept_and_refresh_months(start, end, months, forecast)
+    for month in months:
+        invalidate_month(month, forecast)
+
+
+def _is_whole_month(month, start, end, forecast, accepted_only):
+    month_end = _month_end(month)
+    if month < start or month_end > end:
+        return False
+    # if not only accepted costs are summed, rollup could be used only if
+    # every day of month is accepted
+    return accepted_only or (
+        len(_get_accepted_dates(month, month_end, forecast)) == month_end.day
+    )
+
+
+def get_costs_sums(
+    start,
+    end,
+    forecast,
+    group_by,
+    q=None,
+    accepted_only=True,
+    **filters
+):
+    """
+    Sum costs and values (of first depth) between start and end, grouped by
+    `group_by` fields (common for DailyCost and MonthlyCost, ex. `type` or
+    `pricing_object_id`). Costs of whole months are taken from MonthlyCost
+    rollup, costs of the remaining days from DailyCost.
+
+    :param q: Q object to filter costs with
+    :param accepted_only: if True, only costs of accepted days are summed;
+        if False, rollup is used only for months with every day accepted
+    :param filters: additional filters of costs
+    :returns list: list of tuples (values of `group_by` fields, sum of
+        values, sum of costs)
+    """
+    months = [
+        month for month in _get_months(start, end)
+        if _is_whole_month(month, start, end, forecast, accepted_only)
+    ]
+    querysets = []
+    days_in_months = sum(_month_end(month).day for month in months)
+    if (end - start).days + 1 > days_in_months:
+        daily_costs_filter = Q(date__gte=start, date__lte=end)
+        for month in months:
+            daily_costs_filter &= ~Q(
+                date__gte=month,
+                date__lte=_month_end(month),
+            )
+        daily_costs = DailyCost.objects.filter(
+            daily_costs_filter,
+            forecast=forecast,
+        )
+        if accepted_only:
+            daily_costs = daily_costs.filter(
+                date__in=_get_accepted_dates(start, end, forecast),
+            )
+        querysets.append(daily_costs)
+    if months:
+        querysets.append(MonthlyCost.objects.filter(
+            month__in=months,
+            forecast=forecast,
+        ))
+    result = OrderedDict()
+    for queryset in querysets:
+        if q is not None:
+            queryset = queryset.filter(q)
+        queryset = queryset.filter(**filters).values_list(
+            *group_by
+        ).annotate(Sum('value')).annotate(Sum('cost'))
+        for row in queryset:
+            key = tuple(row[:-2])
+            value, cost = result.get(key, (0, 0))
+            result[key] = (value + (row[-2] or 0), cost + (row[-1] or 0))
+    return [key + sums for key, sums in result.items()]
+
+
+def cost_date_status_changed(sender, instance, **kwargs):
+    # acceptance (or calculation) of costs could be changed
+    invalidate_month(instance.date, forecast=False)
+    invalidate_month(instance.date, forecast=True)
+
+
+post_save.connect(cost_date_status_changed, sender=CostDateStatus)
+post_delete.connect(cost_date_status_changed, sender=CostDateStatus)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Chunked storage of reports results.
+
+Instead of storing whole report (header and all rows) as a single cache value
+(which could have hundreds of MB for big reports), rows of report are stored
+in blocks of SCROOGE_REPORT_BLOCK_SIZE rows, every block under separate key.
+Only small `ChunkedReport` descriptor (with header and number of blocks) is
+stored as a result of report job, so rows could be iterated block by block
+(ex. to stream report as CSV) without holding whole report in memory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import get_cache
+
+from ralph_scrooge.utils.common import chunks
+
+logger = logging.getLogger(__name__)
+
+
+class ReportBlockMissingError(Exception):
+    """
+    Raised when block of report is not found in cache (ex. it expired)
+    """
+    pass
+
+
+class ChunkedReport(object):
+    """
+    Descriptor of report which rows are stored in blocks in cache.
+    """
+    def __init__(self, cache_name, token, header, blocks_count, rows_count):
+        self.cache_name = cache_name
+        self.token = token
+        self.header = header
+        self.blocks_count = blocks_count
+        self.rows_count = rows_count
+
+    @staticmethod
+    def _get_block_key(token, index):
+        return b'scrooge_report_block:{}:{}'.format(token, index)
+
+    @classmethod
+    def save(cls, cache_name, header, rows, timeout, block_size=None):
+        """
+        Store rows (any iterable) in blocks in cache.
+
+        :returns ChunkedReport: descriptor of stored report
+        """
+        cache = get_cache(cache_name)
+        token = uuid.uuid4().hex
+        blocks_count = rows_count = 0
+        for block in chunks(
+            rows,
+            block_size or settings.SCROOGE_REPORT_BLOCK_SIZE,
+        ):
+            cache.set(
+                cls._get_block_key(token, blocks_count),
+                block,
+                timeout,
+            )
+            blocks_count += 1
+            rows_count += len(block)
+        logger.debug('{} rows of report stored in {} blocks'.format(
+            rows_count,
+            blocks_count,
+        ))
+        return cls(cache_name, token, header, blocks_count, rows_count)
+
+    def exists(self):
+        """
+        Returns True if every block of report is (still) stored in cache.
+        """
+        cache = get_cache(self.cache_name)
+        return all(
+            cache.has_key(self._get_block_key(self.token, index))
+            for index in range(self.blocks_count)
+        )
+
+    def iter_blocks(self):
+        cache = get_cache(self.cache_name)
+        for index in range(self.blocks_count):
+            block = cache.get(self._get_block_key(self.token, index))
+            if block is None:
+                raise ReportBlockMissingError(index)
+            yield block
+
+    def iter_rows(self):
+        for block in self.iter_blocks():
+            for row in block:
+                yield row
+
+    def delete(self):
+        cache = get_cache(self.cache_name)
+        for index in range(self.blocks_count):
+            cache.delete(self._get_block_key(self.token, index))
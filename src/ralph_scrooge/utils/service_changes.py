@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Log of changes of service environment of pricing objects.
+
+Change is logged (in PricingObjectServiceChange) when daily pricing object
+has different service environment than daily pricing object (of the same
+pricing object) from the previous day. Log is rebuilt by scrooge_sync once
+all plugins of synchronized day are finished (changes of this day and the
+next one are rebuilt using single INSERT ... SELECT query), so services
+changes report (with 'log' source) is just a range scan of the log.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+import logging
+
+from django.db import connection, transaction
+
+from ralph_scrooge.models import (
+    DailyPricingObject,
+    PricingObjectServiceChange,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _update_day(cursor, date):
+    # raw SQL is used, because Django (1.4) fetches every deleted object
+    # to send signals
+    cursor.execute(
+        'DELETE FROM {} WHERE date = %s'.format(
+            PricingObjectServiceChange._meta.db_table,
+        ),
+        [date],
+    )
+    cursor.execute(
+        """
+        INSERT INTO {changes} (
+            date, pricing_object_id, previous_service_environment_id,
+            service_environment_id
+        )
+        SELECT
+            dpo.date, dpo.pricing_object_id,
+            previous_dpo.service_environment_id, dpo.service_environment_id
+        FROM {daily} AS dpo
+            JOIN {daily} AS previous_dpo
+            ON dpo.pricing_object_id = previous_dpo.pricing_object_id
+        WHERE dpo.date = %s
+            AND previous_dpo.date = %s
+            AND dpo.service_environment_id !=
+                previous_dpo.service_environment_id
+        """.format(
+            changes=PricingObjectServiceChange._meta.db_table,
+            daily=DailyPricingObject._meta.db_table,
+        ),
+        [date, date - datetime.timedelta(days=1)],
+    )
+    return cursor.rowcount
+
+
+@transaction.commit_on_success
+def update_service_changes(date):
+    """
+    Rebuild log of services changes of pricing objects at date and the next
+    day (daily pricing objects of date are compared with previous and with
+    the next day).
+    """
+    cursor = connection.cursor()
+    count = 0
+    for day in (date, date + datetime.timedelta(days=1)):
+        count += _update_day(cursor, day)
+    logger.info('{} pricing objects services changes logged'.format(count))
+    return count
@@ -32,6 +32,9 @@ class WorkerJob(object):
     cache_timeout = 60 * 60  # 1 hour for result of work in progress
     cache_final_result_timeout = 60 * 10  # 10 minutes for final result
     progress_update = 5  # update cache every 5% of progress
+    # if True, failed job is stored in cache (as finished, without result)
+    # instead of being removed (and queued again on next call)
+    keep_failed_result = False
     _return_job_meta = False  # if True return job metadata in _worker_func too
 
     @classmethod
@@ -64,7 +67,14 @@ class WorkerJob(object):
                 elif job.is_failed:
                     data = None
                     progress = 100
-                    cache.delete(key)
+                    if self.keep_failed_result:
+                        cache.set(
+                            key,
+                            (progress, job_id, data),
+                            timeout=self.cache_final_result_timeout,
+                        )
+                    else:
+                        cache.delete(key)
         else:
             queue = django_rq.get_queue(self.queue_name)
             job = queue.enqueue_call(
@@ -99,25 +109,55 @@ class WorkerJob(object):
             job_id = None
 
         last_progress = 0
-        data = None
+        data = partial_result = None
         for progress, data in cls.run(**kwargs):
             if (
                 job_id is not None and
+                progress < 100 and
                 progress - last_progress > cls.progress_update
             ):
                 # Update cache when progress incremented by cls.progress_update
-                # or every time when cls.progress_update is None
+                # or every time when cls.progress_update is None (final result
+                # is stored below - it could be produced lazily, so it's
+                # consumed only once)
+                previous_result = partial_result
+                partial_result = cls._get_partial_result(data)
                 cache.set(
                     key,
-                    (progress, job_id, data),
+                    (progress, job_id, partial_result),
                     timeout=cls.cache_timeout,
                 )
+                cls._delete_partial_result(previous_result)
                 last_progress = progress
+        data = cls._save_result(data)
         cache.set(
             key,
             (progress, job_id, data),
             timeout=cls.cache_final_result_timeout,
         )
+        cls._delete_partial_result(partial_result)
+        return data
+
+    @classmethod
+    def _get_partial_result(cls, data):
+        """
+        Returns result of work in progress to store in cache.
+        """
+        return data
+
+    @classmethod
+    def _delete_partial_result(cls, partial_result):
+        """
+        Called when partial result is replaced by newer one (or final
+        result).
+        """
+        pass
+
+    @classmethod
+    def _save_result(cls, data):
+        """
+        Returns final result of work to store in cache (and as job result).
+        """
         return data
 
     @classmethod
@@ -5,18 +5,32 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import csv
+import cStringIO
 import itertools
+import json
 import logging
 
 from bob.csvutil import make_csv_response
 from django.conf import settings
 from django.contrib import messages
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.encoding import force_unicode
+from django.utils.functional import Promise
 from django.utils.translation import ugettext_lazy as _
 
+from ralph_scrooge.utils.report_storage import (
+    ChunkedReport,
+    ReportBlockMissingError,
+)
 from ralph_scrooge.views.base import Base
 
 logger = logging.getLogger(__name__)
 
+# formats of report export (any other format falls back to HTML report)
+EXPORT_FORMATS = ('csv', 'json')
+
 
 def currency(value):
     """Formats currency as string according to the settings."""
@@ -47,6 +61,60 @@ def format_csv_header(header):
     return result
 
 
+def _iter_csv(rows):
+    """
+    Format rows as CSV (encoded in UTF-8) row by row.
+    """
+    output = cStringIO.StringIO()
+    writer = csv.writer(output)
+    for row in rows:
+        writer.writerow([
+            ('' if value is None else unicode(value)).encode('utf-8')
+            for value in row
+        ])
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+
+
+class ReportJSONEncoder(DjangoJSONEncoder):
+    """
+    JSON encoder which handles lazy translation strings (ex. in header).
+    """
+    def default(self, o):
+        if isinstance(o, Promise):
+            return force_unicode(o)
+        return super(ReportJSONEncoder, self).default(o)
+
+
+def _iter_json(header, rows):
+    """
+    Format report as JSON object (with header and data) row by row.
+    """
+    yield '{{"header": {}, "data": ['.format(
+        json.dumps(header, cls=ReportJSONEncoder),
+    )
+    for i, row in enumerate(rows):
+        yield '{}{}'.format(
+            ', ' if i else '',
+            json.dumps(row, cls=ReportJSONEncoder),
+        )
+    yield ']}'
+
+
+def make_streaming_response(content, content_type, filename):
+    """
+    Returns response, which content is generated lazily (Django 1.4 streams
+    content of HttpResponse created from iterator, as long as no middleware
+    accesses it).
+    """
+    response = HttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename={}'.format(
+        filename,
+    )
+    return response
+
+
 class BaseReport(Base):
     """
     A base class for the reports. Override ``template_name``, ``Form``,
@@ -72,6 +140,7 @@ class BaseReport(Base):
         self.form = None
         self.progress = 0
         self.got_query = False
+        self.chunked_report = None
 
     def get(self, *args, **kwargs):
         get = self.request.GET
@@ -92,19 +161,44 @@ class BaseReport(Base):
                 self.progress, result = self.run_on_worker(
                     **self.form.cleaned_data
                 )
-                if result:
+                if isinstance(result, ChunkedReport):
+                    self.chunked_report = result
+                    self.header = result.header
+                    self._format_header()
+                elif result:
                     self.header, self.data = result
                     self._format_header()
 
                 self.progress = round(self.progress, 0)
                 if self.progress == 100:
-                    if get.get('format', '').lower() == 'csv':
+                    export_format = get.get('format', '').lower()
+                    if export_format not in EXPORT_FORMATS:
+                        export_format = None
+                    if self.chunked_report and export_format:
+                        # check blocks before response is started (they
+                        # could expire before whole report is sent anyway)
+                        if not self.chunked_report.exists():
+                            return self._report_expired(*args, **kwargs)
+                        return self._get_streaming_response(export_format)
+                    if export_format == 'csv':
                         self.header = format_csv_header(self.header)
                         return make_csv_response(
                             itertools.chain(self.header, self.data),
                             '{}.csv'.format(self.section),
                         )
+                    if self.chunked_report:
+                        try:
+                            self.data = list(self.chunked_report.iter_rows())
+                        except ReportBlockMissingError:
+                            return self._report_expired(*args, **kwargs)
                 else:
+                    if self.chunked_report:
+                        # partial report (it could be replaced by newer one
+                        # in the meantime)
+                        try:
+                            self.data = list(self.chunked_report.iter_rows())
+                        except ReportBlockMissingError:
+                            self.data = []
                     messages.warning(
                         self.request,
                         _("Please wait for the report "
@@ -112,6 +206,34 @@ class BaseReport(Base):
                     )
         return super(BaseReport, self).get(*args, **kwargs)
 
+    def _get_streaming_response(self, export_format):
+        """
+        Returns CSV or JSON export of chunked report. Rows are read from
+        cache block by block during sending response.
+        """
+        rows = self.chunked_report.iter_rows()
+        if export_format == 'json':
+            return make_streaming_response(
+                _iter_json(self.header, rows),
+                'application/json',
+                '{}.json'.format(self.section),
+            )
+        return make_streaming_response(
+            _iter_csv(itertools.chain(format_csv_header(self.header), rows)),
+            'text/csv',
+            '{}.csv'.format(self.section),
+        )
+
+    def _report_expired(self, *args, **kwargs):
+        self.progress = 0
+        self.got_query = False
+        self._clear_cache(**self.form.cleaned_data)
+        messages.warning(
+            self.request,
+            _("Report expired. Please generate it again."),
+        )
+        return super(BaseReport, self).get(*args, **kwargs)
+
     def get_context_data(self, **kwargs):
         context = super(BaseReport, self).get_context_data(**kwargs)
         context.update({
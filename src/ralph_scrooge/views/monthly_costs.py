@@ -5,6 +5,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import datetime
 import logging
 import time
 from dateutil import rrule
@@ -19,6 +20,7 @@ from rq import get_current_job
 from ralph_scrooge.plugins.cost.collector import Collector
 from ralph_scrooge.views.base import Base
 from ralph_scrooge.utils.common import get_cache_name, get_queue_name
+from ralph_scrooge.utils import monthly_costs
 from ralph_scrooge.utils.worker_job import WorkerJob, _get_cache_key
 from ralph_scrooge.forms import MonthlyCostsForm
 from ralph_scrooge.models import CostDateStatus
@@ -94,7 +96,7 @@ class MonthlyCosts(WorkerJob, Base):
         })
         return context
 
-    def accept_costs(self, start, end, forecast):
+    def accept_costs(self, start, end, forecast, **kwargs):
         calculated_costs = CostDateStatus.objects.filter(
             date__gte=start,
             date__lte=end,
@@ -106,9 +108,7 @@ class MonthlyCosts(WorkerJob, Base):
                 "Costs were not calculated for all selected days!"
             ))
         else:
-            calculated_costs.update(**{
-                'forecast_accepted' if forecast else 'accepted': True,
-            })
+            monthly_costs.accept_costs(start, end, forecast)
             messages.success(self.request, _(
                 "Costs were accepted!"
             ))
@@ -144,9 +144,11 @@ class MonthlyCosts(WorkerJob, Base):
         self._clear_cache(start=start, end=end, **kwargs)
 
     @classmethod
-    def _check_subjobs(cls, statuses, start, end, **kwargs):
+    def _check_subjobs(cls, statuses, start, end, forecast, **kwargs):
         """
-        Check subjobs (jobs for single day) statuses.
+        Check subjobs (jobs for single day) statuses. Costs of every finished
+        day are saved immediately (so only costs of single day are kept in
+        memory).
 
         :param statuses: shared dict with statuses (True/False) for each day
             between start and end.
@@ -159,59 +161,72 @@ class MonthlyCosts(WorkerJob, Base):
         days = (end - start).days + 1
         step = 100.0 / days
         total_progress = 0
-        results = {}
         for day in rrule.rrule(rrule.DAILY, dtstart=start, until=end):
             # if day is in statuses, it was already calculated - do not check
             # it again
             if day in statuses:
                 continue
             dcj = DailyCostsJob()
-            progress, success, result = dcj.run_on_worker(day=day, **kwargs)
+            progress, success, result = dcj.run_on_worker(
+                day=day,
+                forecast=forecast,
+                **kwargs
+            )
             if progress == 100:
                 total_progress += step
                 statuses[day] = success
-            if result:
-                results[day] = result['collector_result']
+                # keep previous costs (and registered changes of costs inputs)
+                # if incremental recalculation failed
+                if not success and kwargs.get('incremental'):
+                    continue
+                result = result or {}
+                cls._save_costs(
+                    result.get('collector_result', {}),
+                    day,
+                    forecast,
+                    types=result.get('collector_types'),
+                    changed_before=result.get('started'),
+                )
         # clear cache if all done
         if len(statuses) == days:
-            cls.forget_cache(start, end, **kwargs)
+            cls.forget_cache(start, end, forecast=forecast, **kwargs)
             total_progress = 100
-        return total_progress, statuses, results
+        return total_progress, statuses
 
     @classmethod
     @transaction.commit_on_success
-    def _save_costs(self, data, start, end, forecast):
-        """
-        Save costs between start and end.
-
-        :param data: list of DailyCost instances
-        :type data: list
-        :param start: start date
-        :type start: datetime.date
-        :param end: end date
-        :type end: datetime.date
-        :param forecast: True, if forecast costs
-        :type forecast: bool
+    def _save_costs(
+        self,
+        data,
+        date,
+        forecast,
+        types=None,
+        changed_before=None,
+    ):
         """
-        collector = Collector()
-        collector.save_period_costs(start, end, forecast, data)
-
-    @classmethod
-    def _process_daily_result(self, data, date, forecast):
-        """
-        Process results from subtask jobs (single day) - create daily costs
-        instances.
+        Save costs for single day.
 
         :param data: costs per service environments
         :type data: dict of lists (key: service environment id, value: list of
             costs of service environment)
-        :param date: date for which process daily results
+        :param date: date for which save costs
         :type date: datetime.date
         :param forecast: True, if forecast costs
         :type forecast: bool
+        :param types: types of recalculated costs (None, if all costs were
+            recalculated)
+        :type types: list
+        :param changed_before: time of start of costs calculation
+        :type changed_before: datetime.datetime
         """
         collector = Collector()
-        return collector._create_daily_costs(date, data, forecast)
+        collector.save_daily_costs(
+            date,
+            forecast,
+            data,
+            types=types,
+            changed_before=changed_before,
+        )
 
     @classmethod
     def run(cls, start, end, forecast=False, **kwargs):
@@ -219,32 +234,22 @@ class MonthlyCosts(WorkerJob, Base):
         Run collecting costs between start and end.
 
         It's running as "master" worker, which delegate jobs for single date to
-        subtask workers, collects results from them and process them and at the
-        end it saves all costs to the database.
+        subtask workers, collects results from them and saves costs of every
+        day to the database as soon as it's calculated.
         """
         progress = 0
         statuses = {}
-        processed_results = []  # list of DailyCost instances for whole period
         while progress < 100:
-            progress, statuses, results = cls._check_subjobs(
+            progress, statuses = cls._check_subjobs(
                 statuses,
                 start=start,
                 end=end,
                 forecast=forecast,
                 **kwargs
             )
-            if results:
-                for day, day_results in results.iteritems():
-                    processed_results.extend(cls._process_daily_result(
-                        day_results,
-                        day,
-                        forecast,
-                    ))
             if progress < 100:
                 yield progress, statuses
                 time.sleep(settings.SCROOGE_COSTS_MASTER_SLEEP)
-        # save all costs
-        cls._save_costs(processed_results, start, end, forecast)
         yield 100, statuses
 
 
@@ -260,14 +265,20 @@ class DailyCostsJob(WorkerJob):
     _return_job_meta = True
 
     @classmethod
-    def run(cls, day, forecast):
+    def run(cls, day, forecast, incremental=False):
         """
-        Run collecting costs for one day.
+        Run collecting costs for one day. If incremental is True, only costs
+        affected by changes of costs inputs are collected.
         """
         collector = Collector()
         result = {}
+        types = None
+        started = datetime.datetime.now()
         try:
-            result = collector.process(day, forecast)
+            if incremental:
+                result, types = collector.process_incremental(day, forecast)
+            else:
+                result = collector.process(day, forecast)
             success = True
         except Exception as e:
             logger.exception(e)
@@ -275,5 +286,7 @@ class DailyCostsJob(WorkerJob):
         job = get_current_job()
         # save result to job meta to keep log clean
         job.meta['collector_result'] = result
+        job.meta['collector_types'] = types
+        job.meta['started'] = started
         job.save()
         yield 100, success